@@ -1,138 +1,182 @@
-import os
-import tkinter
-from collections import Counter
-from math import log, sqrt, ceil
-from pathlib import Path
-
-from resampling_methods import Methods
-
-
-class AdaptiveResampling:
-
-    def __init__(self, train_file_path: str, resampling_directory: str, sep="\t"):
-        """
-        This will create an Adaptive Resampler following the original implementation in
-        https://github.com/XiaoChen-W/NER_Adaptive_Resampling.
-        :param train_file_path: The input NER dataset file to be resampled
-        :param resampling_directory: Output folder where the resampled files will be written.
-        """
-
-        self.train_file_path = train_file_path
-        self.resampling_directory = resampling_directory
-        Path(resampling_directory).mkdir(parents=True, exist_ok=True)
-        self.sep = sep
-        
-    def _extract_sentences(self, file_path):
-        lines = []
-        current_line = ""
-
-        with open(file_path, 'r') as file:
-            for line in file:
-                if line.strip() == "":
-                    if current_line:
-                        lines.append(current_line.strip())
-                        current_line = ""
-                else:
-                    current_line += line
-
-            if current_line:
-                lines.append(current_line.strip())
-
-        return lines
-
-    def _extract_element(self, sentence: str, position: int) -> list[str]:
-        """
-        This method parses a sentences according to the separator specified when instantiating this class.
-        The element can be either a token (pos = 0) or a tag (pos = -1). However, this may vary depending on the
-        dataset used.
-        :param sentence: sentence to be parsed.
-        :param position: position of the element to be extracted.
-        :return: A list of the extracted elements.
-        """
-        elements = []
-        for token_with_label in sentence.split('\n'):
-            token = token_with_label.split(self.sep)[position]
-            elements.append(token)
-        return elements
-
-    def _parse_dataset(self) -> (list[str], list[str]):
-        """
-        This method will parse the dataset and return the tokens with their corresponding tags.
-        The parsing will be done according to the separator specified when instantiating the resampling class.
-        :return: tagged tokens: tuple
-        """
-        lines = self._extract_sentences(self.train_file_path)
-        tokens = list()
-        tags = list()
-        for line in lines:
-            tokens.append(self._extract_element(line, 0))
-            tags.append(self._extract_element(line, -1))
-
-        return tokens, tags
-
-    def compute_statistics(self):
-        """
-        Compute dataset statistics: class distributions.
-        The "O" (Other) type tokens are ignored.
-        :return: Entity proportions: dict
-        """
-        # Get stats of the class distribution of the dataset
-        labels = list(tkinter._flatten(self._parse_dataset()[-1]))
-        num_tokens = len(labels)
-        ent = [label[2:] for label in labels if label != 'O']
-        count_ent = Counter(ent)
-        for key in count_ent:
-            # Use frequency instead of count
-            count_ent[key] = count_ent[key] / num_tokens
-        return count_ent
-
-    def resample(self, method: Methods):
-        """
-        Select method by setting hyperparameters listed below:
-
-        - sc: the smoothed resampling incorporating count
-        - sCR: the smoothed resampling incorporating Count & Rareness
-        - sCRD: the smoothed resampling incorporating Count, Rareness, and Density
-        - nsCRD: the normalized and smoothed  resampling  incorporating Count, Rareness, and Density
-        :param method: Resampling method as described.
-        :return: None
-        """
-
-        if method not in Methods:
-            raise ValueError("Unidentified Resampling Method")
-
-        filename = os.path.join(self.resampling_directory, f"{method}.txt")
-        output = open(filename, 'w', encoding='utf-8')
-        tokens, tags = self._parse_dataset()
-        stats = self.compute_statistics()
-
-        for sen in range(len(tokens)):
-            # Resampling time can at least be 1, which means sentence without 
-            # entity will be reserved in the dataset  
-            rsp_time = 1
-            sen_len = len(tags[sen])
-            entities = Counter([label[2:] for label in tags[sen] if label != 'O'])
-            # Pass if there's no entity in a sentence
-            if entities:
-                for ent in entities.keys():
-                    # Resampling method selection and resampling time calculation, 
-                    # see section 'Resampling Functions' in our paper for details.
-                    if method == Methods.sC:
-                        rsp_time += entities[ent]
-                    if method == Methods.sCR or method == Methods.sCRD:
-                        weight = -log(stats[ent], 2)
-                        rsp_time += entities[ent] * weight
-                    if method == Methods.nsCRD:
-                        weight = -log(stats[ent], 2)
-                        rsp_time += sqrt(entities[ent]) * weight
-                if method == Methods.sCR:
-                    rsp_time = sqrt(rsp_time)
-                if method == Methods.sCRD or method == Methods.nsCRD:
-                    rsp_time = rsp_time / sqrt(sen_len)
-                # Ceiling to ensure the integrity of resampling time
-                rsp_time = ceil(rsp_time)
-            for _ in range(rsp_time):
-                for token in range(sen_len):
-                    output.write(tokens[sen][token] + self.sep + tags[sen][token] + '\n')
-                output.write('\n')
-        output.close()
+import json
+import os
+import sys
+from array import array
+from collections import Counter
+from math import log
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+from resampling_methods import Methods
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from iob_corpus import IOBCorpus  # noqa: E402
+
+
+class AdaptiveResampling:
+
+    def __init__(self, train_file_path: str, resampling_directory: str, sep="\t"):
+        """
+        This will create an Adaptive Resampler following the original implementation in
+        https://github.com/XiaoChen-W/NER_Adaptive_Resampling.
+        :param train_file_path: The input NER dataset file to be resampled
+        :param resampling_directory: Output folder where the resampled files will be written.
+        """
+
+        self.train_file_path = train_file_path
+        self.resampling_directory = resampling_directory
+        Path(resampling_directory).mkdir(parents=True, exist_ok=True)
+        self.sep = sep
+        self._counts = None
+
+    def _parse_dataset(self) -> dict:
+        """
+        This method will parse the dataset once and keep, as NumPy arrays, the length of every sentence and the
+        number of tokens of every entity type in every sentence. The text itself is not kept, so the memory only grows
+        with the number of sentences and of (sentence, entity type) pairs.
+        The parsing will be done according to the separator specified when instantiating the resampling class.
+        :return: the counts of the dataset: dict
+        """
+        if self._counts is not None:
+            return self._counts
+
+        entity_types = dict()
+        type_token_counts = array("q")
+        sentence_lengths = array("q")
+        # (sentence, entity type, token count) entries, in the order the types appear in each sentence. Each sentence
+        # with entities starts with a (sentence, -1, 0) entry standing for the initial resampling time of 1.
+        entry_sentences = array("q")
+        entry_types = array("q")
+        entry_counts = array("q")
+
+        with IOBCorpus(self.train_file_path, sep=self.sep) as corpus:
+            for sentence_index, rows in enumerate(corpus):
+                sentence_lengths.append(len(rows))
+                entities = Counter([row[-1][2:] for row in rows if row[-1] != 'O'])
+                if entities:
+                    entry_sentences.append(sentence_index)
+                    entry_types.append(-1)
+                    entry_counts.append(0)
+                for ent, count in entities.items():
+                    if ent not in entity_types:
+                        entity_types[ent] = len(entity_types)
+                        type_token_counts.append(0)
+                    type_token_counts[entity_types[ent]] += count
+                    entry_sentences.append(sentence_index)
+                    entry_types.append(entity_types[ent])
+                    entry_counts.append(count)
+
+        self._counts = {
+            "entity_types": list(entity_types),
+            "type_token_counts": np.frombuffer(type_token_counts, dtype=np.int64),
+            "sentence_lengths": np.frombuffer(sentence_lengths, dtype=np.int64),
+            "entry_sentences": np.frombuffer(entry_sentences, dtype=np.int64),
+            "entry_types": np.frombuffer(entry_types, dtype=np.int64),
+            "entry_counts": np.frombuffer(entry_counts, dtype=np.int64),
+        }
+        return self._counts
+
+    def compute_statistics(self):
+        """
+        Compute dataset statistics: class distributions.
+        The "O" (Other) type tokens are ignored.
+        :return: Entity proportions: dict
+        """
+        counts = self._parse_dataset()
+        num_tokens = int(counts["sentence_lengths"].sum())
+        count_ent = Counter()
+        for ent, count in zip(counts["entity_types"], counts["type_token_counts"].tolist()):
+            # Use frequency instead of count
+            count_ent[ent] = count / num_tokens
+        return count_ent
+
+    def compute_resampling_times(self, methods: Iterable[Methods] = Methods) -> dict:
+        """
+        Computes how many times every sentence is repeated by each method, for all the sentences at once.
+        See section 'Resampling Functions' in our paper for details.
+        :param methods: Resampling methods, as described in resample.
+        :return: the resampling time of every sentence, as an array, for each method: dict
+        """
+        counts = self._parse_dataset()
+        stats = self.compute_statistics()
+        sentence_lengths = counts["sentence_lengths"]
+        entry_sentences = counts["entry_sentences"]
+        entry_counts = counts["entry_counts"].astype(np.float64)
+        is_initial = counts["entry_types"] < 0
+
+        has_entities = np.zeros(len(sentence_lengths), dtype=bool)
+        has_entities[entry_sentences] = True
+
+        weights = np.array([-log(stats[ent], 2) for ent in counts["entity_types"]] + [0.0], dtype=np.float64)
+        entry_weights = weights[counts["entry_types"]]
+
+        def accumulate(values: np.ndarray) -> np.ndarray:
+            # Resampling time can at least be 1, which means sentence without entity will be reserved in the dataset.
+            # The terms are summed sentence by sentence in the order of the entries, starting with the 1.
+            return np.bincount(entry_sentences, weights=np.where(is_initial, 1.0, values),
+                               minlength=len(sentence_lengths))
+
+        resampling_times = dict()
+        for method in methods:
+            if method not in Methods:
+                raise ValueError("Unidentified Resampling Method")
+            if method == Methods.sC:
+                rsp_time = accumulate(entry_counts)
+            if method == Methods.sCR or method == Methods.sCRD:
+                rsp_time = accumulate(entry_counts * entry_weights)
+            if method == Methods.nsCRD:
+                rsp_time = accumulate(np.sqrt(entry_counts) * entry_weights)
+            if method == Methods.sCR:
+                rsp_time = np.sqrt(rsp_time)
+            if method == Methods.sCRD or method == Methods.nsCRD:
+                rsp_time = rsp_time / np.sqrt(sentence_lengths)
+            # Ceiling to ensure the integrity of resampling time
+            resampling_times[method] = np.where(has_entities, np.ceil(rsp_time), 1).astype(np.int64)
+
+        return resampling_times
+
+    def save_resampling_times(self, methods: Iterable[Methods] = Methods):
+        """
+        Writes, for each method, the resampling time of every sentence as a JSON list, in the order of the sentences of
+        the dataset. Given to the trainers of the models with the converted dataset, it replaces the resampled files:
+        every sentence is then converted and tokenized only once.
+        :param methods: Resampling methods, all of them by default.
+        :return: None
+        """
+        for method, rsp_times in self.compute_resampling_times(methods).items():
+            with open(os.path.join(self.resampling_directory, f"{method}_times.json"), 'w') as f:
+                json.dump(rsp_times.tolist(), f)
+
+    def resample(self, method: Methods):
+        """
+        Select method by setting hyperparameters listed below:
+
+        - sc: the smoothed resampling incorporating count
+        - sCR: the smoothed resampling incorporating Count & Rareness
+        - sCRD: the smoothed resampling incorporating Count, Rareness, and Density
+        - nsCRD: the normalized and smoothed  resampling  incorporating Count, Rareness, and Density
+        :param method: Resampling method as described.
+        :return: None
+        """
+        self.resample_all([method])
+
+    def resample_all(self, methods: Iterable[Methods] = Methods):
+        """
+        Writes the resampled dataset of every method in a single pass over the dataset. See resample for the methods.
+        :param methods: Resampling methods, all of them by default.
+        :return: None
+        """
+        resampling_times = self.compute_resampling_times(methods)
+        outputs = {method: open(os.path.join(self.resampling_directory, f"{method}.txt"), 'w', encoding='utf-8')
+                   for method in resampling_times}
+
+        with IOBCorpus(self.train_file_path, sep=self.sep) as corpus:
+            for sen, rows in enumerate(corpus):
+                sentence = "".join(row[0] + self.sep + row[-1] + '\n' for row in rows) + '\n'
+                for method, output in outputs.items():
+                    output.write(sentence * int(resampling_times[method][sen]))
+
+        for output in outputs.values():
+            output.close()
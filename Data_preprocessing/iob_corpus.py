@@ -0,0 +1,152 @@
+import mmap
+import re
+from array import array
+from pathlib import Path
+
+_VISIBLE_ASCII = re.compile(rb"[!-~]")
+
+
+class IOBCorpus:
+
+    def __init__(self, file_path: Path, sep: str = "\t", encoding: str = "utf-8"):
+        """
+        Read-only, memory-mapped view over an IOB file where sentences are separated by blank lines.
+        The file is scanned once to build an index of the byte offsets of every sentence, a sentence is then only
+        decoded when it is accessed. The sentences are the same as the ones built line by line by the preprocessing
+        scripts.
+        :param file_path: the path of the IOB file
+        :param sep: the separator between the columns of a line
+        :param encoding: the encoding of the file
+        """
+        self.file_path = file_path
+        self.sep = sep
+        self.encoding = encoding
+        # index of the first sentence in the whole file, for selections
+        self.offset = 0
+        self._open()
+        self._starts, self._ends = self._build_index()
+
+    def _open(self):
+        self._file = open(self.file_path, "rb")
+        self._owns_buffer = True
+        try:
+            self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            self._buffer = b""
+
+    def _is_blank(self, line: bytes) -> bool:
+        stripped = line.strip()
+        if not stripped:
+            return True
+        if stripped.isascii() or _VISIBLE_ASCII.search(stripped):
+            return False
+        # lines made of non-ASCII whitespace only, e.g. no-break spaces
+        return not line.decode(self.encoding).strip()
+
+    def _build_index(self) -> (array, array):
+        """
+        Builds the byte offsets of the sentences: a sentence starts at its first non-blank line and ends with its last
+        non-blank line.
+        :return: the start and end offsets of each sentence
+        """
+        starts = array("q")
+        ends = array("q")
+        start = None
+        end = None
+        position = 0
+        size = len(self._buffer)
+
+        while position < size:
+            newline = self._buffer.find(b"\n", position)
+            line_end = size if newline == -1 else newline + 1
+            if self._is_blank(self._buffer[position:line_end]):
+                if start is not None:
+                    starts.append(start)
+                    ends.append(end)
+                    start = None
+            else:
+                if start is None:
+                    start = position
+                end = line_end
+            position = line_end
+
+        if start is not None:
+            starts.append(start)
+            ends.append(end)
+
+        return starts, ends
+
+    def select(self, start: int, stop: int) -> "IOBCorpus":
+        """
+        Creates a corpus made of a range of the sentences of this one, sharing the same mapping.
+        Only the offsets of the range are copied, which makes the selection cheap to send to another process, where
+        the file is mapped again.
+        :param start: index of the first sentence
+        :param stop: index after the last sentence
+        :return: the selected corpus
+        """
+        corpus = IOBCorpus.__new__(IOBCorpus)
+        corpus.__dict__.update(self.__dict__, _starts=self._starts[start:stop], _ends=self._ends[start:stop],
+                               _owns_buffer=False, offset=self.offset + start)
+        return corpus
+
+    def view(self, index: int) -> memoryview:
+        """
+        :param index: index of the sentence
+        :return: a zero-copy view over the raw bytes of the sentence
+        """
+        return memoryview(self._buffer)[self._starts[index]:self._ends[index]]
+
+    def text(self, index: int) -> str:
+        """
+        :param index: index of the sentence
+        :return: the sentence, one "<token><sep><tags>" line per token
+        """
+        text = self._buffer[self._starts[index]:self._ends[index]].decode(self.encoding)
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        return text.strip()
+
+    def column(self, index: int, position: int) -> list:
+        """
+        :param index: index of the sentence
+        :param position: position of the column, 0 for the tokens and -1 for the tags in most datasets
+        :return: the elements of the column for every token of the sentence
+        """
+        return [row[position] for row in self[index]]
+
+    def close(self):
+        if not self._owns_buffer:
+            return
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._file.close()
+
+    def __getitem__(self, index: int) -> list:
+        """
+        :param index: index of the sentence
+        :return: the rows of the sentence, a row being the list of the columns of one token
+        """
+        return [line.split(self.sep) for line in self.text(index).split("\n")]
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __getstate__(self):
+        return {"file_path": self.file_path, "sep": self.sep, "encoding": self.encoding, "offset": self.offset,
+                "_starts": self._starts, "_ends": self._ends}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
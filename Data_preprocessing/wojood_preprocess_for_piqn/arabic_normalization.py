@@ -0,0 +1,111 @@
+import json
+import os
+from collections import Counter
+from pathlib import Path
+
+from loguru import logger
+
+from utils import iter_documents
+
+# tatweel and harakat, removed
+REMOVED_CHARACTERS = frozenset("\u0640\u064b\u064c\u064d\u064e\u064f\u0650\u0651\u0652\u0670")
+# alef, alef maqsura and ta marbuta variants, replaced one for one
+CHARACTER_MAP = {"\u0623": "\u0627", "\u0625": "\u0627", "\u0622": "\u0627", "\u0671": "\u0627",
+                 "\u0649": "\u064a", "\u0629": "\u0647"}
+
+
+def normalize_word(word: str) -> (str, list):
+    """
+    Normalizes an Arabic word: removes the diacritics and the tatweel, and unifies the alef, alef maqsura and ta marbuta
+    variants. A word made only of removed characters is kept as is.
+    :param word: the word to normalize
+    :return: the normalized word and, for each of its characters, the index of the character of the word it comes from
+    """
+    characters = []
+    offsets = []
+    for index, character in enumerate(word):
+        if character not in REMOVED_CHARACTERS:
+            characters.append(CHARACTER_MAP.get(character, character))
+            offsets.append(index)
+    if not characters:
+        return word, list(range(len(word)))
+    return "".join(characters), offsets
+
+
+def normalize_json_line(json_line: dict) -> dict:
+    """
+    Normalizes the tokens and the context of a json line of the manifest, see normalize_word. The tokens are normalized
+    one for one, so the entity spans do not change, and the entity texts are kept as they were. The changed tokens are
+    recorded in "normalization", as [token index, original token, offsets] entries, the offsets being the ones of
+    normalize_word, so that restore_tokens gives back the original tokens.
+    :param json_line: the json line to normalize, modified in place
+    :return: the json line
+    """
+    normalization = []
+    for index, token in enumerate(json_line["tokens"]):
+        normalized_token, offsets = normalize_word(token)
+        if normalized_token != token:
+            json_line["tokens"][index] = normalized_token
+            normalization.append([index, token, offsets])
+    for context in ["ltokens", "rtokens"]:
+        if context in json_line:
+            json_line[context] = [normalize_word(token)[0] for token in json_line[context]]
+    json_line["normalization"] = normalization
+    return json_line
+
+
+def restore_tokens(json_line: dict) -> list:
+    """
+    :param json_line: a json line normalized by normalize_json_line
+    :return: the original tokens of the json line
+    """
+    tokens = list(json_line["tokens"])
+    for index, token, _ in json_line.get("normalization", []):
+        tokens[index] = token
+    return tokens
+
+
+def write_normalization_report(file_path: Path, tokenizer_path: str = None) -> dict:
+    """
+    Compares the original and the normalized tokens of a normalized manifest, and writes the result to
+    "<manifest name>_normalization_report.json":
+    - the number of distinct words, and the hit rate of a cache of the subwords of every word, as the readers of the
+    models and pretokenize.py use, which is the share of the words already seen before them
+    - given a tokenizer, the average number of subwords per word and per sentence
+    :param file_path: the path of the JSON or JSONL manifest
+    :param tokenizer_path: the path or the name of the tokenizer of the model
+    :return: the report
+    """
+    tokenizer = None
+    if tokenizer_path is not None:
+        # transformers is only needed for the subword lengths
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+
+    word_counts = {"original": Counter(), "normalized": Counter()}
+    sentence_count = 0
+    changed_word_count = 0
+    for document in iter_documents(file_path):
+        sentence_count += 1
+        changed_word_count += len(document["normalization"])
+        word_counts["original"].update(restore_tokens(document))
+        word_counts["normalized"].update(document["tokens"])
+
+    report = {"sentence_count": sentence_count, "word_count": sum(word_counts["original"].values()),
+              "changed_word_count": changed_word_count}
+    for name, counts in word_counts.items():
+        word_count = sum(counts.values())
+        report[name] = {"distinct_word_count": len(counts),
+                        "cache_hit_rate": 1 - len(counts) / word_count if word_count else 0.0}
+        if tokenizer is not None:
+            subword_count = sum(len(tokenizer.encode(word, add_special_tokens=False)) * count
+                                for word, count in counts.items())
+            report[name]["subwords_per_word"] = subword_count / word_count if word_count else 0.0
+            report[name]["subwords_per_sentence"] = subword_count / sentence_count if sentence_count else 0.0
+
+    logger.info(f"Normalization of {file_path}: {report}")
+    report_path = os.path.join(os.path.dirname(file_path),
+                               os.path.splitext(os.path.basename(file_path))[0] + "_normalization_report.json")
+    with open(report_path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    return report
@@ -0,0 +1,88 @@
+import argparse
+import random
+import timeit
+
+from loguru import logger
+
+from utils import extract_spans_from_sentence
+
+ENTITY_TYPES = ["PERS", "ORG", "GPE", "LOC", "DATE", "NORP", "OCC", "EVENT"]
+
+
+def extract_spans_from_sentence_reference(sentence: str) -> list:
+    """
+    The previous list-based span extraction, kept as a reference for correctness and timing.
+    :param sentence: the input sentence
+    :return: the extracted spans
+    """
+    tokens_with_labels = sentence.split('\n')
+
+    intermediates = []
+    spans = []
+    completed_spans = []
+
+    for index in range(len(tokens_with_labels)):
+        token_with_label = tokens_with_labels[index]
+        labels = token_with_label.split("\t")[1].split(" ")
+
+        spans.extend([(tag, index, index + 1)
+                      for tag in labels if "B-" in tag])
+        intermediates.extend([(tag, index) for tag in labels if "I-" in tag])
+
+    for span in spans:
+        entity = span[0].split("B-")[-1]
+        index = span[2]
+        while ("I-" + entity, index) in intermediates:
+            span = (entity, span[1], index + 1)
+            index += 1
+
+        completed_spans.append(span)
+
+    return completed_spans
+
+
+def generate_sentence(length: int, max_depth: int, rng: random.Random) -> str:
+    """
+    Generates a random nested multi-label IOB sentence in the Wojood format.
+    :param length: the number of tokens of the sentence
+    :param max_depth: the maximum number of overlapping entities per token
+    :param rng: the random generator
+    :return: the generated sentence
+    """
+    labels = [[] for _ in range(length)]
+    for _ in range(length // 2):
+        start = rng.randrange(length)
+        end = min(length, start + rng.randint(1, 8))
+        if any(len(labels[i]) >= max_depth for i in range(start, end)):
+            continue
+        entity_type = rng.choice(ENTITY_TYPES)
+        labels[start].append("B-" + entity_type)
+        for i in range(start + 1, end):
+            labels[i].append("I-" + entity_type)
+
+    return "\n".join(f"token{i}\t{' '.join(tags) if tags else 'O'}" for i, tags in enumerate(labels))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lengths", "-l", type=int, nargs="+", default=[50, 200, 800, 1600])
+    parser.add_argument("--max-depth", "-d", type=int, default=4)
+    parser.add_argument("--repeat", "-r", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for length in args.lengths:
+        sentence = generate_sentence(length, args.max_depth, rng)
+        assert extract_spans_from_sentence(sentence) == extract_spans_from_sentence_reference(sentence)
+
+        reference_time = min(timeit.repeat(lambda: extract_spans_from_sentence_reference(sentence),
+                                           number=1, repeat=args.repeat))
+        decoder_time = min(timeit.repeat(lambda: extract_spans_from_sentence(sentence),
+                                         number=1, repeat=args.repeat))
+        logger.info(f"{length} tokens: reference {reference_time * 1000:.2f} ms, "
+                    f"decoder {decoder_time * 1000:.2f} ms, speedup x{reference_time / decoder_time:.1f}")
+
+
+if __name__ == "__main__":
+    main()
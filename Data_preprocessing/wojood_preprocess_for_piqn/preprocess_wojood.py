@@ -1,37 +1,36 @@
 import argparse
-import json
 import os
+from functools import partial
 from pathlib import Path
+from typing import Iterable, Iterator
 
 from loguru import logger
 from tqdm import tqdm
 
-from utils import extract_spans_from_sentence, create_entity_mentions, delete_if_exists, extract_sentences
+from arabic_normalization import normalize_json_line, write_normalization_report
+from utils import IOBCorpus, extract_spans_from_rows, create_entity_mentions, read_chunk, write_json_file, \
+    write_jsonl_file, convert_files_in_parallel, convert_file_incrementally
 
 
-def extract_tokens(sentence):
+def extract_tokens(sentence: list) -> list:
     """
         Extracts tokens from sentences.
-        :param sentence: the input sentence from which to extract the token.
+        :param sentence: the rows of the input sentence from which to extract the token.
         :return: the extracted tokens
         """
-    tokens = []
-    for token_with_label in sentence.split('\n'):
-        token = token_with_label.split("\t")[0]
-        tokens.append(token)
-    return tokens
+    return [token_with_label[0] for token_with_label in sentence]
 
 
-def create_one_line(sentence: str, ltokens: list, rtokens: list)->dict:
+def create_one_line(sentence: list, ltokens: list, rtokens: list)->dict:
     """
       Creates a single json line for the manifest file to be created.
-      :param sentence: the sentences from which to extract the tokens and the entities
+      :param sentence: the rows of the sentence from which to extract the tokens and the entities
       :param ltokens: left tokens
       :param rtokens: right tokens
       :return: the dict containing the needed data
       """
     json_line = dict()
-    completed_spans = extract_spans_from_sentence(sentence)
+    completed_spans = extract_spans_from_rows(sentence)
     tokens = extract_tokens(sentence)
     entity_mentions = create_entity_mentions(completed_spans, tokens)
     json_line["tokens"] = tokens
@@ -44,43 +43,133 @@ def create_one_line(sentence: str, ltokens: list, rtokens: list)->dict:
     return json_line
 
 
-def create_json_file(sentences: str, output_file_name: str, save_dir: Path):
+def create_sentence_line(sentence: list, position: int) -> dict:
+    """
+    Creates a single json line for a manifest where every sentence is stored once, without its context. The models
+    build the context from the neighbouring sentences of the same document when loading the manifest.
+    :param sentence: the rows of the sentence from which to extract the tokens and the entities
+    :param position: the position of the sentence in its document
+    :return: the dict containing the needed data
+    """
+    json_line = dict()
+    completed_spans = extract_spans_from_rows(sentence)
+    tokens = extract_tokens(sentence)
+    json_line["tokens"] = tokens
+    json_line["entities"] = create_entity_mentions(completed_spans, tokens)
+    # Wojood files are not split into documents, the file is a single document
+    json_line["org_id"] = "placeholder"
+    json_line["position"] = position
+    json_line["relations"] = []
+
+    return json_line
+
+
+def create_json_file(sentences: IOBCorpus, output_file_name: str, save_dir: Path, with_context: bool = True,
+                     normalize: bool = False):
     """
     Generates a JSON file compatible with PIQN.
     :param sentences: the sentences from which to extract the tokens and the entities
     :param output_file_name: the output file name
     :param save_dir: the directory where to save the generates files
+    :param with_context: if False, the sentences are written without their context, see create_sentence_line
+    :param normalize: if True, the Arabic tokens are normalized, see arabic_normalization.normalize_json_line
     """
-    json_filename = output_file_name + ".json"
-    json_file_path = os.path.join(save_dir, json_filename)
-    delete_if_exists(json_file_path)
-    contents = []
+    json_lines = iter_json_lines(sentences) if with_context else iter_sentence_lines(sentences)
+    if normalize:
+        json_lines = map(normalize_json_line, json_lines)
+    write_json_file(tqdm(json_lines, total=len(sentences)), output_file_name, save_dir)
 
-    for i in tqdm(range(len(sentences))):
-        if i < len(sentences) - 1:
-            rtokens = extract_tokens(sentences[i + 1])
-        else:
-            rtokens = []
-        if i > 0:
-            ltokens = extract_tokens(sentences[i - 1])
-        else:
-            ltokens = []
-        contents.append(create_one_line(sentences[i], ltokens, rtokens))
 
-    with open(json_file_path, 'w', encoding='utf-8') as file:
-        json.dump(contents, file, ensure_ascii=False)
+def iter_json_lines(sentences: Iterable[list], previous_sentence: list = None, next_sentence: list = None) \
+        -> Iterator[dict]:
+    """
+    Lazily generates the json lines of the manifest. Only the previous, the current and the next sentences are kept in
+    memory at any time.
+    :param sentences: an iterable over the rows of the sentences from which to extract the tokens and the entities
+    :param previous_sentence: the sentence preceding the first one, if any
+    :param next_sentence: the sentence following the last one, if any
+    :return: a generator over the dicts containing the needed data
+    """
+    ltokens = extract_tokens(previous_sentence) if previous_sentence is not None else []
+    current_sentence = None
+    current_tokens = []
+
+    for sentence in sentences:
+        tokens = extract_tokens(sentence)
+        if current_sentence is not None:
+            yield create_one_line(current_sentence, ltokens, tokens)
+            ltokens = current_tokens
+        current_sentence = sentence
+        current_tokens = tokens
 
+    if current_sentence is not None:
+        rtokens = extract_tokens(next_sentence) if next_sentence is not None else []
+        yield create_one_line(current_sentence, ltokens, rtokens)
 
-def preprocess_file(file_path: str, output_file_name: str, save_dir: Path) -> None:
+
+def iter_sentence_lines(sentences: Iterable[list], first_position: int = 0) -> Iterator[dict]:
+    """
+    Lazily generates the json lines of a manifest where every sentence is stored once, without its context.
+    :param sentences: an iterable over the rows of the sentences from which to extract the tokens and the entities
+    :param first_position: the position of the first sentence in the file
+    :return: a generator over the dicts containing the needed data
+    """
+    for position, sentence in enumerate(sentences, first_position):
+        yield create_sentence_line(sentence, position)
+
+
+def convert_chunk(chunk: tuple, with_context: bool = True, normalize: bool = False) -> list:
+    """
+    Converts a chunk of consecutive sentences. Used by the worker processes.
+    :param chunk: a chunk as produced by utils.iter_chunks
+    :param with_context: if False, the sentences are written without their context, see create_sentence_line
+    :param normalize: if True, the Arabic tokens are normalized, see arabic_normalization.normalize_json_line
+    :return: the dicts containing the needed data, in order
+    """
+    previous_sentence, sentences, next_sentence = read_chunk(chunk)
+    if not with_context:
+        corpus, start, _ = chunk
+        json_lines = iter_sentence_lines(sentences, corpus.offset + start)
+    else:
+        json_lines = iter_json_lines(sentences, previous_sentence, next_sentence)
+    if normalize:
+        json_lines = map(normalize_json_line, json_lines)
+    return list(json_lines)
+
+
+def create_jsonl_file(sentences: IOBCorpus, output_file_name: str, save_dir: Path, with_context: bool = True,
+                      normalize: bool = False):
+    """
+    Generates a JSONL file compatible with PIQN and DiffusionNER, writing one line per sentence as it goes.
+    :param sentences: the sentences from which to extract the tokens and the entities
+    :param output_file_name: the output file name
+    :param save_dir: the directory where to save the generates files
+    :param with_context: if False, the sentences are written without their context, see create_sentence_line
+    :param normalize: if True, the Arabic tokens are normalized, see arabic_normalization.normalize_json_line
+    """
+    json_lines = iter_json_lines(sentences) if with_context else iter_sentence_lines(sentences)
+    if normalize:
+        json_lines = map(normalize_json_line, json_lines)
+    write_jsonl_file(tqdm(json_lines, total=len(sentences)), output_file_name, save_dir)
+
+
+def preprocess_file(file_path: str, output_file_name: str, save_dir: Path, jsonl: bool = False,
+                    with_context: bool = True, normalize: bool = False) -> None:
     """
     Performs files preprocessing.
     :param file_path: the path to the file
     :param output_file_name: the name of the output file
     :param save_dir: the directory where to save the preprocessed files
+    :param jsonl: if True, write a JSONL file instead of a single JSON array
+    :param with_context: if False, the sentences are written without their context, see create_sentence_line
+    :param normalize: if True, the Arabic tokens are normalized, see arabic_normalization.normalize_json_line
     """
     logger.info(f"Pre-processing file: {file_path}")
-    lines = extract_sentences(file_path)
-    create_json_file(lines, output_file_name, save_dir)
+    with IOBCorpus(file_path) as corpus:
+        if jsonl:
+            create_jsonl_file(corpus, output_file_name, save_dir, with_context, normalize)
+        else:
+            create_json_file(corpus, output_file_name, save_dir, with_context, normalize)
 
 
 def main():
@@ -91,6 +180,26 @@ def main():
     group.add_argument("--file", "-f", type=str)
 
     parser.add_argument("--save-directory", "-s", required=False, type=str, default="save/")
+    parser.add_argument("--jsonl", action="store_true",
+                        help="Stream the output as one JSON line per sentence instead of a single JSON array.")
+    parser.add_argument("--workers", "-n", required=False, type=int, default=1,
+                        help="Number of processes used to convert the sentences. 1 = no multiprocessing.")
+    parser.add_argument("--chunk-size", required=False, type=int, default=1000,
+                        help="Number of sentences sent to a process at once when --workers > 1.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Write JSONL files and only reconvert the chunks of --chunk-size sentences that changed "
+                             "since the previous run.")
+    parser.add_argument("--without-context", action="store_true",
+                        help="Store every sentence once with its position, without ltokens and rtokens. The models "
+                             "then build the context when loading the dataset, see their --context_window option.")
+    parser.add_argument("--normalize", action="store_true",
+                        help="Remove the Arabic diacritics and tatweel and unify the alef, ya and ta marbuta variants, "
+                             "keeping the original tokens, and report the effect on the words and the subwords.")
+    parser.add_argument("--tokenizer-path", "-t", required=False, type=str, default=None,
+                        help="Also write the output tokenized with this tokenizer, to be loaded by the models without "
+                             "running the tokenizer.")
+    parser.add_argument("--lowercase", action="store_true", default=False,
+                        help="Lowercase the words of the tokenized output, as the --lowercase option of the model.")
     args = parser.parse_args()
 
     save_dir = Path(args.save_directory)
@@ -98,15 +207,44 @@ def main():
 
     if args.dataset_directory is not None:
         data_dir = Path(args.dataset_directory)
-        for split in ["train", "val"]:
-            file_name = split + ".txt"
-            preprocess_file(os.path.join(data_dir, file_name), f"{split}_preprocessed", save_dir)
+        file_paths = [os.path.join(data_dir, split + ".txt") for split in ["train", "val"]]
+        output_file_names = [f"{split}_preprocessed" for split in ["train", "val"]]
 
     elif args.file is not None:
         file_path = Path(args.file)
         file_name = str(file_path).split("/")[-1].split(".txt")[0]
-
-        preprocess_file(file_path, f"{file_name}_preprocessed", save_dir)
+        file_paths = [file_path]
+        output_file_names = [f"{file_name}_preprocessed"]
+
+    with_context = not args.without_context
+    convert = partial(convert_chunk, with_context=with_context, normalize=args.normalize)
+    if args.incremental:
+        version = "preprocess_wojood" if with_context else "preprocess_wojood:without_context"
+        if args.normalize:
+            version += ":normalize"
+        for file_path, output_file_name in zip(file_paths, output_file_names):
+            logger.info(f"Pre-processing file: {file_path}")
+            convert_file_incrementally(convert, file_path, output_file_name, save_dir, args.chunk_size, args.workers,
+                                       version)
+    elif args.workers > 1:
+        logger.info(f"Pre-processing files: {file_paths} with {args.workers} workers")
+        convert_files_in_parallel(convert, file_paths, output_file_names, save_dir, args.workers, args.chunk_size,
+                                  args.jsonl)
+    else:
+        for file_path, output_file_name in zip(file_paths, output_file_names):
+            preprocess_file(file_path, output_file_name, save_dir, args.jsonl, with_context, args.normalize)
+
+    extension = ".jsonl" if args.jsonl or args.incremental else ".json"
+    if args.normalize:
+        for output_file_name in output_file_names:
+            write_normalization_report(save_dir / (output_file_name + extension), args.tokenizer_path)
+
+    if args.tokenizer_path is not None:
+        # transformers is only needed for the tokenized output
+        from pretokenize import pretokenize_file
+        for output_file_name in output_file_names:
+            pretokenize_file(save_dir / (output_file_name + extension), args.tokenizer_path,
+                             lowercase=args.lowercase)
 
 
 if __name__ == "__main__":
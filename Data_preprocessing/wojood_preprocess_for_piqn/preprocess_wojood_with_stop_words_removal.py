@@ -1,55 +1,77 @@
 import argparse
-import json
+import hashlib
 import os
 import re
+from functools import partial
 from pathlib import Path
+from typing import Iterable, Iterator
 
 from loguru import logger
 from tqdm import tqdm
 
-from utils import extract_spans_from_sentence, create_entity_mentions, delete_if_exists, extract_sentences
+from utils import IOBCorpus, extract_spans_from_rows, create_entity_mentions, read_chunk, write_json_file, \
+    convert_files_in_parallel, convert_file_incrementally
 
 
-def extract_tokens(sentence: str, stop_words: list) -> list:
+MULTIPLE_DOTS = re.compile(r'\.{2,}')
+REMOVED_PUNCTUATION = frozenset(["?", "!"])
+
+
+def filter_tokens(sentence: list, stop_words: frozenset) -> (list, list):
     """
-    Extracts from the sentences only the tokens that are not stop words.
-    :param sentence: the input sentence from which to extract the token.
-    :param stop_words: the list of the stop words.
-    :return: the extracted tokens
+    Extracts from the sentence only the tokens that are not stop words, along with the map from the original token
+    indices to the filtered ones.
+    :param sentence: the rows of the input sentence from which to extract the token.
+    :param stop_words: the set of the stop words.
+    :return: the extracted tokens and the index map, index_map[i] being the number of tokens kept before the i-th
+    original token, so that an original [start, end) span becomes [index_map[start], index_map[end]).
     """
     tokens = []
-    for token_with_label in sentence.split('\n'):
-        token = token_with_label.split("\t")[0]
-        token = re.sub(r'\.{2,}', '.', token)
-        if token not in stop_words and token not in ["?", "!"]:
+    index_map = [0]
+    for token_with_label in sentence:
+        token = token_with_label[0]
+        if ".." in token:
+            token = MULTIPLE_DOTS.sub('.', token)
+        if token not in stop_words:
             tokens.append(token)
-    return tokens
+        index_map.append(len(tokens))
+    return tokens, index_map
+
+
+def extract_tokens(sentence: list, stop_words: frozenset) -> list:
+    """
+    Extracts from the sentences only the tokens that are not stop words.
+    :param sentence: the rows of the input sentence from which to extract the token.
+    :param stop_words: the set of the stop words.
+    :return: the extracted tokens
+    """
+    return filter_tokens(sentence, stop_words)[0]
 
 
-def extract_stop_words(stop_words_file: Path) -> list:
+def extract_stop_words(stop_words_file: Path) -> frozenset:
     """
-    Extracts the stop words from the input file.
+    Extracts the stop words from the input file. The "?" and "!" punctuation marks are removed as well.
     :param stop_words_file: the file from which to extract the stop words.
-    :return: the list of the stop words.
+    :return: the set of the stop words.
     """
     with open(stop_words_file, "r") as f:
         lines = [line.strip() for line in f.readlines()]
-    return lines
+    return frozenset(lines).union(REMOVED_PUNCTUATION)
 
 
-def create_one_line(sentence: str, ltokens: list, rtokens: list, stop_words: list) -> dict:
+def create_one_line(sentence: list, filtered_tokens: tuple, ltokens: list, rtokens: list) -> dict:
     """
     Creates a single json line for the manifest file to be created.
-    :param sentence: the sentences from which to extract the tokens and the entities
+    :param sentence: the rows of the sentence from which to extract the tokens and the entities
+    :param filtered_tokens: the tokens of the sentence and their index map, as returned by filter_tokens
     :param ltokens: left tokens
     :param rtokens: right tokens
-    :param stop_words: the list of the stop words
     :return: the dict containing the needed data
     """
     json_line = dict()
-    completed_spans = extract_spans_from_sentence(sentence)
-    tokens = extract_tokens(sentence, stop_words)
-    entity_mentions = create_entity_mentions(completed_spans, tokens)
+    completed_spans = extract_spans_from_rows(sentence)
+    tokens, index_map = filtered_tokens
+    entity_mentions = create_entity_mentions(completed_spans, tokens, index_map)
     json_line["tokens"] = tokens
     json_line["entities"] = entity_mentions
     json_line["ltokens"] = ltokens
@@ -60,46 +82,67 @@ def create_one_line(sentence: str, ltokens: list, rtokens: list, stop_words: lis
     return json_line
 
 
-def create_json_file(sentences: str, output_file_name: str, save_dir: Path, stop_words: list):
+def create_json_file(sentences: IOBCorpus, output_file_name: str, save_dir: Path, stop_words: frozenset):
     """
     Generates a JSON file compatible with PIQN.
     :param sentences: the sentences from which to extract the tokens and the entities
     :param output_file_name: the output file name
     :param save_dir: the directory where to save the generates files
-    :param stop_words: the list of the stop words
+    :param stop_words: the set of the stop words
     """
-    json_filename = output_file_name + ".json"
-    json_file_path = os.path.join(save_dir, json_filename)
-    delete_if_exists(json_file_path)
-    contents = []
+    write_json_file(tqdm(iter_json_lines(sentences, stop_words), total=len(sentences)), output_file_name, save_dir)
 
-    for i in tqdm(range(len(sentences))):
-        if i < len(sentences) - 1:
-            rtokens = extract_tokens(sentences[i + 1], stop_words)
-        else:
-            rtokens = []
-        if i > 0:
-            ltokens = extract_tokens(sentences[i - 1], stop_words)
-        else:
-            ltokens = []
-        contents.append(create_one_line(
-            sentences[i], ltokens, rtokens, stop_words))
 
-    with open(json_file_path, 'w', encoding='utf-8') as file:
-        json.dump(contents, file, ensure_ascii=False)
+def iter_json_lines(sentences: Iterable[list], stop_words: frozenset, previous_sentence: list = None,
+                    next_sentence: list = None) -> Iterator[dict]:
+    """
+    Lazily generates the json lines of the manifest. The tokens of every sentence are filtered once and reused as the
+    context of its neighbours.
+    :param sentences: an iterable over the rows of the sentences from which to extract the tokens and the entities
+    :param stop_words: the set of the stop words
+    :param previous_sentence: the sentence preceding the first one, if any
+    :param next_sentence: the sentence following the last one, if any
+    :return: a generator over the dicts containing the needed data
+    """
+    ltokens = extract_tokens(previous_sentence, stop_words) if previous_sentence is not None else []
+    current_sentence = None
+    current_filtered_tokens = ([], [0])
+
+    for sentence in sentences:
+        filtered_tokens = filter_tokens(sentence, stop_words)
+        if current_sentence is not None:
+            yield create_one_line(current_sentence, current_filtered_tokens, ltokens, filtered_tokens[0])
+            ltokens = current_filtered_tokens[0]
+        current_sentence = sentence
+        current_filtered_tokens = filtered_tokens
 
+    if current_sentence is not None:
+        rtokens = extract_tokens(next_sentence, stop_words) if next_sentence is not None else []
+        yield create_one_line(current_sentence, current_filtered_tokens, ltokens, rtokens)
 
-def preprocess_file(file_path: str, output_file_name: str, save_dir: Path, stop_words: list) -> None:
+
+def convert_chunk(chunk: tuple, stop_words: frozenset) -> list:
+    """
+    Converts a chunk of consecutive sentences. Used by the worker processes.
+    :param chunk: a chunk as produced by utils.iter_chunks
+    :param stop_words: the set of the stop words
+    :return: the dicts containing the needed data, in order
+    """
+    previous_sentence, sentences, next_sentence = read_chunk(chunk)
+    return list(iter_json_lines(sentences, stop_words, previous_sentence, next_sentence))
+
+
+def preprocess_file(file_path: str, output_file_name: str, save_dir: Path, stop_words: frozenset) -> None:
     """
     Performs files preprocessing.
     :param file_path: the path to the file
     :param output_file_name: the name of the output file
     :param save_dir: the directory where to save the preprocessed files
-    :param stop_words:  the list of the stop words
+    :param stop_words: the set of the stop words
     """
     logger.info(f"Pre-processing file: {file_path}")
-    lines = extract_sentences(file_path)
-    create_json_file(lines, output_file_name, save_dir, stop_words)
+    with IOBCorpus(file_path) as corpus:
+        create_json_file(corpus, output_file_name, save_dir, stop_words)
 
 
 def main():
@@ -111,6 +154,18 @@ def main():
     parser.add_argument("--stop-words-file", "-w", required=True, type=str)
     parser.add_argument("--save-directory", "-s",
                         required=False, type=str, default="save/")
+    parser.add_argument("--workers", "-n", required=False, type=int, default=1,
+                        help="Number of processes used to convert the sentences. 1 = no multiprocessing.")
+    parser.add_argument("--chunk-size", required=False, type=int, default=1000,
+                        help="Number of sentences sent to a process at once when --workers > 1.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Write JSONL files and only reconvert the chunks of --chunk-size sentences that changed "
+                             "since the previous run.")
+    parser.add_argument("--tokenizer-path", "-t", required=False, type=str, default=None,
+                        help="Also write the output tokenized with this tokenizer, to be loaded by the models without "
+                             "running the tokenizer.")
+    parser.add_argument("--lowercase", action="store_true", default=False,
+                        help="Lowercase the words of the tokenized output, as the --lowercase option of the model.")
     args = parser.parse_args()
 
     save_dir = Path(args.save_directory)
@@ -119,17 +174,38 @@ def main():
     stop_words = extract_stop_words(stop_words_file)
     if args.dataset_directory is not None:
         data_dir = Path(args.dataset_directory)
-        for split in ["train", "val"]:
-            file_name = split + ".txt"
-            preprocess_file(os.path.join(data_dir, file_name),
-                            f"{split}_preprocessed", save_dir, stop_words)
+        file_paths = [os.path.join(data_dir, split + ".txt") for split in ["train", "val"]]
+        output_file_names = [f"{split}_preprocessed" for split in ["train", "val"]]
 
     elif args.file is not None:
         file_path = Path(args.file)
         file_name = str(file_path).split("/")[-1].split(".txt")[0]
-
-        preprocess_file(
-            file_path, f"{file_name}_preprocessed", save_dir, stop_words)
+        file_paths = [file_path]
+        output_file_names = [f"{file_name}_preprocessed"]
+
+    if args.incremental:
+        # the output also depends on the stop words
+        stop_words_hash = hashlib.blake2b("\n".join(sorted(stop_words)).encode(), digest_size=16).hexdigest()
+        version = f"stop_words_removal:{stop_words_hash}"
+        for file_path, output_file_name in zip(file_paths, output_file_names):
+            logger.info(f"Pre-processing file: {file_path}")
+            convert_file_incrementally(partial(convert_chunk, stop_words=stop_words), file_path, output_file_name,
+                                       save_dir, args.chunk_size, args.workers, version)
+    elif args.workers > 1:
+        logger.info(f"Pre-processing files: {file_paths} with {args.workers} workers")
+        convert_files_in_parallel(partial(convert_chunk, stop_words=stop_words), file_paths, output_file_names,
+                                  save_dir, args.workers, args.chunk_size)
+    else:
+        for file_path, output_file_name in zip(file_paths, output_file_names):
+            preprocess_file(file_path, output_file_name, save_dir, stop_words)
+
+    if args.tokenizer_path is not None:
+        # transformers is only needed for the tokenized output
+        from pretokenize import pretokenize_file
+        extension = ".jsonl" if args.incremental else ".json"
+        for output_file_name in output_file_names:
+            pretokenize_file(save_dir / (output_file_name + extension), args.tokenizer_path,
+                             lowercase=args.lowercase)
 
 
 if __name__ == "__main__":
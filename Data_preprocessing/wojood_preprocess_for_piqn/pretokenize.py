@@ -0,0 +1,178 @@
+import argparse
+import hashlib
+import json
+import os
+from array import array
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+from loguru import logger
+from tqdm import tqdm
+from transformers import AutoTokenizer
+
+from utils import iter_documents
+
+TOKENIZED_CORPUS_FORMAT = 3
+
+# the options of a tokenizer which tell where it was loaded from, not how it encodes words
+LOADING_OPTIONS = {"name_or_path", "cache_dir", "local_files_only", "is_local"}
+
+
+def tokenizer_identity(tokenizer: AutoTokenizer) -> list:
+    """
+    The same as dataset_cache.tokenizer_identity in the models, which compare it to the one of their tokenizer.
+    :param tokenizer: a tokenizer
+    :return: what makes the tokenizer encode words as it does: its class, a digest of its vocabulary and its options
+    """
+    vocab = json.dumps(sorted(tokenizer.get_vocab().items()), ensure_ascii=False).encode("utf-8")
+    options = {key: value for key, value in tokenizer.init_kwargs.items()
+               if key not in LOADING_OPTIONS and not key.endswith("_file")}
+    return [type(tokenizer).__name__, hashlib.blake2b(vocab, digest_size=16).hexdigest(),
+            json.dumps(options, sort_keys=True, default=str)]
+
+
+class WordEncoder:
+
+    def __init__(self, tokenizer: AutoTokenizer):
+        """
+        Encodes words one at a time, like the readers of the models do, remembering the subwords of every word.
+        :param tokenizer: the tokenizer of the model
+        """
+        self._tokenizer = tokenizer
+        self._encodings = dict()
+
+    def encode(self, word: str) -> list:
+        encoding = self._encodings.get(word)
+        if encoding is None:
+            encoding = self._tokenizer.encode(word, add_special_tokens=False)
+            self._encodings[word] = encoding
+        return encoding
+
+
+def write_tokenized_corpus(documents: Iterator[dict], tokenizer: AutoTokenizer, output_dir: Path):
+    """
+    Writes the documents of a manifest with the subwords of every word, as flat NumPy arrays which the readers of the
+    models load without running the tokenizer:
+    - subwords.npy: the subword ids of all the words, one word after the other
+    - word_subword_offsets.npy, word_char_offsets.npy: the range of every word in subwords.npy and in words.npy
+    - words.npy: the UTF-8 bytes of all the words
+    - pos.npy: the index in the "pos" list of index.json of the part-of-speech of every word, -1 if unknown
+    - documents.npy: for every document, the index of its first left context word, first token, first right context
+    word and the end of its right context, which also give the segment of every word
+    - document_ids.npy: the index in the "org_ids" list of index.json of the id of the document of every sentence
+    - entities.npy, relations.npy: the (start, end, type) entities and (head, tail, type) relations of all the
+    documents, document_entities.npy and document_relations.npy being the range of every document in them
+    - index.json: the tokenizer, the counts and the names of the types and of the part-of-speech tags
+    :param documents: the documents of the manifest
+    :param tokenizer: the tokenizer of the model
+    :param output_dir: the directory where to write the corpus
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    encoder = WordEncoder(tokenizer)
+    names = {"entity_types": dict(), "relation_types": dict(), "pos": dict(), "org_ids": dict()}
+
+    subwords = array("i")
+    word_subword_offsets = array("q", [0])
+    word_char_offsets = array("q", [0])
+    words = bytearray()
+    pos = array("i")
+    document_words = array("q")
+    document_ids = array("q")
+    entities = array("i")
+    document_entities = array("q", [0])
+    relations = array("i")
+    document_relations = array("q", [0])
+
+    def name_index(kind: str, name: str) -> int:
+        return names[kind].setdefault(name, len(names[kind]))
+
+    def add_words(phrases: list, tags: list = None):
+        for i, phrase in enumerate(phrases):
+            subwords.extend(encoder.encode(phrase))
+            word_subword_offsets.append(len(subwords))
+            words.extend(phrase.encode("utf-8"))
+            word_char_offsets.append(len(words))
+            pos.append(name_index("pos", tags[i]) if tags else -1)
+
+    for document in documents:
+        document_words.append(len(word_subword_offsets) - 1)
+        add_words(document.get("ltokens") or [])
+        document_words.append(len(word_subword_offsets) - 1)
+        add_words(document["tokens"], document.get("pos"))
+        document_words.append(len(word_subword_offsets) - 1)
+        add_words(document.get("rtokens") or [])
+        document_words.append(len(word_subword_offsets) - 1)
+        document_ids.append(name_index("org_ids", document.get("orig_id", document.get("org_id"))))
+
+        for entity in document["entities"]:
+            entities.extend([entity["start"], entity["end"], name_index("entity_types", entity["type"])])
+        document_entities.append(len(entities) // 3)
+        for relation in document.get("relations") or []:
+            relations.extend([relation["head"], relation["tail"], name_index("relation_types", relation["type"])])
+        document_relations.append(len(relations) // 3)
+
+    document_count = len(document_entities) - 1
+    np.save(output_dir / "subwords.npy", np.frombuffer(subwords, dtype=np.int32))
+    np.save(output_dir / "word_subword_offsets.npy", np.frombuffer(word_subword_offsets, dtype=np.int64))
+    np.save(output_dir / "word_char_offsets.npy", np.frombuffer(word_char_offsets, dtype=np.int64))
+    np.save(output_dir / "words.npy", np.frombuffer(bytes(words), dtype=np.uint8))
+    np.save(output_dir / "pos.npy", np.frombuffer(pos, dtype=np.int32))
+    np.save(output_dir / "documents.npy", np.frombuffer(document_words, dtype=np.int64).reshape(document_count, 4))
+    np.save(output_dir / "document_ids.npy", np.frombuffer(document_ids, dtype=np.int64))
+    np.save(output_dir / "entities.npy", np.frombuffer(entities, dtype=np.int32).reshape(-1, 3))
+    np.save(output_dir / "document_entities.npy", np.frombuffer(document_entities, dtype=np.int64))
+    np.save(output_dir / "relations.npy", np.frombuffer(relations, dtype=np.int32).reshape(-1, 3))
+    np.save(output_dir / "document_relations.npy", np.frombuffer(document_relations, dtype=np.int64))
+
+    with open(output_dir / "index.json", "w", encoding="utf-8") as file:
+        json.dump({
+            "format": TOKENIZED_CORPUS_FORMAT,
+            "tokenizer": tokenizer.name_or_path,
+            "tokenizer_identity": tokenizer_identity(tokenizer),
+            "document_count": document_count,
+            "entity_count": len(entities) // 3,
+            "entity_types": list(names["entity_types"]),
+            "relation_types": list(names["relation_types"]),
+            "pos": list(names["pos"]),
+            "org_ids": list(names["org_ids"]),
+        }, file, ensure_ascii=False)
+
+
+def pretokenize_file(file_path: Path, tokenizer_path: str, save_dir: Path = None, lowercase: bool = False) -> Path:
+    """
+    Writes the tokenized corpus of a JSON or JSONL manifest, as "<manifest name>.tokenized".
+    :param file_path: the path of the manifest
+    :param tokenizer_path: the path or the name of the tokenizer of the model
+    :param save_dir: the directory where to write the corpus, the one of the manifest by default
+    :param lowercase: the --lowercase option of the model
+    :return: the path of the tokenized corpus
+    """
+    file_path = Path(file_path)
+    save_dir = Path(save_dir) if save_dir is not None else file_path.parent
+    output_dir = save_dir / (os.path.splitext(file_path.name)[0] + ".tokenized")
+    logger.info(f"Tokenizing {file_path} into {output_dir}")
+
+    # loaded as by the models, their reader checks that the corpus was tokenized with the same tokenizer and options
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_path, use_fast=False, do_lower_case=lowercase)
+    write_tokenized_corpus(tqdm(iter_documents(file_path)), tokenizer, output_dir)
+    return output_dir
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--file", "-f", required=True, type=str, nargs="+",
+                        help="JSON or JSONL manifests written by the preprocessing scripts.")
+    parser.add_argument("--tokenizer-path", "-t", required=True, type=str)
+    parser.add_argument("--lowercase", action="store_true", default=False,
+                        help="Lowercase the words, as the --lowercase option of the model. Must match it.")
+    parser.add_argument("--save-directory", "-s", required=False, type=str, default=None,
+                        help="Where to write the tokenized corpora, next to the manifests by default.")
+    args = parser.parse_args()
+
+    for file_path in args.file:
+        pretokenize_file(Path(file_path), args.tokenizer_path, args.save_directory, args.lowercase)
+
+
+if __name__ == "__main__":
+    main()
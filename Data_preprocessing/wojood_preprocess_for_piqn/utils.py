@@ -1,5 +1,44 @@
+import hashlib
+import json
 import os
+import sys
+import threading
+from contextlib import ExitStack, nullcontext
+from multiprocessing import Pool
 from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+from loguru import logger
+from tqdm import tqdm
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from iob_corpus import IOBCorpus  # noqa: E402
+
+
+def iter_sentences(file_path: Path) -> Iterator[str]:
+    """
+    Lazily extracts the sentences from the input file, one at a time.
+    :param file_path: the path of the file from which to extract the sentences
+    :return: a generator over the extracted sentences
+    """
+    with IOBCorpus(file_path) as corpus:
+        for index in range(len(corpus)):
+            yield corpus.text(index)
+
+
+def iter_documents(file_path: Path) -> Iterator[dict]:
+    """
+    Iterates over the documents of a JSON or JSONL manifest.
+    :param file_path: the path of the manifest
+    :return: a generator over the documents
+    """
+    if str(file_path).endswith(".jsonl"):
+        with open(file_path, encoding="utf-8") as file:
+            for line in file:
+                yield json.loads(line)
+    else:
+        with open(file_path, encoding="utf-8") as file:
+            yield from json.load(file)
 
 
 def extract_sentences(file_path: Path) -> list:
@@ -8,22 +47,252 @@ def extract_sentences(file_path: Path) -> list:
     :param file_path: the path of the file from which to extract the sentences
     :return: the extracted sentences
     """
-    lines = []
-    current_line = ""
+    return list(iter_sentences(file_path))
+
+
+def iter_chunks(corpus: IOBCorpus, chunk_size: int) -> Iterator[tuple]:
+    """
+    Splits a corpus into chunks of consecutive sentences. Each chunk is a selection of the corpus that also holds the
+    sentences surrounding it, so only byte offsets are sent to the worker processes.
+    :param corpus: the corpus to split
+    :param chunk_size: the maximum number of sentences per chunk
+    :return: a generator over (selected corpus, start, stop) tuples, the sentences of the chunk being the ones of the
+    selected corpus between start and stop
+    """
+    for start in range(0, len(corpus), chunk_size):
+        stop = min(start + chunk_size, len(corpus))
+        first = max(start - 1, 0)
+        last = min(stop + 1, len(corpus))
+        yield corpus.select(first, last), start - first, stop - first
+
+
+def read_chunk(chunk: tuple) -> tuple:
+    """
+    Reads the sentences of a chunk produced by iter_chunks.
+    :param chunk: a (selected corpus, start, stop) tuple
+    :return: the previous sentence, the list of the sentences and the next sentence of the chunk, the previous or the
+    next sentence being None at the edges of the corpus
+    """
+    corpus, start, stop = chunk
+    with corpus:
+        previous_sentence = corpus[start - 1] if start > 0 else None
+        next_sentence = corpus[stop] if stop < len(corpus) else None
+        sentences = [corpus[index] for index in range(start, stop)]
+    return previous_sentence, sentences, next_sentence
+
+
+def write_json_file(json_lines: Iterable[dict], output_file_name: str, save_dir: Path):
+    """
+    Writes the json lines as a single JSON array, one line at a time. The output is the same as json.dump's.
+    :param json_lines: an iterable over the dicts to write
+    :param output_file_name: the output file name
+    :param save_dir: the directory where to save the generated file
+    """
+    json_file_path = os.path.join(save_dir, output_file_name + ".json")
+    delete_if_exists(json_file_path)
+
+    with open(json_file_path, 'w', encoding='utf-8') as file:
+        separator = ""
+        file.write("[")
+        for json_line in json_lines:
+            file.write(separator + json.dumps(json_line, ensure_ascii=False))
+            separator = ", "
+        file.write("]")
+
+
+def write_jsonl_file(json_lines: Iterable[dict], output_file_name: str, save_dir: Path):
+    """
+    Writes the json lines to a JSONL file, one line per sentence as they come.
+    The "<output_file_name>_statistic.json" file needed by the readers' ".jsonl" path is written next to it.
+    :param json_lines: an iterable over the dicts to write
+    :param output_file_name: the output file name
+    :param save_dir: the directory where to save the generated files
+    """
+    jsonl_file_path = os.path.join(save_dir, output_file_name + ".jsonl")
+    statistic_file_path = os.path.join(save_dir, output_file_name + "_statistic.json")
+    delete_if_exists(jsonl_file_path)
+    delete_if_exists(statistic_file_path)
+    document_count = 0
+    entity_count = 0
+
+    with open(jsonl_file_path, 'w', encoding='utf-8') as file:
+        for json_line in json_lines:
+            file.write(json.dumps(json_line, ensure_ascii=False) + "\n")
+            document_count += 1
+            entity_count += len(json_line["entities"])
+
+    write_statistic_file(document_count, entity_count, statistic_file_path, jsonl_file_path)
+
+
+def write_statistic_file(document_count: int, entity_count: int, statistic_file_path: str, jsonl_file_path: str):
+    """
+    Writes the statistics of a JSONL file, as read by the readers' ".jsonl" path. The size and modification time of the
+    file are recorded, the readers build the statistic again once they changed.
+    :param document_count: the number of documents of the JSONL file
+    :param entity_count: the number of entities of the JSONL file
+    :param statistic_file_path: the path of the statistic file
+    :param jsonl_file_path: the path of the JSONL file, once written
+    """
+    stat = os.stat(jsonl_file_path)
+    with open(statistic_file_path, 'w', encoding='utf-8') as file:
+        json.dump({"document_count": document_count, "entity_count": entity_count, "file_size": stat.st_size,
+                   "file_mtime_ns": stat.st_mtime_ns}, file)
+
+
+def convert_files_in_parallel(convert_chunk: Callable, file_paths: list, output_file_names: list, save_dir: Path,
+                              workers: int, chunk_size: int, jsonl: bool = False):
+    """
+    Converts the files with a pool of processes. Every file is split into chunks on sentence boundaries and the chunks
+    of all the files are submitted one after the other, so the next file is converted while the previous one is being
+    written. At most two chunks per process are submitted ahead of the writer, so the converted sentences do not pile up
+    in memory. The results are written in order, the output is thus the same as a single-process conversion.
+    :param convert_chunk: a picklable function mapping a chunk produced by iter_chunks to the list of the dicts of its
+    sentences
+    :param file_paths: the paths to the files
+    :param output_file_names: the names of the output files
+    :param save_dir: the directory where to save the preprocessed files
+    :param workers: the number of processes
+    :param chunk_size: the number of sentences per chunk
+    :param jsonl: if True, write JSONL files instead of JSON arrays
+    """
+    write_file = write_jsonl_file if jsonl else write_json_file
+
+    with ExitStack() as stack:
+        corpora = [stack.enter_context(IOBCorpus(file_path)) for file_path in file_paths]
+        pending_chunks = threading.Semaphore(2 * workers)
+        stopped = threading.Event()
+
+        def iter_all_chunks():
+            for corpus in corpora:
+                for chunk in iter_chunks(corpus, chunk_size):
+                    pending_chunks.acquire()
+                    if stopped.is_set():
+                        return
+                    yield chunk
+
+        def iter_json_lines(converted_chunks, file_path, chunk_count):
+            for _ in tqdm(range(chunk_count), desc=f"Chunks of {file_path}"):
+                converted_chunk = next(converted_chunks)
+                pending_chunks.release()
+                yield from converted_chunk
+
+        with Pool(workers) as pool:
+            try:
+                converted_chunks = pool.imap(convert_chunk, iter_all_chunks())
+                for file_path, output_file_name, corpus in zip(file_paths, output_file_names, corpora):
+                    chunk_count = (len(corpus) + chunk_size - 1) // chunk_size
+                    write_file(iter_json_lines(converted_chunks, file_path, chunk_count), output_file_name, save_dir)
+            finally:
+                # the chunks are no longer submitted if the conversion failed, so that the pool can be terminated
+                stopped.set()
+                pending_chunks.release()
+
+
+def hash_chunk(chunk: tuple) -> str:
+    """
+    Hashes the raw bytes of a chunk produced by iter_chunks, surrounding sentences included since they are the context
+    of its first and last sentences, along with its position in the file. Two chunks with the same hash are converted
+    to the same json lines.
+    :param chunk: a (selected corpus, start, stop) tuple
+    :return: the hexadecimal digest of the chunk
+    """
+    corpus, start, stop = chunk
+    digest = hashlib.blake2b(f"{corpus.offset + start}:{start}:{len(corpus) - stop}".encode(), digest_size=16)
+    for index in range(len(corpus)):
+        digest.update(b"\n\n")
+        digest.update(corpus.view(index))
+    return digest.hexdigest()
+
 
-    with open(file_path, 'r') as file:
-        for line in file:
-            if line.strip() == "":
-                if current_line:
-                    lines.append(current_line.strip())
-                    current_line = ""
-            else:
-                current_line += line
+def load_manifest(manifest_file_path: str, jsonl_file_path: str, chunk_size: int, version: str) -> dict:
+    """
+    Loads the chunks of the manifest of a previous incremental conversion, if it is still usable.
+    :param manifest_file_path: the path of the manifest
+    :param jsonl_file_path: the path of the JSONL file described by the manifest
+    :param chunk_size: the number of sentences per chunk of the current conversion
+    :param version: the version of the current conversion
+    :return: the chunks of the previous conversion by hash, with their byte offset in the JSONL file. Empty if there is
+    no previous conversion or if it was done with other settings.
+    """
+    if not os.path.exists(manifest_file_path) or not os.path.exists(jsonl_file_path):
+        return dict()
+    with open(manifest_file_path, encoding='utf-8') as file:
+        manifest = json.load(file)
+    if manifest["chunk_size"] != chunk_size or manifest["version"] != version:
+        return dict()
+    if sum(chunk["length"] for chunk in manifest["chunks"]) != os.path.getsize(jsonl_file_path):
+        return dict()
 
-        if current_line:
-            lines.append(current_line.strip())
+    chunks = dict()
+    offset = 0
+    for chunk in manifest["chunks"]:
+        chunks[chunk["hash"]] = dict(chunk, offset=offset)
+        offset += chunk["length"]
+    return chunks
+
+
+def convert_file_incrementally(convert_chunk: Callable, file_path: Path, output_file_name: str, save_dir: Path,
+                               chunk_size: int, workers: int = 1, version: str = ""):
+    """
+    Converts a file to JSONL, only reconverting the chunks that changed since the previous conversion.
+    The hash of every chunk is kept in "<output_file_name>_manifest.json", next to the JSONL file. On the next run, the
+    json lines of the chunks whose hash is known are copied from the previous JSONL file and the other chunks are
+    converted, which is fast when sentences are appended to the file. The output is the same as a full conversion.
+    :param convert_chunk: a picklable function mapping a chunk produced by iter_chunks to the list of the dicts of its
+    sentences
+    :param file_path: the path to the file
+    :param output_file_name: the name of the output file
+    :param save_dir: the directory where to save the preprocessed files
+    :param chunk_size: the number of sentences per chunk
+    :param workers: the number of processes converting the changed chunks, 1 = no multiprocessing
+    :param version: identifies the conversion settings, the previous output is not reused if they changed
+    """
+    jsonl_file_path = os.path.join(save_dir, output_file_name + ".jsonl")
+    statistic_file_path = os.path.join(save_dir, output_file_name + "_statistic.json")
+    manifest_file_path = os.path.join(save_dir, output_file_name + "_manifest.json")
+    previous_chunks = load_manifest(manifest_file_path, jsonl_file_path, chunk_size, version)
 
-    return lines
+    with IOBCorpus(file_path) as corpus:
+        chunks = list(iter_chunks(corpus, chunk_size))
+        hashes = [hash_chunk(chunk) for chunk in chunks]
+        changed_chunks = [chunk for chunk, chunk_hash in zip(chunks, hashes) if chunk_hash not in previous_chunks]
+        logger.info(f"{len(changed_chunks)} chunks out of {len(chunks)} to convert in {file_path}")
+
+        manifest_chunks = []
+        temporary_file_path = jsonl_file_path + ".tmp"
+        # the pool is terminated and the partial output removed if a chunk fails
+        with Pool(workers) if workers > 1 and changed_chunks else nullcontext() as pool, \
+                open(jsonl_file_path, 'rb') if previous_chunks else nullcontext() as previous_file:
+            converted_chunks = pool.imap(convert_chunk, changed_chunks) if pool is not None \
+                else map(convert_chunk, changed_chunks)
+            try:
+                with open(temporary_file_path, 'wb') as file:
+                    for chunk_hash in tqdm(hashes, desc=f"Chunks of {file_path}"):
+                        if chunk_hash in previous_chunks:
+                            manifest_chunk = previous_chunks[chunk_hash]
+                            previous_file.seek(manifest_chunk["offset"])
+                            data = previous_file.read(manifest_chunk["length"])
+                            document_count = manifest_chunk["document_count"]
+                            entity_count = manifest_chunk["entity_count"]
+                        else:
+                            json_lines = next(converted_chunks)
+                            data = "".join(json.dumps(json_line, ensure_ascii=False) + "\n"
+                                           for json_line in json_lines).encode('utf-8')
+                            document_count = len(json_lines)
+                            entity_count = sum(len(json_line["entities"]) for json_line in json_lines)
+                        file.write(data)
+                        manifest_chunks.append({"hash": chunk_hash, "length": len(data),
+                                                "document_count": document_count, "entity_count": entity_count})
+            except BaseException:
+                os.remove(temporary_file_path)
+                raise
+
+    os.replace(temporary_file_path, jsonl_file_path)
+    write_statistic_file(sum(chunk["document_count"] for chunk in manifest_chunks),
+                         sum(chunk["entity_count"] for chunk in manifest_chunks), statistic_file_path,
+                         jsonl_file_path)
+    with open(manifest_file_path, 'w', encoding='utf-8') as file:
+        json.dump({"chunk_size": chunk_size, "version": version, "chunks": manifest_chunks}, file)
 
 
 def create_entity_mentions_dict(entity_type: str, start: str, end: str, text: str) -> dict:
@@ -43,49 +312,65 @@ def create_entity_mentions_dict(entity_type: str, start: str, end: str, text: st
     return entity_mention
 
 
-def extract_spans_from_sentence(sentence: str) -> list:
+def extract_spans_from_rows(rows: list) -> list:
     """
-    Extracts the spans from the sentences.
-    :param sentence: the input sentence
+    Extracts the spans from the rows of a sentence, as returned by IOBCorpus.
+    The tokens are visited once, from the last to the first, while keeping for each entity type the end of the run of
+    consecutive I- tags starting at the next token. A B- tag is then closed in O(1), which keeps long nested sentences
+    linear in the number of tags.
+    :param rows: the rows of the sentence, a row being the [token, labels] columns of one token
     :return: the extracted spans
     """
-    tokens_with_labels = sentence.split('\n')
+    run_ends = dict()
+    spans_per_token = []
 
-    intermediates = []
-    spans = []
-    completed_spans = []
-
-    for index in range(len(tokens_with_labels)):
-        token_with_label = tokens_with_labels[index]
-        labels = token_with_label.split("\t")[1].split(" ")
+    for index in range(len(rows) - 1, -1, -1):
+        labels = rows[index][1].split(" ")
 
-        spans.extend([(tag, index, index + 1)
-                      for tag in labels if "B-" in tag])
-        intermediates.extend([(tag, index) for tag in labels if "I-" in tag])
+        token_spans = []
+        for tag in labels:
+            if "B-" in tag:
+                entity = tag.split("B-")[-1]
+                end = run_ends.get("I-" + entity, index + 1)
+                token_spans.append((entity, index, end) if end > index + 1 else (tag, index, index + 1))
+        spans_per_token.append(token_spans)
 
-    for span in spans:
-        entity = span[0].split("B-")[-1]
-        index = span[2]
-        while ("I-" + entity, index) in intermediates:
-            span = (entity, span[1], index + 1)
-            index += 1
+        run_ends = {tag: run_ends.get(tag, index + 1) for tag in labels if "I-" in tag}
 
-        completed_spans.append(span)
+    completed_spans = []
+    for token_spans in reversed(spans_per_token):
+        completed_spans.extend(token_spans)
 
     return completed_spans
 
 
-def create_entity_mentions(spans: list, tokens: list) -> list:
+def extract_spans_from_sentence(sentence: str) -> list:
+    """
+    Extracts the spans from the sentences.
+    :param sentence: the input sentence
+    :return: the extracted spans
+    """
+    return extract_spans_from_rows([token_with_label.split("\t") for token_with_label in sentence.split('\n')])
+
+
+def create_entity_mentions(spans: list, tokens: list, index_map: list = None) -> list:
     """
     Creates a list containing the metadata for entities.
     :param spans: a list containing the spans
     :param tokens: the sentence tokens
+    :param index_map: if some tokens were removed from the sentence, the map from the original token indices to the
+    indices in tokens. The spans are shifted accordingly and the ones left without any token are dropped.
     :return: list containing the metadata for entities
     """
     entity_mentions = []
     for span in spans:
         start = span[1]
         end = span[2]
+        if index_map is not None:
+            start = index_map[start]
+            end = index_map[end]
+            if start == end:
+                continue
         text = " ".join(tokens[start:end])
 
         entity_mentions.append(create_entity_mentions_dict(
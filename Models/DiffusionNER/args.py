@@ -9,6 +9,27 @@ def _add_common_args(arg_parser):
 
     # Input
     arg_parser.add_argument('--types_path', type=str, help="Path to type specifications")
+    arg_parser.add_argument('--context_window', type=int, default=None,
+                            help="If set, the context of every sentence is built when loading the dataset from this number "
+                                 "of sentences before and after it in its document, instead of the ltokens and rtokens of the dataset")
+    arg_parser.add_argument('--dataset_cache_dir', type=str, default=None,
+                            help="If set, the parsed datasets are cached in this directory and loaded from it by the next runs "
+                                 "with the same dataset, tokenizer, types and options. Entries are never deleted, a changed dataset or "
+                                 "option adding a new one")
+    arg_parser.add_argument('--word_cache_size', type=int, default=65536,
+                            help="Number of words whose subword ids are kept when loading the datasets. 0 = no cache")
+    arg_parser.add_argument('--parse_processes', type=int, default=0,
+                            help="Number of processes parsing the JSON and .tokenized datasets. 0 = no multiprocessing for parsing")
+    arg_parser.add_argument('--max_length', type=int, default=512,
+                            help="Maximum number of subwords of a sample, special tokens included. Longer documents are ignored, "
+                                 "or split into windows if window_stride is set")
+    arg_parser.add_argument('--window_stride', type=int, default=None,
+                            help="If set, the documents longer than max_length are split into overlapping windows, every window "
+                                 "starting this number of tokens after the previous one, and their predictions are merged. "
+                                 "Not supported for .jsonl datasets")
+    arg_parser.add_argument('--max_context_subwords', type=int, default=None,
+                            help="If set, the context of every sentence is cut to this number of subwords, keeping the words "
+                                 "nearest to the sentence on both sides")
 
     # Preprocessing
     arg_parser.add_argument('--tokenizer_path', type=str, help="Path to tokenizer")
@@ -91,6 +112,13 @@ def train_argparser():
     # Input
     arg_parser.add_argument('--train_path', type=str, help="Path to train dataset")
     arg_parser.add_argument('--valid_path', type=str, help="Path to validation dataset")
+    arg_parser.add_argument('--train_resampling_times', type=str, default=None,
+                            help="Path to the resampling times of the train documents written by the adaptive resampling. "
+                                 "The documents are sampled accordingly instead of training on a resampled file")
+    arg_parser.add_argument('--train_dedup', type=str, default=None, choices=['exact', 'normalized'],
+                            help="Collapse the duplicates of every train document into one document, sampled as many times as it occurs. "
+                                 "'exact' duplicates have the same tokens, context and entities, 'normalized' ones the same entities "
+                                 "and the same tokens up to Unicode normalization, case and Arabic diacritics")
 
     # Logging
     arg_parser.add_argument('--save_path', type=str, help="Path to directory where model checkpoints are stored")
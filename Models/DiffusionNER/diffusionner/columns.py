@@ -0,0 +1,117 @@
+import numpy as np
+
+
+class Column:
+    """
+    A NumPy array of values which grows as values are appended, its capacity being doubled when it is full so that
+    appending a value takes a constant time on average. Only the values are pickled, not the spare capacity.
+    """
+
+    def __init__(self, dtype, capacity = 16):
+        """
+        :param dtype: the NumPy type of the values
+        :param capacity: the number of values held before the array is first grown
+        """
+        self._array = np.empty(capacity, dtype = dtype)
+        self._size = 0
+
+    def _reserve(self, size):
+        if size > len(self._array):
+            array = np.empty(max(size, 2 * len(self._array)), dtype = self._array.dtype)
+            array[:self._size] = self._array[:self._size]
+            self._array = array
+
+    def append(self, value):
+        size = self._size
+        if size == len(self._array):
+            self._reserve(size + 1)
+        self._array[size] = value
+        self._size = size + 1
+
+    def extend(self, values):
+        """
+        :param values: the values to append, as a sequence or an array
+        """
+        start = self._size
+        end = start + len(values)
+        if end > len(self._array):
+            self._reserve(end)
+        self._array[start:end] = values
+        self._size = end
+
+    def item(self, index):
+        """
+        :return: the value at index as a Python number
+        """
+        return self._array.item(index)
+
+    @property
+    def values(self):
+        """
+        :return: the values, as a view of the array which is no longer updated once the column grows
+        """
+        return self._array[:self._size]
+
+    def __len__(self):
+        return self._size
+
+    def __getstate__(self):
+        return (self.values,)
+
+    def __setstate__(self, state):
+        self._array, = state
+        self._size = len(self._array)
+
+
+class RaggedColumn:
+    """
+    Sequences of values of varying lengths, such as the encodings of documents, stored one after the other in a single
+    Column along with the end of every sequence.
+    """
+
+    def __init__(self, dtype):
+        """
+        :param dtype: the NumPy type of the values
+        """
+        self._values = Column(dtype)
+        self._ends = Column(np.int64)
+
+    def append(self, values):
+        """
+        :param values: the values of the next sequence, as a sequence or an array
+        """
+        self._values.extend(values)
+        self._ends.append(self._values._size)
+
+    def extend(self, other, start = 0, end = None):
+        """
+        Appends the sequences start to end (exclusive) of another ragged column.
+        """
+        end = len(other) if end is None else end
+        if start == end:
+            return
+        first, last = other.bounds(start)[0], other.bounds(end - 1)[1]
+        self._ends.extend(other._ends.values[start:end] - first + len(self._values))
+        self._values.extend(other._values.values[first:last])
+
+    def bounds(self, index):
+        """
+        :return: the start and end (exclusive) of the sequence at index in the values
+        """
+        return (self._ends.item(index - 1) if index > 0 else 0), self._ends.item(index)
+
+    def lengths(self):
+        """
+        :return: the length of every sequence, as an array
+        """
+        return np.diff(self._ends.values, prepend = 0)
+
+    def __getitem__(self, index):
+        """
+        :return: the sequence at index, as a view of the values
+        """
+        start, end = self.bounds(index)
+        return self._values.values[start:end]
+
+    def __len__(self):
+        return len(self._ends)
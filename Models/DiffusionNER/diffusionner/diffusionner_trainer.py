@@ -117,12 +117,25 @@ class DiffusionNERTrainer(BaseTrainer):
             types_path, 
             self._tokenizer, 
             self._logger,
-            repeat_gt_entities = 60)
+            repeat_gt_entities = 60,
+            context_window = args.context_window,
+            dataset_cache_dir = args.dataset_cache_dir,
+            word_cache_size = args.word_cache_size,
+            parse_processes = args.parse_processes,
+            max_length = args.max_length,
+            window_stride = args.window_stride,
+            max_context_subwords = args.max_context_subwords)
         
         dataset_map = {train_label: train_path, valid_label: valid_path}
         if args.eval_test:
             dataset_map[test_label] = valid_path.replace("dev", "test")
-        input_reader.read(dataset_map)
+        resampling_times = dict()
+        if args.train_resampling_times is not None:
+            resampling_times[train_label] = json.load(open(args.train_resampling_times))
+        dedup = dict()
+        if args.train_dedup is not None:
+            dedup[train_label] = args.train_dedup
+        input_reader.read(dataset_map, resampling_times, dedup)
 
         if self.local_rank < 1:
             self._log_datasets(input_reader)
@@ -132,7 +145,7 @@ class DiffusionNERTrainer(BaseTrainer):
             world_size = dist.get_world_size()
 
         train_dataset = input_reader.get_dataset(train_label)
-        train_sample_count = train_dataset.document_count
+        train_sample_count = train_dataset.sample_count
         updates_epoch = math.ceil(train_sample_count / (args.train_batch_size * world_size))
         updates_total = updates_epoch * args.epochs
         updates_total_stage_one = updates_epoch * args.split_epoch
@@ -226,7 +239,14 @@ class DiffusionNERTrainer(BaseTrainer):
             types_path, 
             self._tokenizer, 
             self._logger,
-            repeat_gt_entities = 60)
+            repeat_gt_entities = 60,
+            context_window = args.context_window,
+            dataset_cache_dir = args.dataset_cache_dir,
+            word_cache_size = args.word_cache_size,
+            parse_processes = args.parse_processes,
+            max_length = args.max_length,
+            window_stride = args.window_stride,
+            max_context_subwords = args.max_context_subwords)
             
         input_reader.read({dataset_label: dataset_path})
         self._log_datasets(input_reader)
@@ -258,7 +278,11 @@ class DiffusionNERTrainer(BaseTrainer):
         if isinstance(dataset, Dataset):
             if len(dataset) < 100000:
                 shuffle = True
-            if args.local_rank != -1:
+            if dataset.resampling_times is not None:
+                train_sampler = sampling.ResamplingSampler(dataset.sample_resampling_times, shuffle = shuffle, num_replicas = world_size, rank = args.local_rank, seed = max(args.seed, 0))
+                train_sampler.set_epoch(epoch)
+                shuffle = False
+            elif args.local_rank != -1:
                 train_sampler = torch.utils.data.distributed.DistributedSampler(dataset, num_replicas = world_size,rank = args.local_rank, shuffle = shuffle)
                 shuffle = False
 
@@ -269,7 +293,7 @@ class DiffusionNERTrainer(BaseTrainer):
         model.zero_grad()
 
         iteration = 0
-        total = math.ceil(dataset.document_count / (args.train_batch_size * world_size))
+        total = math.ceil(dataset.sample_count / (args.train_batch_size * world_size))
         for batch in tqdm(data_loader, total=total, desc='Train epoch %s' % epoch):
             if epoch == 0 and iteration == 0:
                 for k, v in batch.items():
@@ -351,7 +375,7 @@ class DiffusionNERTrainer(BaseTrainer):
             model.eval()
 
             # iterate batches
-            total = math.ceil(dataset.document_count / (args.eval_batch_size * world_size))
+            total = math.ceil(dataset.sample_count / (args.eval_batch_size * world_size))
             for batch in tqdm(data_loader, total=total, desc='Evaluate epoch %s' % epoch):
                 # move batch to selected device
                 batch = util.to_device(batch, self._device)
@@ -1,10 +1,14 @@
-from collections import OrderedDict
+from collections.abc import Sequence
+from functools import partial
 import json
 from typing import List
+import numpy as np
 from torch.utils import data
 from torch.utils.data import Dataset as TorchDataset
 from torch.utils.data import IterableDataset as IterableTorchDataset
 from diffusionner import sampling
+from diffusionner.jsonl_statistic import load_statistic
+from diffusionner.columns import Column, RaggedColumn
 import torch.distributed as dist
 
 class EntityType:
@@ -45,33 +49,243 @@ class EntityType:
         return self._identifier + "=" + self._verbose_name
 
 
+class DocumentStore:
+    """
+    The documents of a dataset with their tokens and entities, held in NumPy columns rather than in an object per token
+    and per entity. Documents, tokens and entities are views of its rows, created when they are accessed. The row of a
+    token, an entity or a document is its ID in the dataset, after the ids of the first rows (see following).
+    """
+
+    def __init__(self, entity_types = None):
+        # tokens
+        self.token_indices = Column(np.int32)
+        self.token_span_starts = Column(np.int32)
+        self.token_span_ends = Column(np.int32)
+        self.token_phrases = RaggedColumn(np.uint8)  # UTF-8
+
+        # entities, with the rows of their first and after their last token
+        self.entity_type_indices = Column(np.int32)
+        self.entity_token_starts = Column(np.int64)
+        self.entity_token_ends = Column(np.int64)
+
+        # documents, with the rows of their first and after their last token and entity
+        self.document_token_starts = Column(np.int64)
+        self.document_token_ends = Column(np.int64)
+        self.document_entity_starts = Column(np.int64)
+        self.document_entity_ends = Column(np.int64)
+        self.encodings = RaggedColumn(np.int32)
+        self.seg_encodings = RaggedColumn(np.int8)
+        # the start and end token of every window, one after the other, none if the document is not split
+        self.windows = RaggedColumn(np.int32)
+
+        self.first_token_id = 0
+        self.first_entity_id = 0
+        self.first_document_id = 0
+
+        self.entity_types = dict()
+        if entity_types is not None:
+            self.set_types(entity_types)
+
+    def set_types(self, entity_types):
+        # the entity types by index, as held in the columns
+        self.entity_types = {entity_type.index: entity_type for entity_type in entity_types.values()}
+
+    def add_token(self, index, span_start, span_end, phrase):
+        self.token_indices.append(index)
+        self.token_span_starts.append(span_start)
+        self.token_span_ends.append(span_end)
+        self.token_phrases.append(np.frombuffer(phrase.encode("utf-8"), dtype = np.uint8))
+        return len(self.token_indices) - 1
+
+    def add_entity(self, entity_type, tokens):
+        """
+        :param entity_type: the entity type
+        :param tokens: the tokens of the entity, consecutive rows of the store
+        :return: the row of the entity
+        """
+        self.entity_type_indices.append(entity_type.index)
+        start, end = self._rows(tokens, self.token_indices)
+        self.entity_token_starts.append(start)
+        self.entity_token_ends.append(end)
+        return len(self.entity_type_indices) - 1
+
+    def add_document(self, tokens, entities, encoding, seg_encoding, windows = None):
+        """
+        :param tokens: the tokens of the document, consecutive rows of the store
+        :param entities: the entities of the document, consecutive rows of the store
+        :param encoding: the subword ids of the document
+        :param seg_encoding: the segment ids of the subwords
+        :param windows: the start and end (exclusive) token of every window, None if the document is not split
+        :return: the row of the document
+        """
+        token_start, token_end = self._rows(tokens, self.token_indices)
+        entity_start, entity_end = self._rows(entities, self.entity_type_indices)
+        self.document_token_starts.append(token_start)
+        self.document_token_ends.append(token_end)
+        self.document_entity_starts.append(entity_start)
+        self.document_entity_ends.append(entity_end)
+        self.encodings.append(encoding)
+        self.seg_encodings.append(seg_encoding)
+        self.windows.append([position for window in windows or [] for position in window])
+        return len(self.document_token_starts) - 1
+
+    @staticmethod
+    def _rows(views, column):
+        if not views:
+            return len(column), len(column)
+        return views[0]._row, views[-1]._row + 1
+
+    def extend(self, other):
+        """
+        Appends all the rows of another store, the ones of the tokens of its ignored documents included, so that the
+        ids of the rows go on as if they had been added to this store.
+        """
+        self._extend(other, (0, len(other.token_indices)), (0, len(other.entity_type_indices)),
+                     (0, len(other.document_token_starts)))
+
+    def extract(self, document):
+        """
+        :param document: the row of a document
+        :return: a store holding only that document with its tokens and entities, which keep their ids
+        """
+        store = self._empty()
+        tokens = self.document_token_starts.item(document), self.document_token_ends.item(document)
+        entities = self.document_entity_starts.item(document), self.document_entity_ends.item(document)
+        store._extend(self, tokens, entities, (document, document + 1))
+        store.first_token_id = self.first_token_id + tokens[0]
+        store.first_entity_id = self.first_entity_id + entities[0]
+        store.first_document_id = self.first_document_id + document
+        return store
+
+    def following(self):
+        """
+        :return: an empty store whose ids follow the ones of this store, to parse the next documents of a stream
+        without holding the previous ones
+        """
+        store = self._empty()
+        store.first_token_id = self.first_token_id + len(self.token_indices)
+        store.first_entity_id = self.first_entity_id + len(self.entity_type_indices)
+        store.first_document_id = self.first_document_id + len(self.document_token_starts)
+        return store
+
+    def _empty(self):
+        store = DocumentStore()
+        store.entity_types = self.entity_types
+        return store
+
+    def _extend(self, other, tokens, entities, documents):
+        # the rows of the other store are moved after the rows of this one
+        token_shift = len(self.token_indices) - tokens[0]
+        entity_shift = len(self.entity_type_indices) - entities[0]
+
+        start, end = tokens
+        self.token_indices.extend(other.token_indices.values[start:end])
+        self.token_span_starts.extend(other.token_span_starts.values[start:end])
+        self.token_span_ends.extend(other.token_span_ends.values[start:end])
+        self.token_phrases.extend(other.token_phrases, start, end)
+
+        start, end = entities
+        self.entity_type_indices.extend(other.entity_type_indices.values[start:end])
+        self.entity_token_starts.extend(other.entity_token_starts.values[start:end] + token_shift)
+        self.entity_token_ends.extend(other.entity_token_ends.values[start:end] + token_shift)
+
+        start, end = documents
+        self.document_token_starts.extend(other.document_token_starts.values[start:end] + token_shift)
+        self.document_token_ends.extend(other.document_token_ends.values[start:end] + token_shift)
+        self.document_entity_starts.extend(other.document_entity_starts.values[start:end] + entity_shift)
+        self.document_entity_ends.extend(other.document_entity_ends.values[start:end] + entity_shift)
+        self.encodings.extend(other.encodings, start, end)
+        self.seg_encodings.extend(other.seg_encodings, start, end)
+        self.windows.extend(other.windows, start, end)
+
+    def token_phrase(self, token):
+        return self.token_phrases[token].tobytes().decode("utf-8")
+
+    def sample_counts(self):
+        """
+        :return: the number of samples of every document, as an array: its number of windows, or 1 if it is not split
+        """
+        return np.maximum(self.windows.lengths() // 2, 1)
+
+    @property
+    def entity_count(self):
+        return len(self.entity_type_indices)
+
+    @property
+    def document_count(self):
+        return len(self.document_token_starts)
+
+
+class StoreViews(Sequence):
+    """
+    The views of the rows of a DocumentStore, as a list which creates a view when it is accessed.
+    """
+
+    def __init__(self, view, count):
+        """
+        :param view: creates the view of a row
+        :param count: the number of rows
+        """
+        self._view = view
+        self._count = count
+
+    def __getitem__(self, index):
+        rows = range(self._count)[index]
+        if isinstance(index, slice):
+            return [self._view(row) for row in rows]
+        return self._view(rows)
+
+    def __iter__(self):
+        return map(self._view, range(self._count))
+
+    def __len__(self):
+        return self._count
+
+
 class Token:
-    def __init__(self, tid: int, index: int, span_start: int, span_end: int, phrase: str):
-        self._tid = tid  # ID within the corresponding dataset
-        self._index = index  # original token index in document
+    __slots__ = ("_store", "_row", "_offset", "_shift")
+
+    def __init__(self, store: DocumentStore, row: int, offset: int = 0, shift: int = 0):
+        """
+        A view of a token of a DocumentStore.
+        :param store: the store
+        :param row: the row of the token in the store
+        :param offset: the index of the first token of the window of the document the token is viewed in, 0 for the
+        whole document
+        :param shift: the number of subwords of the document which are not in the window
+        """
+        self._store = store
+        self._row = row
+        self._offset = offset
+        self._shift = shift
 
-        self._span_start = span_start  # start of token span in document (inclusive)
-        self._span_end = span_end  # end of token span in document (inclusive)
-        self._phrase = phrase
+    @property
+    def _tid(self):
+        # ID within the corresponding dataset
+        return self._store.first_token_id + self._row
 
     @property
     def index(self):
-        return self._index
+        # original token index in document
+        return self._store.token_indices.item(self._row) - self._offset
+
     @property
     def span_start(self):
-        return self._span_start
+        # start of token span in document (inclusive)
+        return self._store.token_span_starts.item(self._row) - self._shift
 
     @property
     def span_end(self):
-        return self._span_end
+        # end of token span in document (inclusive)
+        return self._store.token_span_ends.item(self._row) - self._shift
 
     @property
     def span(self):
-        return self._span_start, self._span_end
+        return self.span_start, self.span_end
 
     @property
     def phrase(self):
-        return self._phrase
+        return self._store.token_phrase(self._row)
 
 
     def __eq__(self, other):
@@ -83,10 +297,10 @@ class Token:
         return hash(self._tid)
 
     def __str__(self):
-        return self._phrase
+        return self.phrase
 
     def __repr__(self):
-        return self._phrase
+        return self.phrase
 
 
 class TokenSpan:
@@ -125,23 +339,42 @@ class TokenSpan:
 
 
 class Entity:
-    def __init__(self, eid: int, entity_type: EntityType, tokens: List[Token], phrase: str):
-        self._eid = eid  # ID within the corresponding dataset
+    __slots__ = ("_store", "_row", "_offset", "_shift")
 
-        self._entity_type = entity_type
+    def __init__(self, store: DocumentStore, row: int, offset: int = 0, shift: int = 0):
+        """
+        A view of an entity of a DocumentStore.
+        :param store: the store
+        :param row: the row of the entity in the store
+        :param offset: the offset of the tokens of the entity, see Token
+        :param shift: the shift of the tokens of the entity, see Token
+        """
+        self._store = store
+        self._row = row
+        self._offset = offset
+        self._shift = shift
 
-        self._tokens = tokens
-        self._phrase = phrase
+    @property
+    def _eid(self):
+        # ID within the corresponding dataset
+        return self._store.first_entity_id + self._row
+
+    @property
+    def _tokens(self) -> List[Token]:
+        store = self._store
+        return [Token(store, row, self._offset, self._shift)
+                for row in range(store.entity_token_starts.item(self._row), store.entity_token_ends.item(self._row))]
 
     def as_tuple(self):
-        return self.span_start, self.span_end, self._entity_type
+        return self.span_start, self.span_end, self.entity_type
 
     def as_tuple_token(self):
-        return self._tokens[0].index,self._tokens[-1].index, self._entity_type
+        tokens = self._tokens
+        return tokens[0].index, tokens[-1].index, self.entity_type
 
     @property
     def entity_type(self):
-        return self._entity_type
+        return self._store.entity_types[self._store.entity_type_indices.item(self._row)]
 
     @property
     def tokens(self):
@@ -161,11 +394,12 @@ class Entity:
 
     @property
     def span_token(self):
-        return self._tokens[0].index,self._tokens[-1].index
+        tokens = self._tokens
+        return tokens[0].index, tokens[-1].index
 
     @property
     def phrase(self):
-        return self._phrase
+        return " ".join([t.phrase for t in self._tokens])
 
     def __eq__(self, other):
         if isinstance(other, Entity):
@@ -176,76 +410,173 @@ class Entity:
         return hash(self._eid)
 
     def __str__(self):
-        return self._phrase + f" -> {self.span_token}-> {self.entity_type.identifier}"
+        return self.phrase + f" -> {self.span_token}-> {self.entity_type.identifier}"
 
     def __repr__(self) -> str:
         return str(self)
 
 
-class Document:
-    def __init__(self, doc_id: int, tokens: List[Token], entities: List[Entity],
-                 encoding: List[int], seg_encoding: List[int]):
-        self._doc_id = doc_id  # ID within the corresponding dataset
+class DocumentWindow:
+    def __init__(self, document, index):
+        """
+        The place of a window in the long document it was cut from. The windows of a document overlap, and every span
+        of tokens is owned by a single window, so that the predictions of the windows can be merged.
+        :param document: the document
+        :param index: the index of the window in the windows of the document
+        """
+        self._document = document
+        self._index = index
+        self._windows = document.windows
+        self._start = self._windows[index][0]
 
-        self._tokens = tokens
-        self._entities = entities
+    @property
+    def document(self):
+        return self._document
 
-        # byte-pair document encoding including special tokens ([CLS] and [SEP])
-        self._encoding = encoding
-        self._seg_encoding = seg_encoding
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def start(self):
+        return self._start
+
+    @property
+    def end(self):
+        return self._windows[self._index][1]
+
+    @property
+    def is_last(self):
+        return self._index == len(self._windows) - 1
+
+    def owns(self, start, end):
+        """
+        :param start: the first token of a span, as an index in the window
+        :param end: the last token of the span (inclusive)
+        :return: whether the span is owned by the window: of the windows which hold the span, the one it is the furthest
+        in from the edges, the first one on a tie
+        """
+        start, end = start + self._start, end + self._start
+        margins = [min(start - window_start, window_end - 1 - end) for window_start, window_end in self._windows]
+        return margins[self._index] >= 0 and margins.index(max(margins)) == self._index
+
+
+class Document:
+    __slots__ = ("_store", "_row", "_window", "_token_start", "_token_end", "_offset", "_shift")
+
+    def __init__(self, store: DocumentStore, row: int, window: DocumentWindow = None):
+        """
+        A view of a document of a DocumentStore, or of one of its windows. The tokens and the encoding of a window are
+        cut from those of the document, without its context, and it has the entities which lie in it.
+        :param store: the store
+        :param row: the row of the document in the store
+        :param window: the window of the document which is viewed, None for the whole document
+        """
+        self._store = store
+        self._row = row
+        self._window = window
+
+        self._token_start = store.document_token_starts.item(row)
+        self._token_end = store.document_token_ends.item(row)
+        self._offset = 0
+        self._shift = 0
+        if window is not None:
+            self._offset = window.start
+            self._token_start, self._token_end = self._token_start + window.start, self._token_start + window.end
+            # the subwords of the tokens follow [CLS]
+            self._shift = store.token_span_starts.item(self._token_start) - 1
+
+    def sample_document(self, index):
+        """
+        :param index: the index of a sample of the document, below sample_count
+        :return: the document itself, or its window of that index
+        """
+        if self.windows is None:
+            return self
+        return Document(self._store, self._row, DocumentWindow(self, index))
+
+    def sample_documents(self):
+        return [self.sample_document(i) for i in range(self.sample_count)]
+
+    @property
+    def windows(self):
+        # start and end (exclusive) tokens of the windows sampled instead of the document when it is too long
+        if self._window is not None:
+            return None
+        windows = self._store.windows[self._row].tolist()
+        return list(zip(windows[0::2], windows[1::2])) or None
+
+    @property
+    def window(self):
+        return self._window
+
+    @property
+    def sample_count(self):
+        windows = self.windows
+        return 1 if windows is None else len(windows)
 
     @property
     def doc_id(self):
-        return self._doc_id
+        # ID within the corresponding dataset
+        return self._store.first_document_id + self._row
 
     @property
     def entities(self):
-        return self._entities
+        store = self._store
+        rows = range(store.document_entity_starts.item(self._row), store.document_entity_ends.item(self._row))
+        if self._window is not None:
+            rows = [row for row in rows if self._token_start <= store.entity_token_starts.item(row)
+                    and store.entity_token_ends.item(row) <= self._token_end]
+        return [Entity(store, row, self._offset, self._shift) for row in rows]
 
     @property
     def tokens(self):
-        return TokenSpan(self._tokens)
+        return TokenSpan([Token(self._store, row, self._offset, self._shift)
+                          for row in range(self._token_start, self._token_end)])
 
     @property
     def encoding(self):
-        return self._encoding
-
-    @property
-    def char_encoding(self):
-        return self._char_encoding
+        # byte-pair document encoding including special tokens ([CLS] and [SEP])
+        return self._cut(self._store.encodings[self._row])
 
     @property
     def seg_encoding(self):
-        return self._seg_encoding
-
-    @encoding.setter
-    def encoding(self, value):
-        self._encoding = value
+        return self._cut(self._store.seg_encodings[self._row])
 
-    @char_encoding.setter
-    def char_encoding(self, value):
-        self._char_encoding = value
-
-    @seg_encoding.setter
-    def seg_encoding(self, value):
-        self._seg_encoding = value
+    def _cut(self, encoding):
+        # the encoding of a window is [CLS] followed by the subwords of its tokens
+        if self._window is None:
+            return encoding.tolist()
+        first = self._store.token_span_starts.item(self._token_start)
+        last = self._store.token_span_ends.item(self._token_end - 1)
+        return encoding[:1].tolist() + encoding[first:last + 1].tolist()
 
     def __str__(self) -> str:
         raw_document = str(self.tokens)
         raw_entities = str(self.entities)
-        
+
         return raw_document + " => " + raw_entities
-    
+
     def __repr__(self) -> str:
         return str(self)
 
     def __eq__(self, other):
         if isinstance(other, Document):
-            return self._doc_id == other._doc_id
+            return self.doc_id == other.doc_id
         return False
 
     def __hash__(self):
-        return hash(self._doc_id)
+        return hash(self.doc_id)
+
+    def __reduce__(self):
+        # pickled with its own rows only, rather than with all the documents of its store
+        window = None if self._window is None else self._window.index
+        return _load_document, (self._store.extract(self._row), window)
+
+
+def _load_document(store, window):
+    document = Document(store, 0)
+    return document if window is None else document.sample_document(window)
 
 
 class BatchIterator:
@@ -277,6 +608,8 @@ class BatchIterator:
 class Dataset(TorchDataset):
     TRAIN_MODE = 'train'
     EVAL_MODE = 'eval'
+    # the attributes set by parsing the documents, cached by the input reader
+    PARSE_STATE = ['_store', 'resampling_times']
 
     def __init__(self, label, dataset_path, entity_types, tokenizer = None, repeat_gt_entities = None):
         self._label = label
@@ -287,41 +620,62 @@ class Dataset(TorchDataset):
 
         self._repeat_gt_entities = repeat_gt_entities
 
-        self._documents = OrderedDict()
-        self._entities = OrderedDict()
+        # how many times every document is sampled in an epoch, set by the input reader
+        self.resampling_times = None
 
-        # current ids
-        self._doc_id = 0
-        self._eid = 0
-        self._tid = 0
-        self._iid = 0
+        self._store = DocumentStore(entity_types)
+        # the document row and the index in the document of every sample, see _get_samples
+        self._samples = None
 
     def iterate_documents(self, batch_size, order=None, truncate=False):
         return BatchIterator(self.documents, batch_size, order=order, truncate=truncate)
 
+    def get_parse_state(self):
+        return {name: getattr(self, name) for name in self.PARSE_STATE}
+
+    def set_parse_state(self, state):
+        for name in self.PARSE_STATE:
+            setattr(self, name, state[name])
+        self._samples = None
+        # the entities refer to the entity types of the input reader rather than to their copies
+        self._store.set_types(self._entity_types)
+
+    def add_store(self, store):
+        """
+        Adds the documents parsed into the store of another dataset, renumbering them, their tokens and their entities
+        as if they had been parsed into this one.
+        :param store: the store
+        """
+        self._store.extend(store)
+        self._samples = None
+
     def create_token(self, idx, span_start, span_end, phrase) -> Token:
-        token = Token(self._tid, idx, span_start, span_end, phrase)
-        self._tid += 1
-        return token
+        return Token(self._store, self._store.add_token(idx, span_start, span_end, phrase))
 
-    def create_document(self, tokens, entity_mentions, doc_encoding, seg_encoding ) -> Document:
-        document = Document(self._doc_id, tokens, entity_mentions, doc_encoding, seg_encoding)
-        self._documents[self._doc_id] = document
-        self._doc_id += 1
+    def create_document(self, tokens, entity_mentions, doc_encoding, seg_encoding, windows = None) -> Document:
+        document = Document(self._store, self._store.add_document(tokens, entity_mentions, doc_encoding, seg_encoding, windows))
+        self._samples = None
 
         return document
 
     def create_entity(self, entity_type, tokens, phrase) -> Entity:
-        mention = Entity(self._eid, entity_type, tokens, phrase)
-        self._entities[self._eid] = mention
-        self._eid += 1
-        return mention
+        # the phrase is joined from the tokens when it is accessed
+        return Entity(self._store, self._store.add_entity(entity_type, tokens))
+
+    def _get_samples(self):
+        if self._samples is None:
+            counts = self._store.sample_counts()
+            documents = np.repeat(np.arange(len(counts)), counts)
+            indices = np.arange(len(documents)) - np.repeat(np.cumsum(counts) - counts, counts)
+            self._samples = documents, indices
+        return self._samples
 
     def __len__(self):
-        return len(self._documents)
+        return len(self._get_samples()[0])
 
     def __getitem__(self, index: int):
-        doc = self._documents[index]
+        documents, indices = self._get_samples()
+        doc = Document(self._store, documents.item(index)).sample_document(indices.item(index))
 
         if self._mode == Dataset.TRAIN_MODE:
             return sampling.create_train_sample(doc, self._repeat_gt_entities)
@@ -339,60 +693,71 @@ class Dataset(TorchDataset):
     def input_reader(self):
         return self._input_reader
 
+    @property
+    def store(self):
+        return self._store
+
     @property
     def documents(self):
-        return list(self._documents.values())
+        return StoreViews(partial(Document, self._store), self._store.document_count)
 
     @property
     def entities(self):
-        return list(self._entities.values())
+        return StoreViews(partial(Entity, self._store), self._store.entity_count)
 
     @property
     def document_count(self):
-        return len(self._documents)
+        return self._store.document_count
+
+    @property
+    def sample_resampling_times(self):
+        # how many times every sample is drawn in an epoch, the windows of a document as many times as the document
+        if self.resampling_times is None:
+            return None
+        return np.repeat(self.resampling_times, self._store.sample_counts()).tolist()
+
+    @property
+    def sample_count(self):
+        if self.resampling_times is None:
+            return len(self)
+        return sum(self.sample_resampling_times)
 
     @property
     def entity_count(self):
-        return len(self._entities)
+        return self._store.entity_count
 
 class DistributedIterableDataset(IterableTorchDataset):
     TRAIN_MODE = 'train'
     EVAL_MODE = 'eval'
 
-    def __init__(self, label, path, entity_types, input_reader, tokenizer = None, repeat_gt_entities = None):
+    def __init__(self, label, path, entity_types, input_reader, tokenizer = None, repeat_gt_entities = None, resampling_times = None):
         self._label = label
         self._path = path
         self._entity_types = entity_types
         self._mode = Dataset.TRAIN_MODE
         self._tokenizer = tokenizer
         self._input_reader = input_reader
-        self._local_rank = dist.get_rank()
-        self._world_size = dist.get_world_size()
+        self._local_rank = dist.get_rank() if dist.is_initialized() else -1
+        self._world_size = dist.get_world_size() if dist.is_initialized() else 1
         # print(self._local_rank, self._world_size)
         
         self._repeat_gt_entities = repeat_gt_entities
+        self._resampling_times = resampling_times
 
-        self.statistic = json.load(open(path.split(".")[0] + "_statistic.json"))
+        # built by a first pass over the file if it was not written with it
+        self.statistic = load_statistic(path)
 
-        # current ids
-        self._doc_id = 0
-        self._eid = 0
-        self._tid = 0
+        # holds the document being parsed
+        self._store = DocumentStore(entity_types)
 
     def create_token(self, idx, span_start, span_end, phrase) -> Token:
-        token = Token(self._tid, idx, span_start, span_end, phrase)
-        self._tid += 1
-        return token
+        return Token(self._store, self._store.add_token(idx, span_start, span_end, phrase))
 
-    def create_document(self, tokens, entity_mentions, doc_encoding, seg_encoding) -> Document:
-        document = Document(self._doc_id, tokens, entity_mentions, doc_encoding, seg_encoding)
-        self._doc_id += 1
-        return document
+    def create_document(self, tokens, entity_mentions, doc_encoding, seg_encoding, windows = None) -> Document:
+        return Document(self._store, self._store.add_document(tokens, entity_mentions, doc_encoding, seg_encoding, windows))
 
     def create_entity(self, entity_type, tokens, phrase) -> Entity:
-        mention = Entity(self._eid, entity_type, tokens, phrase)
-        self._eid += 1
-        return mention
+        return Entity(self._store, self._store.add_entity(entity_type, tokens))
 
     def parse_doc(self, path):
         inx = 0
@@ -409,15 +774,26 @@ class DistributedIterableDataset(IterableTorchDataset):
             offset = self._local_rank*num_workers + worker_id
             mod = self._world_size * num_workers
         with open(self._path, encoding="utf8") as rf:
-            for line in rf:
+            lines = rf
+            if self._input_reader.context_window is not None:
+                # every line is read to build the context of its neighbours
+                lines = self._input_reader._iter_with_context(map(json.loads, rf))
+            for line in lines:
                 if inx % mod == offset:
-                    doc = json.loads(line)
+                    doc = json.loads(line) if isinstance(line, str) else line
+                    # the previous documents are not held, the ids going on from theirs
+                    self._store = self._store.following()
                     doc = self._input_reader._parse_document(doc, self)
                     if doc is not None:
                         if self._mode == Dataset.TRAIN_MODE:
-                            yield sampling.create_train_sample(doc, self._repeat_gt_entities)
+                            # the document is parsed once and sampled as many times as it is resampled
+                            resampling_time = 1 if self._resampling_times is None else self._resampling_times[inx]
+                            for _ in range(resampling_time):
+                                for sample_doc in doc.sample_documents():
+                                    yield sampling.create_train_sample(sample_doc, self._repeat_gt_entities)
                         else:
-                            yield sampling.create_eval_sample(doc)
+                            for sample_doc in doc.sample_documents():
+                                yield sampling.create_eval_sample(sample_doc)
                 inx += 1 # maybe imblance
 
 
@@ -445,6 +821,12 @@ class DistributedIterableDataset(IterableTorchDataset):
     def document_count(self):
         return self.statistic["document_count"]
 
+    @property
+    def sample_count(self):
+        if self._resampling_times is None:
+            return self.document_count
+        return sum(self._resampling_times)
+
     @property
     def entity_count(self):
         return self.statistic["entity_count"]
\ No newline at end of file
@@ -43,6 +43,8 @@ class Evaluator:
         self._pred_entities = []  # prediction
         self._raw_preds = []
         self._raw_raw_preds = []
+        # predictions of the windows of the long document being evaluated, merged once its last window is evaluated
+        self._window_pred_entities = []
 
         self._pseudo_entity_type = EntityType('Entity', 1, 'Entity', 'Entity')  # for span only evaluation
         self._convert_gt(self._dataset.documents)
@@ -115,6 +117,11 @@ class Evaluator:
 
 
             sample_pred_entities = self._convert_pred_entities(valid_entity_types, valid_entity_spans, valid_entity_scores, valid_left_scores, valid_right_scores, valid_type_scores, doc)
+            if doc.window is not None:
+                self._window_pred_entities += sample_pred_entities
+                if not doc.window.is_last:
+                    continue
+                sample_pred_entities, self._window_pred_entities = self._window_pred_entities, []
             sample_pred_entities = sorted(sample_pred_entities, key=lambda x:x[3], reverse=True)
 
             if self._no_overlapping:
@@ -287,12 +294,22 @@ class Evaluator:
     def _convert_pred_entities(self, pred_types: torch.tensor, pred_spans: torch.tensor, pred_scores: torch.tensor,  left_scores, right_scores, type_scores, doc):
         converted_preds = []
         
-        decode_entity = dict(tokens=[t.phrase for t in doc.tokens], entities=[], org_id= doc.doc_id)
+        # the predictions of a window are moved to its document, the window keeping the spans it owns
+        window = doc.window
+        if window is not None:
+            doc = window.document
+        if window is None or window.index == 0:
+            self._raw_preds.append(dict(tokens=[t.phrase for t in doc.tokens], entities=[], org_id= doc.doc_id))
+        decode_entity = self._raw_preds[-1]
         for i in range(pred_types.shape[0]):
             label_idx = pred_types[i].item()
             entity_type = self._input_reader.get_entity_type(label_idx)
 
             start, end = pred_spans[i].tolist()
+            if window is not None:
+                if not window.owns(start, end):
+                    continue
+                start, end = start + window.start, end + window.start
             entity_score = pred_scores[i].item()
             cls_score = type_scores[i].item()
             left_score = left_scores[i].item()
@@ -301,7 +318,6 @@ class Evaluator:
             converted_pred = (start, end, entity_type, entity_score)
             converted_preds.append(converted_pred)
             decode_entity["entities"].append({"start": start, "end": end, "entity_type":entity_type.identifier, "cls_score": round(cls_score, 2), "left_score": round(left_score, 2), "right_score": round(right_score, 2), "entity_score": round(entity_score, 2)})
-        self._raw_preds.append(decode_entity)
         return converted_preds
 
     def _remove_duplicate(self, entities):
@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+from array import array
+from collections import Counter
+
+import numpy as np
+
+
+def statistic_path(path):
+    return os.path.splitext(path)[0] + "_statistic.json"
+
+
+def offsets_path(path):
+    return os.path.splitext(path)[0] + "_offsets.npy"
+
+
+def file_signature(path):
+    """
+    :param path: the path of the JSONL file
+    :return: its size and modification time, which tell whether its statistic is still the one of its content
+    """
+    stat = os.stat(path)
+    return {"file_size": stat.st_size, "file_mtime_ns": stat.st_mtime_ns}
+
+
+def build_statistic(path, tokenizer = None):
+    """
+    Makes one pass over a JSONL file and writes next to it the "<name>_statistic.json" file read by
+    DistributedIterableDataset: the document and entity counts, the entity count of every type, the size and
+    modification time of the file and, given a tokenizer, the histogram of the subword lengths of the documents (context
+    included, special tokens excluded). The byte offset of every line, followed by the size of the file, is written to
+    "<name>_offsets.npy".
+    :param path: the path of the JSONL file
+    :param tokenizer: the tokenizer of the model, to compute the subword lengths
+    :return: the statistic
+    """
+    # taken before the pass, a file changed meanwhile is seen as changed by the next load
+    signature = file_signature(path)
+    offsets = array("q", [0])
+    entity_type_count = Counter()
+    subword_lengths = Counter()
+    encodings = dict()
+
+    def subword_count(words):
+        count = 0
+        for word in words or []:
+            if word not in encodings:
+                encodings[word] = len(tokenizer.encode(word, add_special_tokens=False))
+            count += encodings[word]
+        return count
+
+    with open(path, "rb") as rf:
+        for line in rf:
+            offsets.append(offsets[-1] + len(line))
+            doc = json.loads(line)
+            entity_type_count.update(entity["type"] for entity in doc["entities"])
+            if tokenizer is not None:
+                subword_lengths[subword_count(doc.get("ltokens")) + subword_count(doc["tokens"]) + subword_count(doc.get("rtokens"))] += 1
+
+    statistic = {
+        "document_count": len(offsets) - 1,
+        "entity_count": sum(entity_type_count.values()),
+        "entity_type_count": dict(entity_type_count),
+        **signature,
+    }
+    if tokenizer is not None:
+        statistic["tokenizer"] = tokenizer.name_or_path
+        statistic["subword_length_histogram"] = [subword_lengths[length] for length in range(max(subword_lengths, default = -1) + 1)]
+
+    # written under a name unique to this process first, the ranks of a distributed run may build the same statistic
+    # at the same time
+    temporary_path = f"{offsets_path(path)}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as f:
+        np.save(f, np.frombuffer(offsets, dtype=np.int64))
+    os.replace(temporary_path, offsets_path(path))
+    temporary_path = f"{statistic_path(path)}.{os.getpid()}.tmp"
+    with open(temporary_path, "w") as f:
+        json.dump(statistic, f)
+    os.replace(temporary_path, statistic_path(path))
+    return statistic
+
+
+def load_statistic(path):
+    """
+    :param path: the path of the JSONL file
+    :return: its statistic, built on first use and again once the file changed
+    """
+    try:
+        with open(statistic_path(path)) as f:
+            statistic = json.load(f)
+    except FileNotFoundError:
+        statistic = None
+    # a statistic without the size and modification time of the file may be the one of a previous content
+    if statistic is None or any(statistic.get(key) != value for key, value in file_signature(path).items()):
+        statistic = build_statistic(path)
+    return statistic
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", "-f", type=str, nargs="+", required=True, help="JSONL files")
+    parser.add_argument("--tokenizer_path", type=str, default=None,
+                        help="Tokenizer of the model, to compute the histogram of the subword lengths")
+    args = parser.parse_args()
+
+    tokenizer = None
+    if args.tokenizer_path is not None:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer_path)
+    for path in args.files:
+        statistic = build_statistic(path, tokenizer)
+        print(path, statistic["document_count"], statistic["entity_count"])
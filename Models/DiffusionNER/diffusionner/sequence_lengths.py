@@ -0,0 +1,48 @@
+class SequenceLengths:
+    """
+    Compares the lengths of the encodings of the documents with their full context and with the context kept within
+    the context budget of the input reader. Only the documents sampled whole count.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.full_total = 0
+        self.kept_total = 0
+        self.full_max = 0
+        self.kept_max = 0
+        # sums of the squared lengths, the cost of attention growing with the square of the length
+        self.full_squares = 0
+        self.kept_squares = 0
+
+    def add(self, full_length, kept_length):
+        """
+        :param full_length: the number of subwords of a document with its full context
+        :param kept_length: the number of subwords of the document with its kept context
+        """
+        self.count += 1
+        self.full_total += full_length
+        self.kept_total += kept_length
+        self.full_max = max(self.full_max, full_length)
+        self.kept_max = max(self.kept_max, kept_length)
+        self.full_squares += full_length * full_length
+        self.kept_squares += kept_length * kept_length
+
+    def update(self, other):
+        """
+        Adds the lengths counted by another instance, such as the one of a parsing process.
+        """
+        self.count += other.count
+        self.full_total += other.full_total
+        self.kept_total += other.kept_total
+        self.full_max = max(self.full_max, other.full_max)
+        self.kept_max = max(self.kept_max, other.kept_max)
+        self.full_squares += other.full_squares
+        self.kept_squares += other.kept_squares
+
+    def __str__(self):
+        if self.count == 0:
+            return "no document"
+        return (f"{self.count} documents, mean length {self.full_total / self.count:.1f} -> "
+                f"{self.kept_total / self.count:.1f} subwords, max length {self.full_max} -> {self.kept_max}, "
+                f"{1 - self.kept_total / self.full_total:.2%} of the subwords and "
+                f"{1 - self.kept_squares / self.full_squares:.2%} of the attention cost saved")
@@ -0,0 +1,81 @@
+import json
+import os
+
+import numpy as np
+
+from diffusionner.dataset_cache import tokenizer_identity
+
+TOKENIZED_CORPUS_FORMAT = 3
+
+
+class TokenizedCorpus:
+    ARRAYS = ["subwords", "word_subword_offsets", "word_char_offsets", "words", "pos", "documents", "document_ids",
+              "entities", "document_entities", "relations", "document_relations"]
+
+    def __init__(self, path):
+        """
+        Memory-mapped corpus written by Data_preprocessing/wojood_preprocess_for_piqn/pretokenize.py, holding the
+        documents of a manifest along with the subwords of every word. The arrays are only read when a document is
+        accessed, which gives the same document as the manifest, with the subwords of its words, without running the
+        tokenizer.
+        :param path: the path of the ".tokenized" directory
+        """
+        self._path = path
+        with open(os.path.join(path, "index.json"), encoding="utf-8") as f:
+            self._index = json.load(f)
+        if self._index["format"] != TOKENIZED_CORPUS_FORMAT:
+            raise ValueError(f"Unsupported tokenized corpus format {self._index['format']} in {path}")
+
+        self._arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in self.ARRAYS}
+
+    def check_tokenizer(self, tokenizer):
+        # the class, vocabulary and options of the tokenizer, a tokenizer with the same vocabulary size and special
+        # tokens may still give other subwords
+        if self._index["tokenizer_identity"] != tokenizer_identity(tokenizer):
+            raise ValueError(f"{self._path} was tokenized with {self._index['tokenizer']}, "
+                             f"which does not match the tokenizer of the model")
+
+    def _words(self, start, end):
+        offsets = self._arrays["word_char_offsets"][start:end + 1].tolist()
+        data = self._arrays["words"][offsets[0]:offsets[-1]].tobytes()
+        return [data[offsets[i] - offsets[0]:offsets[i + 1] - offsets[0]].decode("utf-8") for i in range(end - start)]
+
+    def _subwords(self, start, end):
+        offsets = self._arrays["word_subword_offsets"][start:end + 1].tolist()
+        subwords = self._arrays["subwords"][offsets[0]:offsets[-1]].tolist()
+        return [subwords[offsets[i] - offsets[0]:offsets[i + 1] - offsets[0]] for i in range(end - start)]
+
+    def __getitem__(self, index):
+        """
+        :param index: the index of the document
+        :return: the document as in the manifest. Its "subwords" are the encodings of its left context words, tokens
+        and right context words.
+        """
+        ltokens_start, tokens_start, rtokens_start, rtokens_end = self._arrays["documents"][index].tolist()
+        entity_start, entity_end = self._arrays["document_entities"][index:index + 2].tolist()
+        relation_start, relation_end = self._arrays["document_relations"][index:index + 2].tolist()
+        entity_types = self._index["entity_types"]
+        relation_types = self._index["relation_types"]
+
+        doc = dict()
+        doc["tokens"] = self._words(tokens_start, rtokens_start)
+        doc["ltokens"] = self._words(ltokens_start, tokens_start)
+        doc["rtokens"] = self._words(rtokens_start, rtokens_end)
+        doc["entities"] = [{"start": start, "end": end, "type": entity_types[entity_type]} for start, end, entity_type
+                           in self._arrays["entities"][entity_start:entity_end].tolist()]
+        doc["relations"] = [{"head": head, "tail": tail, "type": relation_types[relation_type]} for head, tail, relation_type
+                            in self._arrays["relations"][relation_start:relation_end].tolist()]
+        pos = self._arrays["pos"][tokens_start:rtokens_start].tolist()
+        if pos and min(pos) >= 0:
+            doc["pos"] = [self._index["pos"][p] for p in pos]
+        doc["org_id"] = self._index["org_ids"][int(self._arrays["document_ids"][index])]
+        doc["subwords"] = (self._subwords(ltokens_start, tokens_start), self._subwords(tokens_start, rtokens_start),
+                           self._subwords(rtokens_start, rtokens_end))
+        return doc
+
+    def __len__(self):
+        return self._index["document_count"]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
@@ -0,0 +1,66 @@
+from collections import OrderedDict
+
+
+class WordCache:
+    """
+    A bounded cache of the encodings of words, which drops the least recently used word when it is full. It counts its
+    hits and misses so that its size can be chosen for a corpus.
+    """
+
+    def __init__(self, max_size = 65536):
+        """
+        :param max_size: the number of words kept, 0 to disable the cache
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._encodings = OrderedDict()
+
+    def encode(self, words, encode_words):
+        """
+        Looks up the distinct words, a word repeated in words counting as a single hit or miss.
+        :param words: the words to encode
+        :param encode_words: encodes a list of words, called once with the words which are not cached
+        :return: the encodings of the words, which must not be modified
+        """
+        encodings = dict.fromkeys(words)
+        missing_words = []
+        for word in encodings:
+            encoding = self._encodings.get(word)
+            if encoding is not None:
+                self._encodings.move_to_end(word)
+                encodings[word] = encoding
+            else:
+                missing_words.append(word)
+        self.misses += len(missing_words)
+        self.hits += len(encodings) - len(missing_words)
+
+        if missing_words:
+            for word, encoding in zip(missing_words, encode_words(missing_words)):
+                encodings[word] = encoding
+                self._add(word, encoding)
+        return [encodings[word] for word in words]
+
+    def _add(self, word, encoding):
+        if self.max_size <= 0:
+            return
+        self._encodings[word] = encoding
+        if len(self._encodings) > self.max_size:
+            self._encodings.popitem(last = False)
+
+    def clear(self):
+        self._encodings.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self._encodings)
+
+    def __str__(self):
+        return (f"{len(self)}/{self.max_size} words, {self.hits} hits, {self.misses} misses, "
+                f"hit rate {self.hit_rate:.2%}")
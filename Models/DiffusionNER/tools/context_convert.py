@@ -1,36 +1,70 @@
 import argparse
 import json
-from collections import defaultdict
+from collections import deque
 import os
 
-parser = argparse.ArgumentParser()
-
-parser.add_argument("--dataset", type=str, default="conll03")
-parser.add_argument("--window", type=int, default=2)
-args = parser.parse_args()
-
-splits = ["train_dev", "test", "dev", "train"]
-
-for split in splits:
-    if not os.path.exists(f"{args.dataset}_{split}.json"):
-        continue
-    rf = open(f"{args.dataset}_{split}.json", "r")
-    datasets = json.load(rf)
-    n_datasets = []
-    for i, exp in enumerate(datasets):
-        ltokens = []
-        rtokens = []
-        k = args.window - 1
-        while k >= 0:
-            if i > k and exp["orig_id"] == datasets[i-k-1]["orig_id"]:
-                ltokens.extend(datasets[i-k-1]["tokens"])
-            k -= 1
-        k = 1
-        while k < args.window + 1:
-            if i < len(datasets)-k and  exp["orig_id"] == datasets[i+k]["orig_id"]:
-                rtokens.extend(datasets[i+k]["tokens"])
-            k += 1
-        exp["ltokens"] = ltokens
-        exp["rtokens"] = rtokens
-        n_datasets.append(exp)
-    json.dump(n_datasets, open(f"{args.dataset}_{split}_context@{args.window}.json", "w"))
+from ner2json import ManifestWriter
+
+
+def iter_samples(path):
+    if path.endswith(".jsonl"):
+        with open(path, "r") as rf:
+            for line in rf:
+                yield json.loads(line)
+    else:
+        yield from json.load(open(path, "r"))
+
+
+def iter_with_context(samples, window):
+    """
+    Sets the ltokens and rtokens of every sample to the tokens of the window samples before and after it which have
+    the same orig_id, keeping only the samples within the window in memory.
+    :param samples: the samples of a split, in order
+    :param window: the number of samples on each side
+    :return: a generator over the samples with their context
+    """
+    previous_samples = deque(maxlen=window)
+    next_samples = deque()
+
+    def with_context(exp):
+        exp["ltokens"] = [token for neighbour in previous_samples if neighbour["orig_id"] == exp["orig_id"]
+                          for token in neighbour["tokens"]]
+        exp["rtokens"] = [token for neighbour in next_samples if neighbour["orig_id"] == exp["orig_id"]
+                          for token in neighbour["tokens"]]
+        previous_samples.append(exp)
+        return exp
+
+    for exp in samples:
+        next_samples.append(exp)
+        if len(next_samples) > window:
+            yield with_context(next_samples.popleft())
+
+    while next_samples:
+        yield with_context(next_samples.popleft())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("--dataset", type=str, default="conll03")
+    parser.add_argument("--window", type=int, default=2)
+    args = parser.parse_args()
+
+    splits = ["train_dev", "test", "dev", "train"]
+
+    for split in splits:
+        # a JSONL split, as written by ner2json.py --jsonl, is read line by line and written as JSONL
+        for extension in ["jsonl", "json"]:
+            path = f"{args.dataset}_{split}.{extension}"
+            if os.path.exists(path):
+                break
+        else:
+            continue
+        writer = ManifestWriter(f"{args.dataset}_{split}_context@{args.window}.{extension}", extension == "jsonl")
+        for exp in iter_with_context(iter_samples(path), args.window):
+            writer.write(exp)
+        writer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,59 +1,137 @@
+import argparse
 import json
+import os
 
-file_type = ["train", "dev", "test"]
-wf_type = open(f"conll03_types.json","w")
-types={"entities":{},"relations":{}}
-
-for ty in  file_type:
-    rf = open(f"{ty}.txt")
-    wf = open(f"conll03_{ty}.json","w")
-    
-    datasets = []
-    sample = {"tokens": [], "entities": [], "relations": []}
-    idx = 0
+
+def iter_sentences(path, sep, token_column, tag_column, label_sep, docstart):
+    """
+    Reads a column-formatted NER file one sentence at a time, sentences being separated by blank lines.
+    :return: a generator over (document id, tokens, labels of every token) tuples
+    """
     doc_id = 0
-    start = end = None
-    entity_type = None
+    tokens = []
+    labels = []
+    with open(path, encoding="utf-8") as rf:
+        for line in rf:
+            line = line.strip()
+            if line:
+                fields = list(filter(lambda x: x, line.split(sep)))
+                if fields[token_column] == docstart:
+                    doc_id += 1
+                    continue
+                tokens.append(fields[token_column])
+                tags = fields[tag_column]
+                labels.append(tags.split(label_sep) if label_sep else [tags])
+            elif tokens:
+                yield str(doc_id), tokens, labels
+                tokens = []
+                labels = []
+    if tokens:
+        yield str(doc_id), tokens, labels
 
-    for line in rf:
-        line = line.strip()
-        if line == "-DOCSTART- -X- -X- O": # sep string
-            doc_id += 1
-            continue
-        if line:
-            last = idx
-            fields = list(filter(lambda x:x,line.split(" ")))
-            sample["tokens"].append(fields[0])
-            sample["orig_id"] = str(doc_id)
-            if fields[3].startswith("B-"):
-                if start!=None and end!=None and end == idx:
-                    sample["entities"].append({"start":start,"end":end,"type":entity_type})
-                start = idx
-                end = idx + 1
-                entity_type = fields[3][2:]
-                if entity_type not in types["entities"]:
-                    types["entities"][entity_type]={"verbose": entity_type,"short": entity_type}
-            if fields[3].startswith("I-"):
-                end = end + 1
-            if fields[3]=="O" and start!=None:
-                sample["entities"].append({"start":start,"end":end,"type":entity_type})
-                start = end = entity_type = None
-            idx += 1
+
+def decode_entities(labels):
+    """
+    Decodes the entities of a sentence from the IOB labels of its tokens, a token having several labels when entities
+    are nested. An entity of type X goes on as long as the next tokens have an I-X label, and an I-X label which does
+    not continue an entity starts one.
+    :param labels: the labels of every token
+    :return: the entities, sorted by start
+    """
+    entities = []
+    open_entities = dict()
+
+    for idx, token_labels in enumerate(labels):
+        continued = dict()
+        for label in token_labels:
+            if label.startswith("I-") and label[2:] in open_entities:
+                continued[label[2:]] = open_entities[label[2:]]
+        for entity_type, entity_indices in continued.items():
+            for entity_index in entity_indices:
+                entities[entity_index]["end"] = idx + 1
+
+        for label in token_labels:
+            if label.startswith("B-") or (label.startswith("I-") and label[2:] not in open_entities):
+                entities.append({"start": idx, "end": idx + 1, "type": label[2:]})
+                continued.setdefault(label[2:], []).append(len(entities) - 1)
+        open_entities = continued
+
+    return entities
+
+
+class ManifestWriter:
+    def __init__(self, path, jsonl):
+        """
+        Writes the samples one at a time, as a JSON array identical to json.dump's or as JSONL along with the
+        "_statistic.json" file of the JSONL readers.
+        """
+        self.path = path
+        self.jsonl = jsonl
+        self.document_count = 0
+        self.entity_count = 0
+        self._file = open(path, "w")
+        if not jsonl:
+            self._file.write("[")
+
+    def write(self, sample):
+        if self.jsonl:
+            self._file.write(json.dumps(sample) + "\n")
         else:
-            if start!=None:
-                sample["entities"].append({"start":start,"end":end,"type":entity_type})
-                
-            idx = 0
-            start = end = None
-            entity_type = None
-            if len(sample["tokens"]):
-                datasets.append(sample)
-            
-            sample = {"tokens": [], "entities": [], "relations": []}
-    if len(sample["tokens"]):
-        datasets.append(sample)    
-    print(len(datasets))
-    json.dump(datasets,wf)
-
-print(len(types["entities"].keys()))
-json.dump(types,wf_type)
+            self._file.write((", " if self.document_count else "") + json.dumps(sample))
+        self.document_count += 1
+        self.entity_count += len(sample["entities"])
+
+    def close(self):
+        if not self.jsonl:
+            self._file.write("]")
+        self._file.close()
+        if self.jsonl:
+            # the readers build the statistic again once the size or modification time of the file changed
+            stat = os.stat(self.path)
+            with open(os.path.splitext(self.path)[0] + "_statistic.json", "w") as f:
+                json.dump({"document_count": self.document_count, "entity_count": self.entity_count,
+                           "file_size": stat.st_size, "file_mtime_ns": stat.st_mtime_ns}, f)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", type=str, default="conll03", help="Prefix of the output files")
+    parser.add_argument("--files", type=str, nargs="+", default=["train.txt", "dev.txt", "test.txt"],
+                        help="Files to convert, each written to <dataset>_<file name>.json(l)")
+    parser.add_argument("--sep", type=str, default=" ", help="Column separator, e.g. '\\t' for Wojood")
+    parser.add_argument("--token_column", type=int, default=0)
+    parser.add_argument("--tag_column", type=int, default=3, help="e.g. 1 or -1 for Wojood")
+    parser.add_argument("--label_sep", type=str, default=None,
+                        help="Separator of the labels of a token when entities are nested, e.g. ' ' for Wojood")
+    parser.add_argument("--docstart", type=str, default="-DOCSTART-", help="Token of the document separator lines")
+    parser.add_argument("--jsonl", action="store_true", default=False, help="Write JSONL instead of JSON")
+    args = parser.parse_args()
+
+    sep = args.sep.encode().decode("unicode_escape")
+    label_sep = args.label_sep.encode().decode("unicode_escape") if args.label_sep else None
+    types = {"entities": {}, "relations": {}}
+
+    for path in args.files:
+        if not os.path.exists(path):
+            continue
+        name = os.path.splitext(os.path.basename(path))[0]
+        writer = ManifestWriter(f"{args.dataset}_{name}.{'jsonl' if args.jsonl else 'json'}", args.jsonl)
+
+        for doc_id, tokens, labels in iter_sentences(path, sep, args.token_column, args.tag_column, label_sep,
+                                                     args.docstart):
+            entities = decode_entities(labels)
+            for entity in entities:
+                if entity["type"] not in types["entities"]:
+                    types["entities"][entity["type"]] = {"verbose": entity["type"], "short": entity["type"]}
+            writer.write({"tokens": tokens, "entities": entities, "relations": [], "orig_id": doc_id})
+
+        writer.close()
+        print(writer.document_count)
+
+    print(len(types["entities"].keys()))
+    with open(f"{args.dataset}_types.json", "w") as wf_type:
+        json.dump(types, wf_type)
+
+
+if __name__ == "__main__":
+    main()
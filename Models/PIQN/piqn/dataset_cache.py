@@ -0,0 +1,95 @@
+import contextlib
+import gc
+import hashlib
+import json
+import os
+import pickle
+
+# to be increased whenever the parsed documents change for the same dataset and options
+DATASET_CACHE_FORMAT = 4
+
+
+def path_digest(path):
+    """
+    :param path: the path of a file, or of a directory such as a ".tokenized" corpus
+    :return: the blake2b digest of the content of the file, or of the names and contents of the files of the directory
+    """
+    digest = hashlib.blake2b(digest_size = 16)
+    paths = [path] if os.path.isfile(path) else sorted(os.path.join(path, name) for name in os.listdir(path))
+    for file_path in paths:
+        digest.update(os.path.basename(file_path).encode("utf-8") + b"\0")
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+# the options of a tokenizer which tell where it was loaded from, not how it encodes words
+LOADING_OPTIONS = {"name_or_path", "cache_dir", "local_files_only", "is_local"}
+
+
+def tokenizer_identity(tokenizer):
+    """
+    :param tokenizer: a tokenizer
+    :return: what makes the tokenizer encode words as it does: its class, a digest of its vocabulary and its options
+    """
+    vocab = json.dumps(sorted(tokenizer.get_vocab().items()), ensure_ascii = False).encode("utf-8")
+    options = {key: value for key, value in tokenizer.init_kwargs.items()
+               if key not in LOADING_OPTIONS and not key.endswith("_file")}
+    return [type(tokenizer).__name__, hashlib.blake2b(vocab, digest_size = 16).hexdigest(),
+            json.dumps(options, sort_keys = True, default = str)]
+
+
+def cache_key(*parts):
+    """
+    :param parts: JSON serializable values
+    :return: a digest of the values and of the cache format
+    """
+    return hashlib.blake2b(json.dumps([DATASET_CACHE_FORMAT, *parts], default = str).encode("utf-8"),
+                           digest_size = 16).hexdigest()
+
+
+def load_entry(entry_path):
+    """
+    Loads a cache entry written by save_entry. An entry which cannot be read, or whose checksum does not match, is
+    deleted.
+    :param entry_path: the path of the entry
+    :return: the cached state, None if there is no valid entry
+    """
+    # another process may delete or replace the entry at any time
+    try:
+        with open(entry_path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    checksum, payload = data[:16], data[16:]
+    # the collector would run over and over while the many objects of the documents are created
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        if hashlib.blake2b(payload, digest_size = 16).digest() != checksum:
+            raise ValueError("checksum mismatch")
+        return pickle.loads(payload)
+    except Exception:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(entry_path)
+        return None
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def save_entry(entry_path, state):
+    """
+    Writes a cache entry: the pickled state preceded by its checksum. The entry is written under another name first,
+    several processes may write the same entry.
+    :param entry_path: the path of the entry
+    :param state: the state to cache
+    """
+    os.makedirs(os.path.dirname(entry_path) or ".", exist_ok = True)
+    payload = pickle.dumps(state, protocol = pickle.HIGHEST_PROTOCOL)
+    temporary_path = f"{entry_path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(hashlib.blake2b(payload, digest_size = 16).digest())
+        f.write(payload)
+    os.replace(temporary_path, entry_path)
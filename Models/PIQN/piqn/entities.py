@@ -1,10 +1,14 @@
-from collections import OrderedDict
+from collections.abc import Sequence
+from functools import partial
 import json
 from typing import List
+import numpy as np
 from torch.utils import data
 from torch.utils.data import Dataset as TorchDataset
 from torch.utils.data import IterableDataset as IterableTorchDataset
 from piqn import sampling
+from piqn.jsonl_statistic import load_statistic
+from piqn.columns import Column, RaggedColumn
 import itertools
 import torch.distributed as dist
 
@@ -86,64 +90,326 @@ class EntityType:
         return self._identifier + "=" + self._verbose_name
 
 
+class DocumentStore:
+    """
+    The documents of a dataset with their tokens, entities and relations, held in NumPy columns rather than in an object
+    per token, per entity and per relation. Documents, tokens, entities and relations are views of its rows, created
+    when they are accessed. The row of a token, an entity, a relation or a document is its ID in the dataset, after the
+    ids of the first rows (see following).
+    """
+
+    def __init__(self, entity_types = None, relation_types = None):
+        # tokens
+        self.token_indices = Column(np.int32)
+        self.token_span_starts = Column(np.int32)
+        self.token_span_ends = Column(np.int32)
+        self.token_phrases = RaggedColumn(np.uint8)  # UTF-8
+        self.token_pos = Column(np.int32)
+        self.token_vocab_ids = Column(np.int32)
+        self.token_char_starts = Column(np.int32)
+        self.token_char_ends = Column(np.int32)
+
+        # entities, with the rows of their first and after their last token
+        self.entity_type_indices = Column(np.int32)
+        self.entity_token_starts = Column(np.int64)
+        self.entity_token_ends = Column(np.int64)
+
+        # relations, with the rows of their head and tail entities
+        self.relation_type_indices = Column(np.int32)
+        self.relation_heads = Column(np.int64)
+        self.relation_tails = Column(np.int64)
+        self.relation_reverses = Column(np.bool_)
+
+        # documents, with the rows of their first and after their last token, entity and relation
+        self.document_token_starts = Column(np.int64)
+        self.document_token_ends = Column(np.int64)
+        self.document_entity_starts = Column(np.int64)
+        self.document_entity_ends = Column(np.int64)
+        self.document_relation_starts = Column(np.int64)
+        self.document_relation_ends = Column(np.int64)
+        self.encodings = RaggedColumn(np.int32)
+        self.seg_encodings = RaggedColumn(np.int8)
+        # the character ids of the tokens of every document, one token after the other
+        self.char_encodings = RaggedColumn(np.int32)
+        # the start and end token of every window, one after the other, none if the document is not split
+        self.windows = RaggedColumn(np.int32)
+
+        self.first_token_id = 0
+        self.first_entity_id = 0
+        self.first_relation_id = 0
+        self.first_document_id = 0
+
+        self.entity_types = dict()
+        self.relation_types = dict()
+        if entity_types is not None:
+            self.set_types(entity_types, relation_types)
+
+    def set_types(self, entity_types, relation_types):
+        # the entity and relation types by index, as held in the columns
+        self.entity_types = {entity_type.index: entity_type for entity_type in entity_types.values()}
+        self.relation_types = {relation_type.index: relation_type for relation_type in relation_types.values()}
+
+    def add_token(self, index, span_start, span_end, phrase, pos, vocab_id, char_start, char_end):
+        self.token_indices.append(index)
+        self.token_span_starts.append(span_start)
+        self.token_span_ends.append(span_end)
+        self.token_phrases.append(np.frombuffer(phrase.encode("utf-8"), dtype = np.uint8))
+        self.token_pos.append(pos)
+        self.token_vocab_ids.append(vocab_id)
+        self.token_char_starts.append(char_start)
+        self.token_char_ends.append(char_end)
+        return len(self.token_indices) - 1
+
+    def add_entity(self, entity_type, tokens):
+        """
+        :param entity_type: the entity type
+        :param tokens: the tokens of the entity, consecutive rows of the store
+        :return: the row of the entity
+        """
+        self.entity_type_indices.append(entity_type.index)
+        start, end = self._rows(tokens, self.token_indices)
+        self.entity_token_starts.append(start)
+        self.entity_token_ends.append(end)
+        return len(self.entity_type_indices) - 1
+
+    def add_relation(self, relation_type, head_entity, tail_entity, reverse):
+        self.relation_type_indices.append(relation_type.index)
+        self.relation_heads.append(head_entity._row)
+        self.relation_tails.append(tail_entity._row)
+        self.relation_reverses.append(reverse)
+        return len(self.relation_type_indices) - 1
+
+    def add_document(self, tokens, entities, relations, encoding, char_encoding, seg_encoding, windows = None):
+        """
+        :param tokens: the tokens of the document, consecutive rows of the store
+        :param entities: the entities of the document, consecutive rows of the store
+        :param relations: the relations of the document, consecutive rows of the store
+        :param encoding: the subword ids of the document
+        :param char_encoding: the character ids of every token
+        :param seg_encoding: the segment ids of the subwords
+        :param windows: the start and end (exclusive) token of every window, None if the document is not split
+        :return: the row of the document
+        """
+        token_start, token_end = self._rows(tokens, self.token_indices)
+        entity_start, entity_end = self._rows(entities, self.entity_type_indices)
+        relation_start, relation_end = self._rows(relations, self.relation_type_indices)
+        self.document_token_starts.append(token_start)
+        self.document_token_ends.append(token_end)
+        self.document_entity_starts.append(entity_start)
+        self.document_entity_ends.append(entity_end)
+        self.document_relation_starts.append(relation_start)
+        self.document_relation_ends.append(relation_end)
+        self.encodings.append(encoding)
+        self.seg_encodings.append(seg_encoding)
+        self.char_encodings.append([char for token_chars in char_encoding for char in token_chars])
+        self.windows.append([position for window in windows or [] for position in window])
+        return len(self.document_token_starts) - 1
+
+    @staticmethod
+    def _rows(views, column):
+        if not views:
+            return len(column), len(column)
+        return views[0]._row, views[-1]._row + 1
+
+    def extend(self, other):
+        """
+        Appends all the rows of another store, the ones of the tokens of its ignored documents included, so that the
+        ids of the rows go on as if they had been added to this store.
+        """
+        self._extend(other, (0, len(other.token_indices)), (0, len(other.entity_type_indices)),
+                     (0, len(other.relation_type_indices)), (0, len(other.document_token_starts)))
+
+    def extract(self, document):
+        """
+        :param document: the row of a document
+        :return: a store holding only that document with its tokens, entities and relations, which keep their ids
+        """
+        store = self._empty()
+        tokens = self.document_token_starts.item(document), self.document_token_ends.item(document)
+        entities = self.document_entity_starts.item(document), self.document_entity_ends.item(document)
+        relations = self.document_relation_starts.item(document), self.document_relation_ends.item(document)
+        store._extend(self, tokens, entities, relations, (document, document + 1))
+        store.first_token_id = self.first_token_id + tokens[0]
+        store.first_entity_id = self.first_entity_id + entities[0]
+        store.first_relation_id = self.first_relation_id + relations[0]
+        store.first_document_id = self.first_document_id + document
+        return store
+
+    def following(self):
+        """
+        :return: an empty store whose ids follow the ones of this store, to parse the next documents of a stream
+        without holding the previous ones
+        """
+        store = self._empty()
+        store.first_token_id = self.first_token_id + len(self.token_indices)
+        store.first_entity_id = self.first_entity_id + len(self.entity_type_indices)
+        store.first_relation_id = self.first_relation_id + len(self.relation_type_indices)
+        store.first_document_id = self.first_document_id + len(self.document_token_starts)
+        return store
+
+    def _empty(self):
+        store = DocumentStore()
+        store.entity_types = self.entity_types
+        store.relation_types = self.relation_types
+        return store
+
+    def _extend(self, other, tokens, entities, relations, documents):
+        # the rows of the other store are moved after the rows of this one
+        token_shift = len(self.token_indices) - tokens[0]
+        entity_shift = len(self.entity_type_indices) - entities[0]
+        relation_shift = len(self.relation_type_indices) - relations[0]
+
+        start, end = tokens
+        self.token_indices.extend(other.token_indices.values[start:end])
+        self.token_span_starts.extend(other.token_span_starts.values[start:end])
+        self.token_span_ends.extend(other.token_span_ends.values[start:end])
+        self.token_phrases.extend(other.token_phrases, start, end)
+        self.token_pos.extend(other.token_pos.values[start:end])
+        self.token_vocab_ids.extend(other.token_vocab_ids.values[start:end])
+        self.token_char_starts.extend(other.token_char_starts.values[start:end])
+        self.token_char_ends.extend(other.token_char_ends.values[start:end])
+
+        start, end = entities
+        self.entity_type_indices.extend(other.entity_type_indices.values[start:end])
+        self.entity_token_starts.extend(other.entity_token_starts.values[start:end] + token_shift)
+        self.entity_token_ends.extend(other.entity_token_ends.values[start:end] + token_shift)
+
+        start, end = relations
+        self.relation_type_indices.extend(other.relation_type_indices.values[start:end])
+        self.relation_heads.extend(other.relation_heads.values[start:end] + entity_shift)
+        self.relation_tails.extend(other.relation_tails.values[start:end] + entity_shift)
+        self.relation_reverses.extend(other.relation_reverses.values[start:end])
+
+        start, end = documents
+        self.document_token_starts.extend(other.document_token_starts.values[start:end] + token_shift)
+        self.document_token_ends.extend(other.document_token_ends.values[start:end] + token_shift)
+        self.document_entity_starts.extend(other.document_entity_starts.values[start:end] + entity_shift)
+        self.document_entity_ends.extend(other.document_entity_ends.values[start:end] + entity_shift)
+        self.document_relation_starts.extend(other.document_relation_starts.values[start:end] + relation_shift)
+        self.document_relation_ends.extend(other.document_relation_ends.values[start:end] + relation_shift)
+        self.encodings.extend(other.encodings, start, end)
+        self.seg_encodings.extend(other.seg_encodings, start, end)
+        self.char_encodings.extend(other.char_encodings, start, end)
+        self.windows.extend(other.windows, start, end)
+
+    def token_phrase(self, token):
+        return self.token_phrases[token].tobytes().decode("utf-8")
+
+    def sample_counts(self):
+        """
+        :return: the number of samples of every document, as an array: its number of windows, or 1 if it is not split
+        """
+        return np.maximum(self.windows.lengths() // 2, 1)
+
+    @property
+    def entity_count(self):
+        return len(self.entity_type_indices)
+
+    @property
+    def relation_count(self):
+        return len(self.relation_type_indices)
+
+    @property
+    def document_count(self):
+        return len(self.document_token_starts)
+
+
+class StoreViews(Sequence):
+    """
+    The views of the rows of a DocumentStore, as a list which creates a view when it is accessed.
+    """
+
+    def __init__(self, view, count):
+        """
+        :param view: creates the view of a row
+        :param count: the number of rows
+        """
+        self._view = view
+        self._count = count
+
+    def __getitem__(self, index):
+        rows = range(self._count)[index]
+        if isinstance(index, slice):
+            return [self._view(row) for row in rows]
+        return self._view(rows)
+
+    def __iter__(self):
+        return map(self._view, range(self._count))
+
+    def __len__(self):
+        return self._count
+
+
 class Token:
     # POS_MAP = ["ADJ", "ADP", "ADV", "AUX", "CONJ", "CCONJ", "DET", "INTJ", "NOUN", "NUM", "PART", "PRON", "PROPN", "PUNCT", "SCONJ", "SYM", "VERB", "X", "SPACE"]
-    def __init__(self, tid: int, index: int, span_start: int, span_end: int, phrase: str, pos: int, vocab_id: int, char_start: int, char_end: int):
-        self._tid = tid  # ID within the corresponding dataset
-        self._index = index  # original token index in document
+    __slots__ = ("_store", "_row", "_offset", "_shift")
+
+    def __init__(self, store: DocumentStore, row: int, offset: int = 0, shift: int = 0):
+        """
+        A view of a token of a DocumentStore.
+        :param store: the store
+        :param row: the row of the token in the store
+        :param offset: the index of the first token of the window of the document the token is viewed in, 0 for the
+        whole document
+        :param shift: the number of subwords of the document which are not in the window
+        """
+        self._store = store
+        self._row = row
+        self._offset = offset
+        self._shift = shift
 
-        self._span_start = span_start  # start of token span in document (inclusive)
-        self._span_end = span_end  # end of token span in document (exclusive)
-        self._char_start = char_start
-        self._char_end = char_end
-        self._phrase = phrase
-        self._pos = pos
-        self._vocab_id = vocab_id
+    @property
+    def _tid(self):
+        # ID within the corresponding dataset
+        return self._store.first_token_id + self._row
 
     @property
     def index(self):
-        return self._index
+        # original token index in document
+        return self._store.token_indices.item(self._row) - self._offset
 
     @property
     def wordinx(self):
-        return self._vocab_id
+        return self._store.token_vocab_ids.item(self._row)
 
     @property
     def span_start(self):
-        return self._span_start
+        # start of token span in document (inclusive)
+        return self._store.token_span_starts.item(self._row) - self._shift
 
     @property
     def span_end(self):
-        return self._span_end
+        # end of token span in document (exclusive)
+        return self._store.token_span_ends.item(self._row) - self._shift
 
     @property
     def span(self):
-        return self._span_start, self._span_end
+        return self.span_start, self.span_end
 
     @property
     def char_start(self):
-        return self._char_start
+        return self._store.token_char_starts.item(self._row) - self._offset
 
     @property
     def char_end(self):
-        return self._char_end
+        return self._store.token_char_ends.item(self._row) - self._offset
 
     @property
     def char_span(self):
-        return self._char_start, self._char_end
+        return self.char_start, self.char_end
 
     @property
     def phrase(self):
-        return self._phrase
+        return self._store.token_phrase(self._row)
 
     @property
     def pos(self):
-        return self._pos
-    
+        return self._store.token_pos.item(self._row)
+
     @property
     def pos_id(self):
         # return self.POS_MAP.index(self._pos)
-        return self._pos
+        return self.pos
 
     def __eq__(self, other):
         if isinstance(other, Token):
@@ -154,10 +420,10 @@ class Token:
         return hash(self._tid)
 
     def __str__(self):
-        return self._phrase
+        return self.phrase
 
     def __repr__(self):
-        return self._phrase
+        return self.phrase
 
 
 class TokenSpan:
@@ -197,23 +463,42 @@ class TokenSpan:
 
 
 class Entity:
-    def __init__(self, eid: int, entity_type: EntityType, tokens: List[Token], phrase: str):
-        self._eid = eid  # ID within the corresponding dataset
+    __slots__ = ("_store", "_row", "_offset", "_shift")
+
+    def __init__(self, store: DocumentStore, row: int, offset: int = 0, shift: int = 0):
+        """
+        A view of an entity of a DocumentStore.
+        :param store: the store
+        :param row: the row of the entity in the store
+        :param offset: the offset of the tokens of the entity, see Token
+        :param shift: the shift of the tokens of the entity, see Token
+        """
+        self._store = store
+        self._row = row
+        self._offset = offset
+        self._shift = shift
 
-        self._entity_type = entity_type
+    @property
+    def _eid(self):
+        # ID within the corresponding dataset
+        return self._store.first_entity_id + self._row
 
-        self._tokens = tokens
-        self._phrase = phrase
+    @property
+    def _tokens(self) -> List[Token]:
+        store = self._store
+        return [Token(store, row, self._offset, self._shift)
+                for row in range(store.entity_token_starts.item(self._row), store.entity_token_ends.item(self._row))]
 
     def as_tuple(self):
-        return self.span_start, self.span_end, self._entity_type
+        return self.span_start, self.span_end, self.entity_type
 
     def as_tuple_token(self):
-        return self._tokens[0].index,self._tokens[-1].index, self._entity_type
+        tokens = self._tokens
+        return tokens[0].index, tokens[-1].index, self.entity_type
 
     @property
     def entity_type(self):
-        return self._entity_type
+        return self._store.entity_types[self._store.entity_type_indices.item(self._row)]
 
     @property
     def tokens(self):
@@ -233,11 +518,12 @@ class Entity:
 
     @property
     def span_token(self):
-        return self._tokens[0].index,self._tokens[-1].index
+        tokens = self._tokens
+        return tokens[0].index, tokens[-1].index
 
     @property
     def phrase(self):
-        return self._phrase
+        return " ".join([t.phrase for t in self._tokens])
 
     def __eq__(self, other):
         if isinstance(other, Entity):
@@ -248,56 +534,63 @@ class Entity:
         return hash(self._eid)
 
     def __str__(self):
-        return self._phrase + f" -> {self.span_token}-> {self.entity_type.identifier}"
+        return self.phrase + f" -> {self.span_token}-> {self.entity_type.identifier}"
 
 
 class Relation:
-    def __init__(self, rid: int, relation_type: RelationType, head_entity: Entity,
-                 tail_entity: Entity, reverse: bool = False):
-        self._rid = rid  # ID within the corresponding dataset
-        self._relation_type = relation_type
-
-        self._head_entity = head_entity
-        self._tail_entity = tail_entity
-
-        self._reverse = reverse
+    __slots__ = ("_store", "_row", "_offset", "_shift")
+
+    def __init__(self, store: DocumentStore, row: int, offset: int = 0, shift: int = 0):
+        """
+        A view of a relation of a DocumentStore.
+        :param store: the store
+        :param row: the row of the relation in the store
+        :param offset: the offset of the tokens of the entities of the relation, see Token
+        :param shift: the shift of the tokens of the entities of the relation, see Token
+        """
+        self._store = store
+        self._row = row
+        self._offset = offset
+        self._shift = shift
 
-        self._first_entity = head_entity if not reverse else tail_entity
-        self._second_entity = tail_entity if not reverse else head_entity
+    @property
+    def _rid(self):
+        # ID within the corresponding dataset
+        return self._store.first_relation_id + self._row
 
     def as_tuple(self):
-        head = self._head_entity
-        tail = self._tail_entity
+        head = self.head_entity
+        tail = self.tail_entity
         head_start, head_end = (head.span_start, head.span_end)
         tail_start, tail_end = (tail.span_start, tail.span_end)
 
         t = ((head_start, head_end, head.entity_type),
-             (tail_start, tail_end, tail.entity_type), self._relation_type)
+             (tail_start, tail_end, tail.entity_type), self.relation_type)
         return t
 
     @property
     def relation_type(self):
-        return self._relation_type
+        return self._store.relation_types[self._store.relation_type_indices.item(self._row)]
 
     @property
     def head_entity(self):
-        return self._head_entity
+        return Entity(self._store, self._store.relation_heads.item(self._row), self._offset, self._shift)
 
     @property
     def tail_entity(self):
-        return self._tail_entity
+        return Entity(self._store, self._store.relation_tails.item(self._row), self._offset, self._shift)
 
     @property
     def first_entity(self):
-        return self._first_entity
+        return self.head_entity if not self.reverse else self.tail_entity
 
     @property
     def second_entity(self):
-        return self._second_entity
+        return self.tail_entity if not self.reverse else self.head_entity
 
     @property
     def reverse(self):
-        return self._reverse
+        return self._store.relation_reverses.item(self._row)
 
     def __eq__(self, other):
         if isinstance(other, Relation):
@@ -308,75 +601,183 @@ class Relation:
         return hash(self._rid)
 
 
+class DocumentWindow:
+    def __init__(self, document, index):
+        """
+        The place of a window in the long document it was cut from. The windows of a document overlap, and every span
+        of tokens is owned by a single window, so that the predictions of the windows can be merged.
+        :param document: the document
+        :param index: the index of the window in the windows of the document
+        """
+        self._document = document
+        self._index = index
+        self._windows = document.windows
+        self._start = self._windows[index][0]
+
+    @property
+    def document(self):
+        return self._document
+
+    @property
+    def index(self):
+        return self._index
+
+    @property
+    def start(self):
+        return self._start
+
+    @property
+    def end(self):
+        return self._windows[self._index][1]
+
+    @property
+    def is_last(self):
+        return self._index == len(self._windows) - 1
+
+    def owns(self, start, end):
+        """
+        :param start: the first token of a span, as an index in the window
+        :param end: the last token of the span (inclusive)
+        :return: whether the span is owned by the window: of the windows which hold the span, the one it is the furthest
+        in from the edges, the first one on a tie
+        """
+        start, end = start + self._start, end + self._start
+        margins = [min(start - window_start, window_end - 1 - end) for window_start, window_end in self._windows]
+        return margins[self._index] >= 0 and margins.index(max(margins)) == self._index
+
+
 class Document:
-    def __init__(self, doc_id: int, tokens: List[Token], entities: List[Entity], relations: List[Relation],
-                 encoding: List[int], char_encoding: List[List[int]], seg_encoding: List[int]):
-        self._doc_id = doc_id  # ID within the corresponding dataset
+    __slots__ = ("_store", "_row", "_window", "_token_start", "_token_end", "_offset", "_shift")
+
+    def __init__(self, store: DocumentStore, row: int, window: DocumentWindow = None):
+        """
+        A view of a document of a DocumentStore, or of one of its windows. The tokens and the encodings of a window are
+        cut from those of the document, without its context, and it has the entities and relations which lie in it.
+        :param store: the store
+        :param row: the row of the document in the store
+        :param window: the window of the document which is viewed, None for the whole document
+        """
+        self._store = store
+        self._row = row
+        self._window = window
+
+        self._token_start = store.document_token_starts.item(row)
+        self._token_end = store.document_token_ends.item(row)
+        self._offset = 0
+        self._shift = 0
+        if window is not None:
+            self._offset = window.start
+            self._token_start, self._token_end = self._token_start + window.start, self._token_start + window.end
+            # the subwords of the tokens are between [CLS] and [SEP]
+            self._shift = store.token_span_starts.item(self._token_start) - 1
+
+    def sample_document(self, index):
+        """
+        :param index: the index of a sample of the document, below sample_count
+        :return: the document itself, or its window of that index
+        """
+        if self.windows is None:
+            return self
+        return Document(self._store, self._row, DocumentWindow(self, index))
+
+    def sample_documents(self):
+        return [self.sample_document(i) for i in range(self.sample_count)]
 
-        self._tokens = tokens
-        self._entities = entities
-        self._relations = relations
+    @property
+    def windows(self):
+        # start and end (exclusive) tokens of the windows sampled instead of the document when it is too long
+        if self._window is not None:
+            return None
+        windows = self._store.windows[self._row].tolist()
+        return list(zip(windows[0::2], windows[1::2])) or None
 
-        # byte-pair document encoding including special tokens ([CLS] and [SEP])
-        self._encoding = encoding
-        self._char_encoding = char_encoding
-        self._seg_encoding = seg_encoding
+    @property
+    def window(self):
+        return self._window
+
+    @property
+    def sample_count(self):
+        windows = self.windows
+        return 1 if windows is None else len(windows)
 
     @property
     def doc_id(self):
-        return self._doc_id
+        # ID within the corresponding dataset
+        return self._store.first_document_id + self._row
+
+    def _in_window(self, entity):
+        return (self._window is None or self._token_start <= self._store.entity_token_starts.item(entity)
+                and self._store.entity_token_ends.item(entity) <= self._token_end)
 
     @property
     def entities(self):
-        return self._entities
+        store = self._store
+        rows = range(store.document_entity_starts.item(self._row), store.document_entity_ends.item(self._row))
+        return [Entity(store, row, self._offset, self._shift) for row in rows if self._in_window(row)]
 
     @property
     def relations(self):
-        return self._relations
+        store = self._store
+        rows = range(store.document_relation_starts.item(self._row), store.document_relation_ends.item(self._row))
+        return [Relation(store, row, self._offset, self._shift) for row in rows
+                if self._in_window(store.relation_heads.item(row)) and self._in_window(store.relation_tails.item(row))]
 
     @property
     def tokens(self):
-        return TokenSpan(self._tokens)
+        return TokenSpan([Token(self._store, row, self._offset, self._shift)
+                          for row in range(self._token_start, self._token_end)])
 
     @property
     def encoding(self):
-        return self._encoding
+        # byte-pair document encoding including special tokens ([CLS] and [SEP])
+        return self._cut(self._store.encodings[self._row])
 
     @property
     def char_encoding(self):
-        return self._char_encoding
+        # the characters of every token, char_end - char_start + 1 of them
+        store = self._store
+        start, end = store.document_token_starts.item(self._row), store.document_token_ends.item(self._row)
+        chars = store.char_encodings[self._row].tolist()
+        ends = np.cumsum(store.token_char_ends.values[start:end] - store.token_char_starts.values[start:end] + 1).tolist()
+        char_encoding = [chars[char_start:char_end] for char_start, char_end in zip([0] + ends, ends)]
+        return char_encoding[self._token_start - start:self._token_end - start]
 
     @property
     def seg_encoding(self):
-        return self._seg_encoding
-
-    @encoding.setter
-    def encoding(self, value):
-        self._encoding = value
-
-    @char_encoding.setter
-    def char_encoding(self, value):
-        self._char_encoding = value
-
-    @seg_encoding.setter
-    def seg_encoding(self, value):
-        self._seg_encoding = value
+        return self._cut(self._store.seg_encodings[self._row])
 
+    def _cut(self, encoding):
+        # the encoding of a window is the subwords of its tokens between [CLS] and [SEP]
+        if self._window is None:
+            return encoding.tolist()
+        first = self._store.token_span_starts.item(self._token_start)
+        last = self._store.token_span_ends.item(self._token_end - 1)
+        return encoding[:1].tolist() + encoding[first:last].tolist() + encoding[-1:].tolist()
 
     def __str__(self) -> str:
         raw_document = " ".join(str(t) for t in self.tokens)
         raw_entities = " | ".join(str(e) for e in self.entities)
-        
+
         return raw_document + "\n" + raw_entities
-        
+
 
     def __eq__(self, other):
         if isinstance(other, Document):
-            return self._doc_id == other._doc_id
+            return self.doc_id == other.doc_id
         return False
 
     def __hash__(self):
-        return hash(self._doc_id)
+        return hash(self.doc_id)
+
+    def __reduce__(self):
+        # pickled with its own rows only, rather than with all the documents of its store
+        window = None if self._window is None else self._window.index
+        return _load_document, (self._store.extract(self._row), window)
+
+
+def _load_document(store, window):
+    document = Document(store, 0)
+    return document if window is None else document.sample_document(window)
 
 
 class BatchIterator:
@@ -409,6 +810,8 @@ class BatchIterator:
 class Dataset(TorchDataset):
     TRAIN_MODE = 'train'
     EVAL_MODE = 'eval'
+    # the attributes set by parsing the documents, cached by the input reader
+    PARSE_STATE = ['_store', 'resampling_times']
 
     def __init__(self, label, rel_types, entity_types, random_mask_word = False, tokenizer = None, repeat_gt_entities = None):
         self._label = label
@@ -419,51 +822,68 @@ class Dataset(TorchDataset):
         self._tokenizer = tokenizer
         self._repeat_gt_entities = repeat_gt_entities
 
-        self._documents = OrderedDict()
-        self._entities = OrderedDict()
-        self._relations = OrderedDict()
+        # how many times every document is sampled in an epoch, set by the input reader
+        self.resampling_times = None
 
-        # current ids
-        self._doc_id = 0
-        self._rid = 0
-        self._eid = 0
-        self._tid = 0
+        self._store = DocumentStore(entity_types, rel_types)
+        # the document row and the index in the document of every sample, see _get_samples
+        self._samples = None
 
     def iterate_documents(self, batch_size, order=None, truncate=False):
         return BatchIterator(self.documents, batch_size, order=order, truncate=truncate)
 
+    def get_parse_state(self):
+        return {name: getattr(self, name) for name in self.PARSE_STATE}
+
+    def set_parse_state(self, state):
+        for name in self.PARSE_STATE:
+            setattr(self, name, state[name])
+        self._samples = None
+        # the entities and relations refer to the types of the input reader rather than to their copies
+        self._store.set_types(self._entity_types, self._rel_types)
+
+    def add_store(self, store):
+        """
+        Adds the documents parsed into the store of another dataset, renumbering them, their tokens, their entities and
+        their relations as if they had been parsed into this one.
+        :param store: the store
+        """
+        self._store.extend(store)
+        self._samples = None
+
     def iterate_relations(self, batch_size, order=None, truncate=False):
         return BatchIterator(self.relations, batch_size, order=order, truncate=truncate)
 
     def create_token(self, idx, span_start, span_end, phrase, pos, inx, char_start, char_end) -> Token:
-        token = Token(self._tid, idx, span_start, span_end, phrase, pos, inx, char_start, char_end)
-        self._tid += 1
-        return token
+        return Token(self._store, self._store.add_token(idx, span_start, span_end, phrase, pos, inx, char_start, char_end))
 
-    def create_document(self, tokens, entity_mentions, relations, doc_encoding, char_encoding, seg_encoding) -> Document:
-        document = Document(self._doc_id, tokens, entity_mentions, relations, doc_encoding, char_encoding, seg_encoding)
-        self._documents[self._doc_id] = document
-        self._doc_id += 1
+    def create_document(self, tokens, entity_mentions, relations, doc_encoding, char_encoding, seg_encoding, windows = None) -> Document:
+        document = Document(self._store, self._store.add_document(tokens, entity_mentions, relations, doc_encoding, char_encoding, seg_encoding, windows))
+        self._samples = None
 
         return document
 
     def create_entity(self, entity_type, tokens, phrase) -> Entity:
-        mention = Entity(self._eid, entity_type, tokens, phrase)
-        self._entities[self._eid] = mention
-        self._eid += 1
-        return mention
+        # the phrase is joined from the tokens when it is accessed
+        return Entity(self._store, self._store.add_entity(entity_type, tokens))
 
     def create_relation(self, relation_type, head_entity, tail_entity, reverse=False) -> Relation:
-        relation = Relation(self._rid, relation_type, head_entity, tail_entity, reverse)
-        self._relations[self._rid] = relation
-        self._rid += 1
-        return relation
+        return Relation(self._store, self._store.add_relation(relation_type, head_entity, tail_entity, reverse))
+
+    def _get_samples(self):
+        if self._samples is None:
+            counts = self._store.sample_counts()
+            documents = np.repeat(np.arange(len(counts)), counts)
+            indices = np.arange(len(documents)) - np.repeat(np.cumsum(counts) - counts, counts)
+            self._samples = documents, indices
+        return self._samples
 
     def __len__(self):
-        return len(self._documents)
+        return len(self._get_samples()[0])
 
     def __getitem__(self, index: int):
-        doc = self._documents[index]
+        documents, indices = self._get_samples()
+        doc = Document(self._store, documents.item(index)).sample_document(indices.item(index))
 
         if self._mode == Dataset.TRAIN_MODE:
             return sampling.create_train_sample(doc, random_mask=self.random_mask_word, tokenizer = self._tokenizer, repeat_gt_entities = self._repeat_gt_entities)
@@ -481,35 +901,52 @@ class Dataset(TorchDataset):
     def input_reader(self):
         return self._input_reader
 
+    @property
+    def store(self):
+        return self._store
+
     @property
     def documents(self):
-        return list(self._documents.values())
+        return StoreViews(partial(Document, self._store), self._store.document_count)
 
     @property
     def entities(self):
-        return list(self._entities.values())
+        return StoreViews(partial(Entity, self._store), self._store.entity_count)
 
     @property
     def relations(self):
-        return list(self._relations.values())
+        return StoreViews(partial(Relation, self._store), self._store.relation_count)
 
     @property
     def document_count(self):
-        return len(self._documents)
+        return self._store.document_count
+
+    @property
+    def sample_resampling_times(self):
+        # how many times every sample is drawn in an epoch, the windows of a document as many times as the document
+        if self.resampling_times is None:
+            return None
+        return np.repeat(self.resampling_times, self._store.sample_counts()).tolist()
+
+    @property
+    def sample_count(self):
+        if self.resampling_times is None:
+            return len(self)
+        return sum(self.sample_resampling_times)
 
     @property
     def entity_count(self):
-        return len(self._entities)
+        return self._store.entity_count
 
     @property
     def relation_count(self):
-        return len(self._relations)
+        return self._store.relation_count
 
 class DistributedIterableDataset(IterableTorchDataset):
     TRAIN_MODE = 'train'
     EVAL_MODE = 'eval'
 
-    def __init__(self, label, path, rel_types, entity_types, input_reader, random_mask_word = False, tokenizer = None, repeat_gt_entities = None):
+    def __init__(self, label, path, rel_types, entity_types, input_reader, random_mask_word = False, tokenizer = None, repeat_gt_entities = None, resampling_times = None):
         self._label = label
         self._path = path
         self._rel_types = rel_types
@@ -519,37 +956,28 @@ class DistributedIterableDataset(IterableTorchDataset):
         self._tokenizer = tokenizer
         self._input_reader = input_reader
         self._repeat_gt_entities = repeat_gt_entities
-        self._local_rank = dist.get_rank()
-        self._world_size = dist.get_world_size()
+        self._resampling_times = resampling_times
+        self._local_rank = dist.get_rank() if dist.is_initialized() else -1
+        self._world_size = dist.get_world_size() if dist.is_initialized() else 1
         # print(self._local_rank, self._world_size)
 
-        self.statistic = json.load(open(path.split(".")[0] + "_statistic.json"))
+        # built by a first pass over the file if it was not written with it
+        self.statistic = load_statistic(path)
 
-        # current ids
-        self._doc_id = 0
-        self._rid = 0
-        self._eid = 0
-        self._tid = 0
+        # holds the document being parsed
+        self._store = DocumentStore(entity_types, rel_types)
 
     def create_token(self, idx, span_start, span_end, phrase, pos, inx, char_start, char_end) -> Token:
-        token = Token(self._tid, idx, span_start, span_end, phrase, pos, inx, char_start, char_end)
-        self._tid += 1
-        return token
+        return Token(self._store, self._store.add_token(idx, span_start, span_end, phrase, pos, inx, char_start, char_end))
 
-    def create_document(self, tokens, entity_mentions, relations, doc_encoding, char_encoding, seg_encoding) -> Document:
-        document = Document(self._doc_id, tokens, entity_mentions, relations, doc_encoding, char_encoding, seg_encoding)
-        self._doc_id += 1
-        return document
+    def create_document(self, tokens, entity_mentions, relations, doc_encoding, char_encoding, seg_encoding, windows = None) -> Document:
+        return Document(self._store, self._store.add_document(tokens, entity_mentions, relations, doc_encoding, char_encoding, seg_encoding, windows))
 
     def create_entity(self, entity_type, tokens, phrase) -> Entity:
-        mention = Entity(self._eid, entity_type, tokens, phrase)
-        self._eid += 1
-        return mention
+        return Entity(self._store, self._store.add_entity(entity_type, tokens))
 
     def create_relation(self, relation_type, head_entity, tail_entity, reverse=False) -> Relation:
-        relation = Relation(self._rid, relation_type, head_entity, tail_entity, reverse)
-        self._rid += 1
-        return relation
+        return Relation(self._store, self._store.add_relation(relation_type, head_entity, tail_entity, reverse))
 
     def parse_doc(self, path):
         inx = 0
@@ -566,15 +994,26 @@ class DistributedIterableDataset(IterableTorchDataset):
             offset = self._local_rank*num_workers + worker_id
             mod = self._world_size * num_workers
         with open(self._path, encoding="utf8") as rf:
-            for line in rf:
+            lines = rf
+            if self._input_reader.context_window is not None:
+                # every line is read to build the context of its neighbours
+                lines = self._input_reader._iter_with_context(map(json.loads, rf))
+            for line in lines:
                 if inx % mod == offset:
-                    doc = json.loads(line)
+                    doc = json.loads(line) if isinstance(line, str) else line
+                    # the previous documents are not held, the ids going on from theirs
+                    self._store = self._store.following()
                     doc = self._input_reader._parse_document(doc, self)
                     if doc is not None:
                         if self._mode == Dataset.TRAIN_MODE:
-                            yield sampling.create_train_sample(doc, random_mask=self.random_mask_word, tokenizer = self._tokenizer, repeat_gt_entities = self._repeat_gt_entities)
+                            # the document is parsed once and sampled as many times as it is resampled
+                            resampling_time = 1 if self._resampling_times is None else self._resampling_times[inx]
+                            for _ in range(resampling_time):
+                                for sample_doc in doc.sample_documents():
+                                    yield sampling.create_train_sample(sample_doc, random_mask=self.random_mask_word, tokenizer = self._tokenizer, repeat_gt_entities = self._repeat_gt_entities)
                         else:
-                            yield sampling.create_eval_sample(doc)
+                            for sample_doc in doc.sample_documents():
+                                yield sampling.create_eval_sample(sample_doc)
                 inx += 1 # maybe imblance
 
 
@@ -602,6 +1041,12 @@ class DistributedIterableDataset(IterableTorchDataset):
     def document_count(self):
         return self.statistic["document_count"]
 
+    @property
+    def sample_count(self):
+        if self._resampling_times is None:
+            return self.document_count
+        return sum(self._resampling_times)
+
     @property
     def entity_count(self):
         return self.statistic["entity_count"]
\ No newline at end of file
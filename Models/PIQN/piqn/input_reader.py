@@ -1,14 +1,22 @@
 from codecs import encode
+import copy
+import hashlib
 import json
 from abc import abstractmethod, ABC
-from collections import OrderedDict
+from collections import OrderedDict, deque
+import itertools
 from logging import Logger
+from multiprocessing import Pool
 import os
 from pdb import set_trace
+import re
+import resource
 import tokenize
 from typing import Iterable, List
 import numpy as np
 import string
+import threading
+import unicodedata
 
 from tqdm import tqdm
 from transformers import BertTokenizer
@@ -24,9 +32,58 @@ from piqn.entities import (
     Document,
     DistributedIterableDataset,
 )
+from piqn.tokenized_corpus import TokenizedCorpus
+from piqn.dataset_cache import cache_key, load_entry, path_digest, save_entry, tokenizer_identity
+from piqn.word_cache import WordCache
+from piqn.json_array import JsonArray
+from piqn.sequence_lengths import SequenceLengths
 from collections import Counter
 import random
 
+# tatweel and harakat, ignored by the "normalized" deduplication
+ARABIC_DIACRITICS = re.compile("[\u0640\u064b-\u0652\u0670]")
+
+# the characters of the char-LSTM when no vocabulary is built from the train dataset
+PRINTABLE_CHAR_VOCAB = list(string.printable)
+# the file of the char vocabulary in a checkpoint
+CHAR_VOCAB_FILE_NAME = "char_vocab.json"
+
+
+def _peak_rss_mb():
+    # the largest resident set of this process so far, ru_maxrss being in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
+
+
+# the input reader and the dataset of a parsing process, see JsonInputReader._parse_in_processes
+_parse_process_state = None
+
+
+def _init_parse_process(reader, dataset):
+    global _parse_process_state
+    _parse_process_state = (reader, dataset, copy.deepcopy(dataset.get_parse_state()))
+
+
+def _parse_chunk(documents):
+    """
+    Parses documents into a new dataset in a parsing process.
+    :param documents: the documents
+    :return: whether every document was kept, the store of the dataset, the number of hits and misses of every word
+    cache and the sequence lengths of the documents
+    """
+    reader, dataset, empty_state = _parse_process_state
+    dataset.set_parse_state(copy.deepcopy(empty_state))
+    reader._sequence_lengths = SequenceLengths()
+    caches = reader._word_caches()
+    initial_counts = [(cache.hits, cache.misses) for cache in caches]
+    kept = [
+        reader._parse_document(document, dataset, subwords) is not None
+        for document, subwords in reader._iter_with_subwords(documents)
+    ]
+    cache_counts = [
+        (cache.hits - hits, cache.misses - misses) for cache, (hits, misses) in zip(caches, initial_counts)
+    ]
+    return kept, dataset.store, cache_counts, reader._sequence_lengths
+
 
 class BaseInputReader(ABC):
     def __init__(
@@ -36,10 +93,18 @@ class BaseInputReader(ABC):
         logger: Logger = None,
         random_mask_word=None,
         repeat_gt_entities=None,
+        context_window=None,
+        dataset_cache_dir=None,
+        word_cache_size=65536,
+        parse_processes=0,
+        max_length=512,
+        window_stride=None,
+        max_context_subwords=None,
     ):
         types = json.load(
             open(types_path), object_pairs_hook=OrderedDict
         )  # entity + relation types
+        self._types_path = types_path
 
         self._entity_types = OrderedDict()
         self._idx2entity_type = OrderedDict()
@@ -78,6 +143,23 @@ class BaseInputReader(ABC):
         self._logger = logger
         self._random_mask_word = random_mask_word
         self._repeat_gt_entities = repeat_gt_entities
+        self._context_window = context_window
+        self._dataset_cache_dir = dataset_cache_dir
+        self._tokenizer_identity = None
+        # subword ids and character ids of the most recently encoded words
+        self._word_cache = WordCache(word_cache_size)
+        self._char_cache = WordCache(word_cache_size)
+        self._parse_processes = parse_processes
+        # the documents longer than max_length subwords are split into windows if window_stride is set, ignored otherwise
+        self._max_length = max_length
+        self._window_stride = window_stride
+        # the number of subwords of the context kept around every document, all of them if None
+        self._max_context_subwords = max_context_subwords
+        self._sequence_lengths = SequenceLengths()
+
+        special_tokens_map = tokenizer.special_tokens_map
+        self._cls_token_id = tokenizer.convert_tokens_to_ids(special_tokens_map["cls_token"])
+        self._sep_token_id = tokenizer.convert_tokens_to_ids(special_tokens_map["sep_token"])
 
         self._vocabulary_size = tokenizer.vocab_size
         self._context_size = -1
@@ -103,7 +185,8 @@ class BaseInputReader(ABC):
         for dataset in datasets:
             if isinstance(dataset, Dataset):
                 for doc in dataset.documents:
-                    sizes.append(len(doc.encoding))
+                    # the windows of a long document are at most max_length subwords long
+                    sizes.append(len(doc.encoding) if doc.windows is None else self._max_length)
 
         context_size = max(sizes)
         return context_size
@@ -140,6 +223,21 @@ class BaseInputReader(ABC):
     def context_size(self):
         return self._context_size
 
+    @property
+    def context_window(self):
+        return self._context_window
+
+    @property
+    def word_cache(self):
+        return self._word_cache
+
+    @property
+    def char_cache(self):
+        return self._char_cache
+
+    def _word_caches(self):
+        return [self._word_cache, self._char_cache]
+
     def __str__(self):
         string = ""
         for dataset in self._datasets.values():
@@ -163,30 +261,44 @@ class JsonInputReader(BaseInputReader):
         use_glove=False,
         use_pos=False,
         repeat_gt_entities=None,
+        context_window=None,
+        dataset_cache_dir=None,
+        word_cache_size=65536,
+        parse_processes=0,
+        char_vocab=None,
+        max_length=512,
+        window_stride=None,
+        max_context_subwords=None,
     ):
         super().__init__(
-            types_path, tokenizer, logger, random_mask_word, repeat_gt_entities
+            types_path,
+            tokenizer,
+            logger,
+            random_mask_word,
+            repeat_gt_entities,
+            context_window,
+            dataset_cache_dir,
+            word_cache_size,
+            parse_processes,
+            max_length,
+            window_stride,
+            max_context_subwords,
         )
         if use_glove:
             if "glove" in wordvec_filename:
                 vec_size = wordvec_filename.split(".")[-2]  # str: 300d
             else:
                 vec_size = "bio"
-            if os.path.exists(
-                os.path.dirname(types_path) + f"/vocab_{vec_size}.json"
-            ) and os.path.exists(
-                os.path.dirname(types_path) + f"/vocab_embed_{vec_size}.npy"
-            ):
+            self._vocab_path = os.path.dirname(types_path) + f"/vocab_{vec_size}.json"
+            self._vocab_embed_path = os.path.dirname(types_path) + f"/vocab_embed_{vec_size}.npy"
+            if os.path.exists(self._vocab_path) and os.path.exists(self._vocab_embed_path):
                 self._log(
                     f"Reused vocab and word embedding from {os.path.dirname(types_path)}"
                 )
                 self.build_vocab = False
-                self.word2inx = json.load(
-                    open(os.path.dirname(types_path) + f"/vocab_{vec_size}.json", "r")
-                )
-                self.embedding_weight = np.load(
-                    os.path.dirname(types_path) + f"/vocab_embed_{vec_size}.npy"
-                )
+                self.word2inx = json.load(open(self._vocab_path, "r"))
+                # mapped rather than read, the processes of a run share the pages of the file
+                self.embedding_weight = np.load(self._vocab_embed_path, mmap_mode="r")
             else:
                 self._log("Need some time to construct vocab...")
                 self.word2inx = {"<unk>": 0}
@@ -204,19 +316,111 @@ class JsonInputReader(BaseInputReader):
             for k, v in json.load(open(types_path.replace("types", "pos"))).items():
                 if v > 15:
                     self.POS_MAP.append(k)
+        # id of every POS tag, the first one of a repeated tag
+        self._pos_ids = dict()
+        for i, pos in enumerate(self.POS_MAP):
+            self._pos_ids.setdefault(pos, i)
 
-    def load_wordvec(self, filename):
-        self.embedding_weight = np.random.rand(
-            len(self.word2inx), len(next(iter(self.word2vec.values())))
-        )
-        for word, inx in self.word2inx.items():
-            if word in self.word2vec:
-                self.embedding_weight[inx, :] = self.word2vec[word]
+        self._set_char_vocab(char_vocab if char_vocab is not None else PRINTABLE_CHAR_VOCAB)
+
+    @property
+    def char_vocab(self):
+        return self._char_vocab
 
-    def read(self, dataset_paths):
+    @property
+    def char_vocab_size(self):
+        # <PAD>, the characters, <EOT> and <UNK>
+        return len(self._char_vocab) + 3
+
+    def _set_char_vocab(self, char_vocab):
+        """
+        Sets the characters encoded by the char-LSTM, with ids from 1, <PAD> being 0 and <EOT> and <UNK> coming after
+        them. The id of a character is looked up in a table indexed by code point.
+        :param char_vocab: the characters
+        """
+        self._char_vocab = list(char_vocab)
+        self._eot_char_id = len(self._char_vocab) + 1
+        self._unk_char_id = len(self._char_vocab) + 2
+        # the last entry is the id of the code points above those of the characters
+        self._char_table = np.full(
+            max(map(ord, self._char_vocab), default=0) + 2, self._unk_char_id, dtype=np.int64
+        )
+        for i, c in reversed(list(enumerate(self._char_vocab, 1))):
+            self._char_table[ord(c)] = i
+        self._char_cache.clear()
+
+    def build_char_vocab(self, dataset_path, min_freq=1):
+        """
+        Builds the char vocabulary from the tokens of a dataset, the most frequent characters first.
+        :param dataset_path: the path of a JSON, JSONL or .tokenized dataset, usually the train dataset
+        :param min_freq: the number of occurrences of a character to be in the vocabulary
+        """
+        counter = Counter()
+        for doc in self._iter_documents(dataset_path):
+            for token in doc["tokens"]:
+                counter.update(token)
+        chars = sorted((c for c, count in counter.items() if count >= min_freq), key=lambda c: (-counter[c], c))
+        self._set_char_vocab(chars)
+        self._log(f"Char vocabulary of {len(chars)} characters built from {dataset_path}")
+
+    def _iter_documents(self, dataset_path):
+        if dataset_path.endswith(".jsonl"):
+            with open(dataset_path, "r") as f:
+                for line in f:
+                    yield json.loads(line)
+        elif dataset_path.rstrip("/").endswith(".tokenized"):
+            yield from TokenizedCorpus(dataset_path)
+        else:
+            yield from JsonArray(dataset_path)
+
+    def load_wordvec(self, filename, words):
+        """
+        Streams a word vector file, keeping only the vectors of the given words, so that the whole file is never held in
+        memory. The vector of a word occurring several times in the file is its last one.
+        :param filename: the path of a GloVe text file, or of a word2vec text file starting with a header line
+        :param words: the words whose vectors are kept
+        :return: the indices in words of the words found, in increasing order, and an array of their vectors, None if no
+        word was found
+        """
+        word_indices = {word.encode("utf-8"): i for i, word in enumerate(words)}
+        vectors = dict()
+        with open(filename, "rb") as f:
+            if "glove" not in filename:
+                f.readline()
+            for line in f:
+                word, _, vector = line.strip().partition(b" ")
+                i = word_indices.get(word)
+                if i is not None:
+                    vectors[i] = np.array(vector.split(), dtype=np.float32)
+        indices = sorted(vectors)
+        return indices, np.stack([vectors[i] for i in indices]) if indices else None
+
+    def _save_vocab(self):
+        # written under another name first, the processes of a run may all build the vocab
+        temporary_path = f"{self._vocab_embed_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            np.save(f, self.embedding_weight)
+        os.replace(temporary_path, self._vocab_embed_path)
+        temporary_path = f"{self._vocab_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(self.word2inx, f)
+        os.replace(temporary_path, self._vocab_path)
+
+    def read(self, dataset_paths, resampling_times=None, dedup=None):
+        resampling_times = resampling_times or dict()
+        dedup = dedup or dict()
         for dataset_label, dataset_path in dataset_paths.items():
             if dataset_path.endswith(".jsonl"):
                 assert not self.build_vocab, "forbidden build vocab for large dataset!"
+                if dedup.get(dataset_label) is not None:
+                    raise ValueError(
+                        f"Dataset '{dataset_label}' is streamed from {dataset_path} and cannot be deduplicated"
+                    )
+                if self._window_stride is not None:
+                    # the sample count of a streamed dataset, which sets the number of updates, would not count the windows
+                    raise ValueError(
+                        f"Dataset '{dataset_label}' is streamed from {dataset_path} and cannot be split into windows"
+                    )
                 dataset = DistributedIterableDataset(
                     dataset_label,
                     dataset_path,
@@ -226,7 +430,16 @@ class JsonInputReader(BaseInputReader):
                     random_mask_word=self._random_mask_word,
                     tokenizer=self._tokenizer,
                     repeat_gt_entities=self._repeat_gt_entities,
+                    resampling_times=resampling_times.get(dataset_label),
                 )
+                if (
+                    dataset_label in resampling_times
+                    and len(resampling_times[dataset_label]) != dataset.document_count
+                ):
+                    raise ValueError(
+                        f"{len(resampling_times[dataset_label])} resampling times given for the "
+                        f"{dataset.document_count} documents of dataset '{dataset_label}'"
+                    )
                 self._datasets[dataset_label] = dataset
             else:
                 dataset = Dataset(
@@ -237,45 +450,310 @@ class JsonInputReader(BaseInputReader):
                     tokenizer=self._tokenizer,
                     repeat_gt_entities=self._repeat_gt_entities,
                 )
-                self._parse_dataset(dataset_path, dataset, dataset_label)
+                if dataset_path.rstrip("/").endswith(".tokenized"):
+                    self._read_dataset(
+                        self._parse_tokenized_dataset,
+                        dataset_path,
+                        dataset,
+                        dataset_label,
+                        resampling_times.get(dataset_label),
+                        dedup.get(dataset_label),
+                    )
+                else:
+                    self._read_dataset(
+                        self._parse_dataset,
+                        dataset_path,
+                        dataset,
+                        dataset_label,
+                        resampling_times.get(dataset_label),
+                        dedup.get(dataset_label),
+                    )
                 self._datasets[dataset_label] = dataset
 
         if self.build_vocab:
-            dataset_dir = os.path.dirname(next(iter(dataset_paths.values())))
-            json.dump(
-                self.word2inx, open(dataset_dir + f"/vocab_{self.vec_size}.json", "w")
-            )
-            self.load_wordvec(self.wordvec_filename)
-            np.save(
-                dataset_dir + f"/vocab_embed_{self.vec_size}.npy", self.embedding_weight
-            )
-            self._log(f"Vocab and word embeddings cached in {dataset_dir}")
+            self._save_vocab()
+            self._log(f"Vocab and word embeddings cached in {os.path.dirname(self._vocab_path)}")
 
         self._context_size = self._calc_context_size(self._datasets.values())
 
-    def _parse_dataset(self, dataset_path, dataset, dataset_label):
-        documents = json.load(open(dataset_path))
+    def _read_dataset(
+        self, parse, dataset_path, dataset, dataset_label, resampling_times=None, dedup=None
+    ):
+        """
+        Parses a dataset with parse, or loads it from the dataset cache if it was already parsed from the same content,
+        with the same tokenizer, types, vocabulary and options. The parsed dataset is then cached. A dataset from which
+        the vocabulary is built is not cached.
+        """
+        if self._dataset_cache_dir is None or self.build_vocab:
+            parse(dataset_path, dataset, dataset_label, resampling_times, dedup)
+            return
+
+        if self._tokenizer_identity is None:
+            self._tokenizer_identity = tokenizer_identity(self._tokenizer)
+        key = cache_key(
+            type(self).__name__,
+            path_digest(dataset_path),
+            path_digest(self._types_path),
+            self._tokenizer_identity,
+            self._context_window,
+            dedup,
+            resampling_times,
+            self.word2inx,
+            self.POS_MAP,
+            self._char_vocab,
+            self._max_length,
+            self._window_stride,
+            self._max_context_subwords,
+        )
+        entry_path = os.path.join(
+            self._dataset_cache_dir, f"{os.path.basename(dataset_path.rstrip('/'))}-{key}.pkl"
+        )
+
+        state = load_entry(entry_path)
+        if state is not None:
+            dataset.set_parse_state(state)
+            self._log(f"Dataset '{dataset_label}' loaded from {entry_path}")
+            return
+        parse(dataset_path, dataset, dataset_label, resampling_times, dedup)
+        save_entry(entry_path, dataset.get_parse_state())
+
+    def _parse_dataset(self, dataset_path, dataset, dataset_label, resampling_times=None, dedup=None):
+        # the documents are decoded one at a time, the raw JSON of the whole file is never held in memory
+        documents = JsonArray(dataset_path)
+        self._parse_documents(documents, dataset, dataset_label, resampling_times, dedup)
+
+    def _parse_tokenized_dataset(
+        self, dataset_path, dataset, dataset_label, resampling_times=None, dedup=None
+    ):
+        # the documents come with the subwords of their words, the tokenizer is not run
+        documents = TokenizedCorpus(dataset_path)
+        documents.check_tokenizer(self._tokenizer)
+        self._parse_documents(documents, dataset, dataset_label, resampling_times, dedup)
+
+    def _parse_documents(self, documents, dataset, dataset_label, resampling_times=None, dedup=None):
         if dataset_label == "train" and self.build_vocab:
+            # a first pass over the documents, which are read again to be parsed
             self._build_vocab(documents)
-        for document in tqdm(documents, desc="Parse dataset '%s'" % dataset.label):
-            self._parse_document(document, dataset)
+        # the documents may be streamed, their number is only known once they were all read
+        document_count = 0
+        documents = tqdm(documents, desc="Parse dataset '%s'" % dataset.label)
+        if self._context_window is not None:
+            documents = self._iter_with_context(documents)
+        # resampling times of the documents to parse, a duplicate being sampled with its first copy instead of being
+        # parsed again
+        parsed_resampling_times = []
+        first_copies = dict()
+
+        def iter_unique(documents):
+            nonlocal document_count
+            for document in documents:
+                if resampling_times is not None and document_count >= len(resampling_times):
+                    raise ValueError(
+                        f"{len(resampling_times)} resampling times given for more documents in dataset '{dataset_label}'"
+                    )
+                times = resampling_times[document_count] if resampling_times is not None else 1
+                document_count += 1
+                if dedup is not None:
+                    key = self._document_key(document, dedup)
+                    if key in first_copies:
+                        parsed_resampling_times[first_copies[key]] += times
+                        continue
+                    first_copies[key] = len(parsed_resampling_times)
+                parsed_resampling_times.append(times)
+                yield document
+
+        if self._parse_processes > 1:
+            kept = self._parse_in_processes(iter_unique(documents), dataset)
+        else:
+            kept = [
+                self._parse_document(document, dataset, subwords) is not None
+                for document, subwords in self._iter_with_subwords(iter_unique(documents))
+            ]
+        if resampling_times is not None and len(resampling_times) != document_count:
+            raise ValueError(
+                f"{len(resampling_times)} resampling times given for the {document_count} documents of dataset '{dataset_label}'"
+            )
+        if resampling_times is not None or dedup is not None:
+            dataset.resampling_times = list(itertools.compress(parsed_resampling_times, kept))
+        if dedup is not None:
+            self._log(
+                f"Dataset '{dataset_label}': {len(first_copies)} unique documents out of {document_count}"
+            )
+        self._log(f"Word cache after dataset '{dataset_label}': {self._word_cache}")
+        self._log(f"Char cache after dataset '{dataset_label}': {self._char_cache}")
+        if self._max_context_subwords is not None:
+            self._log(f"Sequence lengths after dataset '{dataset_label}': {self._sequence_lengths}")
+        self._log(f"Peak RSS after dataset '{dataset_label}': {_peak_rss_mb()} MB")
+
+    def _parse_in_processes(self, documents, dataset, chunk_size=1024):
+        """
+        Parses the documents with parse_processes processes, chunk_size documents at a time. The parsed documents are
+        added to the dataset in order and renumbered, so that their ids and those of their tokens, entities and
+        relations are the ones of a single-process parse.
+        :param documents: the documents to parse, in order
+        :param dataset: the dataset to which the documents are added
+        :param chunk_size: the number of documents sent to a process at a time
+        :return: for every document, whether it was kept
+        """
+        reader = copy.copy(self)
+        reader._datasets = dict()
+        # at most two chunks per process are sent ahead, rather than all the documents at once
+        pending_chunks = threading.Semaphore(2 * self._parse_processes)
+        stopped = threading.Event()
+
+        def iter_chunks():
+            for chunk in iter(lambda: list(itertools.islice(documents, chunk_size)), []):
+                pending_chunks.acquire()
+                if stopped.is_set():
+                    return
+                yield chunk
+
+        kept = []
+        with Pool(
+            self._parse_processes, initializer=_init_parse_process, initargs=(reader, dataset)
+        ) as pool:
+            try:
+                for chunk_kept, store, cache_counts, sequence_lengths in pool.imap(_parse_chunk, iter_chunks()):
+                    pending_chunks.release()
+                    dataset.add_store(store)
+                    kept += chunk_kept
+                    for cache, (hits, misses) in zip(self._word_caches(), cache_counts):
+                        cache.hits += hits
+                        cache.misses += misses
+                    self._sequence_lengths.update(sequence_lengths)
+            finally:
+                # the chunks are no longer sent if parsing failed, so that the pool can be terminated
+                stopped.set()
+                pending_chunks.release()
+        return kept
+
+    def _iter_with_subwords(self, documents, batch_size=256):
+        """
+        Encodes the documents which come without their "subwords", the distinct words of batch_size documents being
+        encoded in a single call to the tokenizer.
+        :param documents: the documents of the manifest, in order
+        :param batch_size: the number of documents encoded together
+        :return: a generator over the documents with their subwords, as in "subwords"
+        """
+        segments = ("ltokens", "tokens", "rtokens")
+        documents = iter(documents)
+        for batch in iter(lambda: list(itertools.islice(documents, batch_size)), []):
+            words = list(
+                dict.fromkeys(
+                    word
+                    for doc in batch
+                    if "subwords" not in doc
+                    for segment in segments
+                    for word in doc.get(segment) or []
+                )
+            )
+            encodings = dict(zip(words, self._encode_words(words)))
+            for doc in batch:
+                subwords = doc.get("subwords")
+                if subwords is None:
+                    subwords = tuple(
+                        [encodings[word] for word in doc.get(segment) or []] for segment in segments
+                    )
+                yield doc, subwords
+
+    def _document_key(self, doc, dedup):
+        """
+        Identifies the duplicates of a document. With dedup "exact", they have the same tokens, part-of-speech tags,
+        context and entities. With "normalized", they have the same entities and the same tokens once NFKC normalized,
+        lowercased and without Arabic diacritics and tatweel, whatever their context.
+        """
+        entities = [(entity["start"], entity["end"], entity["type"]) for entity in doc["entities"]]
+        if dedup == "exact":
+            key = [doc["tokens"], doc.get("pos"), doc.get("ltokens"), doc.get("rtokens"), entities]
+        elif dedup == "normalized":
+            key = [
+                [
+                    ARABIC_DIACRITICS.sub("", unicodedata.normalize("NFKC", token)).lower()
+                    for token in doc["tokens"]
+                ],
+                entities,
+            ]
+        else:
+            raise ValueError(f"Unknown deduplication '{dedup}'")
+        return hashlib.blake2b(json.dumps(key).encode(), digest_size=16).digest()
+
+    def _iter_with_context(self, documents):
+        """
+        Sets the left and right context of every document to the tokens of the context_window sentences before and
+        after it in the same document ("org_id"), in place of the ltokens and rtokens of the manifest. Each sentence
+        can thus be stored once in the manifest. The sentences of a document must be consecutive and sorted by
+        "position", if given.
+        :param documents: the documents of the manifest, in order
+        :return: a generator over the documents with their context
+        """
+        window = self._context_window
+        previous_documents = deque(maxlen=window)
+        next_documents = deque()
+
+        def with_context(doc):
+            left = list(
+                itertools.takewhile(
+                    lambda neighbour: neighbour["org_id"] == doc["org_id"],
+                    reversed(previous_documents),
+                )
+            )[::-1]
+            right = list(
+                itertools.takewhile(
+                    lambda neighbour: neighbour["org_id"] == doc["org_id"],
+                    itertools.islice(next_documents, window),
+                )
+            )
+            doc["ltokens"] = [token for neighbour in left for token in neighbour["tokens"]]
+            doc["rtokens"] = [token for neighbour in right for token in neighbour["tokens"]]
+            if "subwords" in doc:
+                doc["subwords"] = (
+                    [encoding for neighbour in left for encoding in neighbour["subwords"][1]],
+                    doc["subwords"][1],
+                    [encoding for neighbour in right for encoding in neighbour["subwords"][1]],
+                )
+            return doc
+
+        last_doc = None
+        for doc in documents:
+            if (
+                last_doc is not None
+                and doc["org_id"] == last_doc["org_id"]
+                and doc.get("position", 1) <= last_doc.get("position", 0)
+            ):
+                raise ValueError(
+                    f"The sentences of document {doc['org_id']} are not sorted by position"
+                )
+            last_doc = doc
+            next_documents.append(doc)
+            if len(next_documents) > window:
+                current_doc = next_documents.popleft()
+                yield with_context(current_doc)
+                previous_documents.append(current_doc)
+
+        while next_documents:
+            current_doc = next_documents.popleft()
+            yield with_context(current_doc)
+            previous_documents.append(current_doc)
 
     def _build_vocab(self, documents, min_freq=1):
-        self.word2vec = {}
-        with open(self.wordvec_filename, "r") as f:
-            if "glove" not in self.wordvec_filename:
-                f.readline()
-            for line in f:
-                fields = line.strip().split(" ")
-                self.word2vec[fields[0]] = list(float(x) for x in fields[1:])
+        """
+        Builds the vocabulary of the lowercased words of the documents which have a vector, in their order of first
+        occurrence, and its embedding: a random vector for <unk>, then the vectors of the words.
+        """
         counter = Counter()
         for doc in documents:
             counter.update(list(map(lambda x: x.lower(), doc["tokens"])))
-        for k, v in counter.items():
-            if v >= min_freq and k in self.word2vec:
-                self.word2inx[k] = len(self.word2inx)
+        words = [k for k, v in counter.items() if v >= min_freq]
+        indices, vectors = self.load_wordvec(self.wordvec_filename, words)
+        if vectors is None:
+            raise ValueError(f"No word of the train dataset has a vector in {self.wordvec_filename}")
+        for i in indices:
+            self.word2inx[words[i]] = len(self.word2inx)
+        self.embedding_weight = np.concatenate(
+            [np.random.rand(1, vectors.shape[1]).astype(np.float32), vectors]
+        )
 
-    def _parse_document(self, doc, dataset) -> Document:
+    def _parse_document(self, doc, dataset, subwords=None) -> Document:
         jtokens = doc["tokens"]
         jrelations = doc["relations"]
         jentities = doc["entities"]
@@ -290,14 +768,26 @@ class JsonInputReader(BaseInputReader):
 
         # parse tokens
         doc_tokens, doc_encoding, char_encoding, seg_encoding = self._parse_tokens(
-            jtokens, ltokens, rtokens, jpos, dataset
+            jtokens,
+            ltokens,
+            rtokens,
+            jpos,
+            dataset,
+            subwords if subwords is not None else doc.get("subwords"),
         )
 
-        if len(doc_encoding) > 512:
-            self._log(
-                f"Document {doc['org_id']} len(doc_encoding) = {len(doc_encoding) } > 512, Ignored!"
-            )
-            return None
+        windows = None
+        if len(doc_encoding) > self._max_length:
+            if self._window_stride is not None:
+                # [CLS] and [SEP] surround the subwords of the tokens of every window
+                windows = self._split_windows(
+                    [t.span_end - t.span_start for t in doc_tokens], self._max_length - 2
+                )
+            if windows is None:
+                self._log(
+                    f"Document {doc['org_id']} len(doc_encoding) = {len(doc_encoding) } > {self._max_length}, Ignored!"
+                )
+                return None
 
         # parse entity mentions
         entities = self._parse_entities(jentities, doc_tokens, dataset)
@@ -307,61 +797,104 @@ class JsonInputReader(BaseInputReader):
 
         # create document
         document = dataset.create_document(
-            doc_tokens, entities, relations, doc_encoding, char_encoding, seg_encoding
+            doc_tokens, entities, relations, doc_encoding, char_encoding, seg_encoding, windows
         )
 
         return document
 
-    def _parse_tokens(self, jtokens, ltokens, rtokens, jpos, dataset):
+    def _split_windows(self, token_lengths, max_subwords):
+        """
+        Splits the tokens of a document which is too long into windows of at most max_subwords subwords. Every window
+        starts window_stride tokens after the previous one, or where the previous one ends if it holds fewer tokens.
+        :param token_lengths: the number of subwords of every token
+        :param max_subwords: the number of subwords of a window, without its special tokens
+        :return: the start and end (exclusive) token of every window, None if a token does not fit in a window
+        """
+        windows = []
+        start = 0
+        while start < len(token_lengths):
+            end, length = start, 0
+            while end < len(token_lengths) and length + token_lengths[end] <= max_subwords:
+                length += token_lengths[end]
+                end += 1
+            if end == start:
+                return None
+            windows.append((start, end))
+            if end == len(token_lengths):
+                break
+            start = min(start + self._window_stride, end)
+        return windows or None
+
+    def _encode_words(self, words):
+        if not words:
+            return []
+        return self._word_cache.encode(words, self._tokenize_words)
+
+    def _tokenize_words(self, words):
+        # one call for all the words, every word being encoded on its own as by tokenizer.encode
+        return self._tokenizer(words, add_special_tokens=False)["input_ids"]
+
+    def _encode_chars(self, words):
+        # the character ids of every word, followed by <EOT>, looked up at once for all the words
+        lengths = [len(word) for word in words]
+        code_points = np.frombuffer("".join(words).encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+        char_ids = self._char_table[np.minimum(code_points, len(self._char_table) - 1)]
+        char_ids = np.insert(char_ids, np.cumsum(lengths, dtype=np.int64), self._eot_char_id).tolist()
+        encodings = []
+        start = 0
+        for length in lengths:
+            encodings.append(char_ids[start : start + length + 1])
+            start += length + 1
+        return encodings
+
+    def _parse_tokens(self, jtokens, ltokens, rtokens, jpos, dataset, subwords=None):
         doc_tokens = []
-        char_vocab = ["<PAD>"] + list(string.printable) + ["<EOT>", "<UNK>"]
         # full document encoding including special tokens ([CLS] and [SEP]) and byte-pair encodings of original tokens
 
-        special_tokens_map = self._tokenizer.special_tokens_map
-        doc_encoding = [
-            self._tokenizer.convert_tokens_to_ids(special_tokens_map["cls_token"])
-        ]
+        doc_encoding = [self._cls_token_id]
         seg_encoding = [0]
         char_encoding = []
 
-        poss = [
-            self.POS_MAP.index(pos)
-            if pos in self.POS_MAP
-            else self.POS_MAP.index("<UNK>")
-            for pos in jpos
-        ]
+        unk_pos = self._pos_ids["<UNK>"]
+        poss = [self._pos_ids.get(pos, unk_pos) for pos in jpos]
 
-        # parse tokens
-        for token_phrase in ltokens:
-            token_encoding = self._tokenizer.encode(
-                token_phrase, add_special_tokens=False
+        # subword ids of the left context words, the tokens and the right context words
+        if subwords is None:
+            subwords = (
+                self._encode_words(ltokens),
+                self._encode_words(jtokens),
+                self._encode_words(rtokens),
+            )
+        ltokens_encoding, tokens_encoding, rtokens_encoding = subwords
+        # [CLS], the context words and the tokens, and [SEP]
+        full_length = 2 + sum(map(len, itertools.chain(ltokens_encoding, tokens_encoding, rtokens_encoding)))
+        context_budget = self._context_budget(tokens_encoding, full_length)
+        if context_budget is not None:
+            ltokens_encoding, rtokens_encoding = self._truncate_context(
+                ltokens_encoding, rtokens_encoding, context_budget
             )
+        chars_encoding = self._char_cache.encode(jtokens, self._encode_chars)
+
+        # parse tokens
+        for token_encoding in ltokens_encoding:
             doc_encoding += token_encoding
             seg_encoding += [0] * len(token_encoding)
 
-        for i, token_phrase in enumerate(jtokens):
+        for i, (token_phrase, token_encoding) in enumerate(zip(jtokens, tokens_encoding)):
 
             # if random.random() < 0.12:
             #     token_phrase = "[MASK]"
             # if self.build_vocab and token_phrase.lower() not in self.word2inx:
             #     self.word2inx[token_phrase.lower()] = len(self.word2inx)
-            token_encoding = self._tokenizer.encode(
-                token_phrase, add_special_tokens=False
-            )
-            # token_encoding_char = list(char_vocab.index(c) for c in token_phrase)
-            token_encoding_char = []
-            for c in token_phrase:
-                if c in char_vocab:
-                    token_encoding_char.append(char_vocab.index(c))
-                else:
-                    token_encoding_char.append(char_vocab.index("<UNK>"))
+            # character ids followed by <EOT>, which char_end leaves out
+            token_encoding_char = chars_encoding[i]
             span_start, span_end = (
                 len(doc_encoding),
                 len(doc_encoding) + len(token_encoding),
             )
             char_start, char_end = (
                 len(char_encoding),
-                len(char_encoding) + len(token_encoding_char),
+                len(char_encoding) + len(token_encoding_char) - 1,
             )
             # try:
             if token_phrase.lower() in self.word2inx:
@@ -381,25 +914,61 @@ class JsonInputReader(BaseInputReader):
             doc_tokens.append(token)
             doc_encoding += token_encoding
             seg_encoding += [1] * len(token_encoding)
-            token_encoding_char += [char_vocab.index("<EOT>")]
             char_encoding.append(token_encoding_char)
             # except:
             #     print(jtokens)
 
-        for token_phrase in rtokens:
-            token_encoding = self._tokenizer.encode(
-                token_phrase, add_special_tokens=False
-            )
+        for token_encoding in rtokens_encoding:
             doc_encoding += token_encoding
             seg_encoding += [0] * len(token_encoding)
 
-        doc_encoding += [
-            self._tokenizer.convert_tokens_to_ids(special_tokens_map["sep_token"])
-        ]
+        doc_encoding += [self._sep_token_id]
         seg_encoding += [0]
 
+        # the documents which are split into windows or ignored are not sampled with their context
+        if self._max_context_subwords is not None and len(doc_encoding) <= self._max_length:
+            self._sequence_lengths.add(full_length, len(doc_encoding))
         return doc_tokens, doc_encoding, char_encoding, seg_encoding
 
+    def _context_budget(self, tokens_encoding, full_length):
+        """
+        :param tokens_encoding: the subword ids of every token of the document
+        :param full_length: the number of subwords of the document with its full context and special tokens
+        :return: the number of subwords of context to keep, None to keep the whole context
+        """
+        budget = self._max_context_subwords
+        if self._window_stride is not None and full_length > self._max_length:
+            # only the documents whose tokens do not fit are split into windows, the others keep the context that fits
+            # along with their tokens, [CLS] and [SEP]
+            free = self._max_length - 2 - sum(map(len, tokens_encoding))
+            if free >= 0:
+                budget = free if budget is None else min(budget, free)
+        return budget
+
+    def _truncate_context(self, ltokens_encoding, rtokens_encoding, budget):
+        """
+        Keeps the context words nearest to the document within budget subwords, taking the next word on the left and
+        then the next word on the right, until the next word of either side does not fit.
+        :param ltokens_encoding: the subword ids of every word of the left context
+        :param rtokens_encoding: the subword ids of every word of the right context
+        :param budget: the number of subwords of context to keep
+        :return: the subword ids of the kept words of the left and right context
+        """
+        left, right = len(ltokens_encoding), 0
+        left_open, right_open = True, True
+        while left_open or right_open:
+            if left_open:
+                left_open = left > 0 and len(ltokens_encoding[left - 1]) <= budget
+                if left_open:
+                    left -= 1
+                    budget -= len(ltokens_encoding[left])
+            if right_open:
+                right_open = right < len(rtokens_encoding) and len(rtokens_encoding[right]) <= budget
+                if right_open:
+                    budget -= len(rtokens_encoding[right])
+                    right += 1
+        return ltokens_encoding[left:], rtokens_encoding[:right]
+
     def _parse_entities(self, jentities, doc_tokens, dataset) -> List[Entity]:
         entities = []
 
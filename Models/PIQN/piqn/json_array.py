@@ -0,0 +1,90 @@
+import json
+import re
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class JsonArray:
+    """
+    The items of a file holding a JSON array of objects or arrays, decoded one at a time while the file is read by
+    blocks. Only the current block and the item being decoded are held in memory, rather than the whole file and all of
+    its items. The file is read again on every iteration.
+    """
+
+    def __init__(self, path, block_size = 1 << 20):
+        """
+        :param path: the path of the file
+        :param block_size: the number of characters read at a time
+        """
+        self.path = path
+        self.block_size = block_size
+
+    def __iter__(self):
+        decoder = json.JSONDecoder()
+        with open(self.path, "r") as f:
+            reader = _BlockReader(f, self.block_size)
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.position += 1
+            else:
+                while True:
+                    yield reader.decode(decoder)
+                    if reader.expect(",]") == "]":
+                        break
+            if reader.peek() is not None:
+                raise json.JSONDecodeError("Extra data", reader.text, reader.position)
+
+
+class _BlockReader:
+    def __init__(self, f, block_size):
+        self._f = f
+        self._block_size = block_size
+        self.text = ""
+        self.position = 0
+
+    def _read_block(self):
+        # the characters before position were consumed and are dropped
+        block = self._f.read(self._block_size)
+        if not block:
+            return False
+        self.text = self.text[self.position:] + block
+        self.position = 0
+        return True
+
+    def peek(self):
+        """
+        :return: the next character which is not whitespace, None at the end of the file
+        """
+        while True:
+            self.position = WHITESPACE.match(self.text, self.position).end()
+            if self.position < len(self.text):
+                return self.text[self.position]
+            if not self._read_block():
+                return None
+
+    def expect(self, chars):
+        """
+        Consumes the next character which is not whitespace, one of chars.
+        :return: the character
+        """
+        char = self.peek()
+        if char is None or char not in chars:
+            raise json.JSONDecodeError(f"Expecting one of {chars!r}", self.text, self.position)
+        self.position += 1
+        return char
+
+    def decode(self, decoder):
+        """
+        Decodes the next object or array, reading blocks until it is complete.
+        :return: the decoded item
+        """
+        if self.peek() not in ("{", "["):
+            raise json.JSONDecodeError("Expecting an object or an array", self.text, self.position)
+        while True:
+            try:
+                item, self.position = decoder.raw_decode(self.text, self.position)
+                return item
+            except json.JSONDecodeError:
+                # the item may only be cut by the end of the block
+                if not self._read_block():
+                    raise
@@ -599,7 +599,7 @@ class PIQN(PreTrainedModel):
     #         module.weight.data.fill_(1.0)
 
 
-    def __init__(self, model_type, config: EntityAwareBertConfig, embed: torch.tensor, entity_type_count: int, prop_drop: float, freeze_transformer: bool, pos_size: int = 25, char_lstm_layers:int = 1, char_lstm_drop:int = 0.2, char_size:int = 25,  use_glove: bool = True, use_pos:bool = True, use_char_lstm:bool = True, lstm_layers = 3, pool_type:str = "max", word_mask_tok2ent = None, word_mask_ent2tok = None, word_mask_ent2ent = None, word_mask_entself = None, share_query_pos = False, use_token_level_encoder = True, num_token_entity_encoderlayer = 1, use_entity_attention = False, use_masked_lm = False, use_aux_loss = False, use_lstm = False, inlcude_subword_aux_loss= False, last_layer_for_loss = 3, split_epoch = 0):
+    def __init__(self, model_type, config: EntityAwareBertConfig, embed: torch.tensor, entity_type_count: int, prop_drop: float, freeze_transformer: bool, pos_size: int = 25, char_lstm_layers:int = 1, char_lstm_drop:int = 0.2, char_size:int = 25, char_vocab_size:int = 103, use_glove: bool = True, use_pos:bool = True, use_char_lstm:bool = True, lstm_layers = 3, pool_type:str = "max", word_mask_tok2ent = None, word_mask_ent2tok = None, word_mask_ent2ent = None, word_mask_entself = None, share_query_pos = False, use_token_level_encoder = True, num_token_entity_encoderlayer = 1, use_entity_attention = False, use_masked_lm = False, use_aux_loss = False, use_lstm = False, inlcude_subword_aux_loss= False, last_layer_for_loss = 3, split_epoch = 0):
         super().__init__(config)
 
         self.model_type = model_type
@@ -660,7 +660,7 @@ class PIQN(PreTrainedModel):
         if use_char_lstm:
             lstm_input_size += self.char_size * 2
             self.char_lstm = nn.LSTM(input_size = char_size, hidden_size = char_size, num_layers = char_lstm_layers,  bidirectional = True, dropout = char_lstm_drop, batch_first = True)
-            self.char_embedding = nn.Embedding(103, char_size)
+            self.char_embedding = nn.Embedding(char_vocab_size, char_size)
 
         if not self.use_lstm and (use_glove or use_pos or use_char_lstm):
             self.reduce_dimension = nn.Linear(lstm_input_size, config.hidden_size)
@@ -19,7 +19,7 @@ from piqn import sampling
 from piqn import util
 from piqn.entities import Dataset, DistributedIterableDataset
 from piqn.evaluator import Evaluator
-from piqn.input_reader import JsonInputReader, BaseInputReader
+from piqn.input_reader import JsonInputReader, BaseInputReader, CHAR_VOCAB_FILE_NAME
 from piqn.loss import PIQNLoss, Loss
 from tqdm import tqdm
 from piqn.trainer import BaseTrainer
@@ -65,6 +65,13 @@ class PIQNTrainer(BaseTrainer):
 
         self._logger.info(json.dumps(vars(args), indent=4, sort_keys=True))
 
+    def _load_char_vocab(self):
+        # the char vocabulary of the checkpoint, None if it has none
+        char_vocab_path = os.path.join(self.args.model_path, CHAR_VOCAB_FILE_NAME)
+        if os.path.exists(char_vocab_path):
+            return json.load(open(char_vocab_path, encoding='utf-8'))
+        return None
+
     def load_model(self, input_reader, is_eval = False):
         args = self.args
         # create model
@@ -76,7 +83,8 @@ class PIQNTrainer(BaseTrainer):
 
         embed = None
         if args.use_glove:
-            embed = torch.from_numpy(input_reader.embedding_weight).float()
+            # a copy, the weights of the reader may be mapped from the vocab cache
+            embed = torch.tensor(input_reader.embedding_weight, dtype=torch.float)
         model = model_class.from_pretrained(args.model_path,
                                             # proxies = {'http': '10.15.82.42:7890'},
                                             # local_files_only = True,
@@ -90,6 +98,7 @@ class PIQNTrainer(BaseTrainer):
                                             char_lstm_layers = args.char_lstm_layers, 
                                             char_lstm_drop = args.char_lstm_drop, 
                                             char_size = args.char_size, 
+                                            char_vocab_size = input_reader.char_vocab_size,
                                             use_glove = args.use_glove, 
                                             use_pos = args.use_pos, 
                                             use_char_lstm = args.use_char_lstm,
@@ -144,8 +153,16 @@ class PIQNTrainer(BaseTrainer):
             self._init_eval_logging(valid_label)
 
         # read datasets
-        input_reader = input_reader_cls(types_path, self._tokenizer, self._logger, wordvec_filename = args.wordvec_path, random_mask_word = args.use_masked_lm, use_glove = args.use_glove, use_pos = args.use_pos, repeat_gt_entities = args.repeat_gt_entities)
-        input_reader.read({train_label: train_path, valid_label: valid_path})
+        input_reader = input_reader_cls(types_path, self._tokenizer, self._logger, wordvec_filename = args.wordvec_path, random_mask_word = args.use_masked_lm, use_glove = args.use_glove, use_pos = args.use_pos, repeat_gt_entities = args.repeat_gt_entities, context_window = args.context_window, dataset_cache_dir = args.dataset_cache_dir, word_cache_size = args.word_cache_size, parse_processes = args.parse_processes, char_vocab = self._load_char_vocab(), max_length = args.max_length, window_stride = args.window_stride, max_context_subwords = args.max_context_subwords)
+        resampling_times = dict()
+        if args.train_resampling_times is not None:
+            resampling_times[train_label] = json.load(open(args.train_resampling_times))
+        dedup = dict()
+        if args.train_dedup is not None:
+            dedup[train_label] = args.train_dedup
+        if args.char_vocab == 'train' and self._load_char_vocab() is None:
+            input_reader.build_char_vocab(train_path, args.char_min_freq)
+        input_reader.read({train_label: train_path, valid_label: valid_path}, resampling_times, dedup)
 
         if self.local_rank < 1:
             self._log_datasets(input_reader)
@@ -155,7 +172,7 @@ class PIQNTrainer(BaseTrainer):
             world_size = dist.get_world_size()
 
         train_dataset = input_reader.get_dataset(train_label)
-        train_sample_count = train_dataset.document_count
+        train_sample_count = train_dataset.sample_count
         updates_epoch = train_sample_count // (args.train_batch_size * world_size)
         updates_total_stage_one = updates_epoch * args.split_epoch
         updates_total_stage_two = updates_epoch * (args.epochs - args.split_epoch)
@@ -209,12 +226,12 @@ class PIQNTrainer(BaseTrainer):
                     # if "pretrain" in args.label:
                     self._save_model(self._save_path, model, self._tokenizer, epoch * updates_epoch,
                         optimizer=optimizer if args.save_optimizer else None, extra=extra,
-                        include_iteration=False, name='best_model')
+                        include_iteration=False, name='best_model', char_vocab=input_reader.char_vocab)
             if self.record:
                 if args.save_path_include_iteration:
                     self._save_model(self._save_path, model, self._tokenizer, epoch,
                             optimizer=optimizer if args.save_optimizer else None, extra=extra,
-                            include_iteration=args.save_path_include_iteration, name='model')
+                            include_iteration=args.save_path_include_iteration, name='model', char_vocab=input_reader.char_vocab)
                 self._logger.info(f"Best F1 score: {best_f1}, achieved at Epoch: {best_epoch}")
 
         # save final model
@@ -223,7 +240,7 @@ class PIQNTrainer(BaseTrainer):
         if self.record:
             self._save_model(self._save_path, model, self._tokenizer, global_iteration,
                             optimizer=optimizer if args.save_optimizer else None, extra=extra,
-                            include_iteration=False, name='final_model')
+                            include_iteration=False, name='final_model', char_vocab=input_reader.char_vocab)
             self._logger.info("Logged in: %s" % self._log_path)
             self._logger.info("Saved in: %s" % self._save_path)
             self._close_summary_writer()
@@ -239,7 +256,7 @@ class PIQNTrainer(BaseTrainer):
         self._init_eval_logging(dataset_label)
 
         # read datasets
-        input_reader = input_reader_cls(types_path, self._tokenizer, self._logger, wordvec_filename = args.wordvec_path, random_mask_word = args.use_masked_lm, use_glove = args.use_glove, use_pos = args.use_pos, repeat_gt_entities = args.repeat_gt_entities)
+        input_reader = input_reader_cls(types_path, self._tokenizer, self._logger, wordvec_filename = args.wordvec_path, random_mask_word = args.use_masked_lm, use_glove = args.use_glove, use_pos = args.use_pos, repeat_gt_entities = args.repeat_gt_entities, context_window = args.context_window, dataset_cache_dir = args.dataset_cache_dir, word_cache_size = args.word_cache_size, parse_processes = args.parse_processes, char_vocab = self._load_char_vocab(), max_length = args.max_length, window_stride = args.window_stride, max_context_subwords = args.max_context_subwords)
         input_reader.read({dataset_label: dataset_path})
         self._log_datasets(input_reader)
 
@@ -273,7 +290,11 @@ class PIQNTrainer(BaseTrainer):
         if isinstance(dataset, Dataset):
             if len(dataset) < 100000:
                 shuffle = True
-            if args.local_rank != -1:
+            if dataset.resampling_times is not None:
+                train_sampler = sampling.ResamplingSampler(dataset.sample_resampling_times, shuffle = shuffle, num_replicas = word_size, rank = args.local_rank, seed = max(args.seed, 0))
+                train_sampler.set_epoch(epoch)
+                shuffle = False
+            elif args.local_rank != -1:
                 train_sampler = torch.utils.data.distributed.DistributedSampler(dataset, num_replicas = word_size,rank = args.local_rank, shuffle = shuffle)
                 shuffle = False
 
@@ -284,7 +305,7 @@ class PIQNTrainer(BaseTrainer):
         model.zero_grad()
 
         iteration = 0
-        total = math.ceil((dataset.document_count // args.train_batch_size) / word_size)
+        total = math.ceil((dataset.sample_count // args.train_batch_size) / word_size)
         for batch in tqdm(data_loader, total=total, desc='Train epoch %s' % epoch):
             model.train()
             batch = util.to_device(batch, self._device)
@@ -333,7 +354,7 @@ class PIQNTrainer(BaseTrainer):
             model.eval()
 
             # iterate batches
-            total = math.ceil(dataset.document_count / (args.eval_batch_size * word_size))
+            total = math.ceil(dataset.sample_count / (args.eval_batch_size * word_size))
             for batch in tqdm(data_loader, total=total, desc='Evaluate epoch %s' % epoch):
                 # move batch to selected device
                 batch = util.to_device(batch, self._device)
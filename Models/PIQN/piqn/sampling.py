@@ -1,7 +1,9 @@
+import math
 import pdb
 import random
 
 import torch
+from torch.utils.data import Sampler
 
 from piqn import util
 
@@ -168,3 +170,44 @@ def collate_fn_padding(batch):
             padded_batch[key] = util.padded_stack([s[key] for s in batch])
 
     return padded_batch
+
+
+class ResamplingSampler(Sampler):
+    def __init__(self, resampling_times, shuffle = True, num_replicas = 1, rank = -1, seed = 0):
+        """
+        Yields the index of every document as many times per epoch as its resampling time, which is the same as
+        training on the file written by the adaptive resampling, without parsing and tokenizing the copies.
+        Like DistributedSampler, the indices are padded to be evenly split between the replicas.
+        :param resampling_times: how many times every document is repeated in an epoch
+        :param shuffle: if True, the repeated indices are shuffled, differently at every epoch
+        :param num_replicas: number of distributed processes
+        :param rank: rank of the current process, -1 when not distributed
+        :param seed: seed of the shuffling, shared by all the replicas
+        """
+        self._indices = torch.repeat_interleave(torch.arange(len(resampling_times)),
+                                                torch.as_tensor(resampling_times, dtype=torch.long))
+        self._shuffle = shuffle
+        self._num_replicas = num_replicas
+        self._rank = max(rank, 0)
+        self._seed = seed
+        self._epoch = 0
+        self._num_samples = math.ceil(len(self._indices) / num_replicas)
+
+    def set_epoch(self, epoch):
+        self._epoch = epoch
+
+    def __iter__(self):
+        indices = self._indices
+        if self._shuffle:
+            generator = torch.Generator()
+            generator.manual_seed(self._seed + self._epoch)
+            indices = indices[torch.randperm(len(indices), generator=generator)]
+
+        total_size = self._num_samples * self._num_replicas
+        if total_size > len(indices):
+            indices = indices.repeat(math.ceil(total_size / len(indices)))[:total_size]
+
+        return iter(indices[self._rank:total_size:self._num_replicas].tolist())
+
+    def __len__(self):
+        return self._num_samples
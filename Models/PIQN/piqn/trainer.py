@@ -1,5 +1,6 @@
 import argparse
 import datetime
+import json
 import logging
 import os
 import sys
@@ -13,6 +14,7 @@ from transformers import PreTrainedModel
 from transformers import PreTrainedTokenizer
 
 from piqn import util
+from piqn.input_reader import CHAR_VOCAB_FILE_NAME
 import torch.utils.tensorboard as tensorboard
 
 SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
@@ -117,7 +119,7 @@ class BaseTrainer:
 
     def _save_model(self, save_path: str, model: PreTrainedModel, tokenizer: PreTrainedTokenizer,
                     iteration: int, optimizer: Optimizer = None, save_as_best: bool = False,
-                    extra: dict = None, include_iteration: int = True, name: str = 'model'):
+                    extra: dict = None, include_iteration: int = True, name: str = 'model', char_vocab: list = None):
         extra_state = dict(iteration=iteration)
 
         if optimizer:
@@ -142,6 +144,9 @@ class BaseTrainer:
 
         # save vocabulary
         tokenizer.save_pretrained(dir_path)
+        if char_vocab is not None:
+            with open(os.path.join(dir_path, CHAR_VOCAB_FILE_NAME), 'w', encoding='utf-8') as f:
+                json.dump(char_vocab, f, ensure_ascii=False)
 
         # save extra
         state_path = os.path.join(dir_path, 'extra.state')